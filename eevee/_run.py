@@ -1,9 +1,15 @@
 import sys
+import time
 from argparse import ArgumentParser
 from textwrap import dedent
 from . import __version__
-from .ui import UI
+from .ui import UI, QueueConfig
 from .chatbot import Chatbot
+from .batch import BatchRunner
+from .chat_archive import ChatArchive
+from .api_server import APIServer
+from .profiling import EventProfiler
+from .document_index import DocumentIndex, default_index_directory
 from .settings import init_settings
 from .framework_models import get_available_frameworks
 from .color_logger import get_logger, change_default_log_level
@@ -34,6 +40,35 @@ def main():
     parser.add_argument('-l', '--log-level', default='INFO', dest='log', help='Set logging level', type=str)
     parser.add_argument('--version', help='Show version', dest='show_version', default=False, action='store_true')
     parser.add_argument('--config-path', help='Show path to config file', dest='config_path', default=False, action='store_true')
+    parser.add_argument('--profile', dest='profile', nargs='?', const='eevee-profile.folded', default=None, type=str,
+                        help='Sample the stacks of the UI events, and write them as folded stacks for flame graphs when stopped (default file: eevee-profile.folded)')
+    parser.add_argument('--generation-concurrency', dest='generation_concurrency', default=None, type=int,
+                        help='Answers generated at once by the UI, overrides generation_concurrency of [queue] in the config')
+    parser.add_argument('--max-queue-size', dest='max_queue_size', default=None, type=int, help='UI events waiting beyond this are refused, 0 means no limit')
+    parser.add_argument('--max-threads', dest='max_threads', default=None, type=int, help="Threads running the UI's handlers")
+    subparsers = parser.add_subparsers(dest='command')
+    
+    serve_parser = subparsers.add_parser('serve', help='Run the chat UI, or an OpenAI-compatible API with --api')
+    serve_parser.add_argument('--api', dest='api', default=False, action='store_true', help='Serve an OpenAI-compatible HTTP API instead of the UI')
+    serve_parser.add_argument('--host', dest='host', default='127.0.0.1', type=str, help='Host to serve the API from')
+
+    subparsers.add_parser('gc', help='Delete stored tool outputs no saved chat refers to (run while Eevee is not running)')
+
+    export_parser = subparsers.add_parser('export', help='Write all saved chats to a compressed archive')
+    export_parser.add_argument('path', help='Path to the archive to write (.jsonl.zst)')
+    import_parser = subparsers.add_parser('import', help='Read saved chats from an archive written by export')
+    import_parser.add_argument('path', help='Path to the archive to read')
+
+    batch_parser = subparsers.add_parser('batch', help='Run a JSONL file of prompts without the UI')
+    batch_parser.add_argument('input', help='Path to a JSONL file of prompts')
+    batch_parser.add_argument('-o', '--output', dest='output', required=True, help='Path to the JSONL results file, resumed if exists')
+    batch_parser.add_argument('-c', '--concurrency', dest='concurrency', default=None, type=int, help='Maximal concurrent requests per framework')
+    batch_parser.add_argument('--provider-batch', dest='provider_batch', default=False, action='store_true', help="Submit prompts through the providers' batch APIs where available")
+    batch_parser.add_argument('--no-wait', dest='wait', default=True, action='store_false', help="Don't wait for provider batches to finish")
+
+    index_parser = subparsers.add_parser('index', help='Index the files of a directory for the search_documents tool, only re-reading changed files')
+    index_parser.add_argument('directory', help='Directory of the documents to index')
+    index_parser.add_argument('--benchmark', dest='benchmark', default=False, action='store_true', help='Report the indexing time and query latencies')
     args = parser.parse_args()
 
     if not _validate_log_level(args.log):
@@ -44,6 +79,57 @@ def main():
         print(f"Eevee Chat version: {__version__}")
     elif args.config_path:
         print(f"Config file path: {config_path}")
+    elif args.command == 'batch':
+        change_default_log_level(args.log.upper())
+        init_settings([config_path])
+        chatbot = Chatbot(get_available_frameworks())
+        try:
+            BatchRunner(chatbot, args.input, args.output, concurrency_per_framework=args.concurrency).run(provider_batch=args.provider_batch, wait=args.wait)
+        finally:
+            chatbot.close()
+    elif args.command == 'index':
+        change_default_log_level(args.log.upper())
+        init_settings([config_path])
+        index = DocumentIndex(default_index_directory())
+        start = time.perf_counter()
+        update = index.update(args.directory)
+        build_seconds = time.perf_counter() - start
+        get_logger().info(f"Indexed {args.directory} in {build_seconds:.2f}s: {update.added} added, {update.updated} updated, "
+                          f"{update.removed} removed and {update.unchanged} unchanged files, {update.chunks} chunks in total, "
+                          f"{index.size_bytes() / 2**20:.1f} MB")
+        if args.benchmark:
+            latencies = index.benchmark()
+            get_logger().info(f"Query latency over {len(index.chunks)} chunks: " + ', '.join(f'{p} {ms:.2f}ms' for p, ms in latencies.items()))
+    elif args.command == 'gc':
+        change_default_log_level(args.log.upper())
+        init_settings([config_path])
+        chatbot = Chatbot(get_available_frameworks())
+        try:
+            chatbot.collect_garbage()
+        finally:
+            chatbot.close()
+    elif args.command in ['export', 'import']:
+        change_default_log_level(args.log.upper())
+        init_settings([config_path])
+        chatbot = Chatbot(get_available_frameworks())
+        try:
+            archive = ChatArchive(chatbot.storage)
+            if args.command == 'export':
+                archive.export_to(args.path)
+            else:
+                archive.import_from(args.path)
+        finally:
+            chatbot.close()
+    elif args.command == 'serve' and args.api:
+        change_default_log_level(args.log.upper())
+        get_logger().info(f"Running version: {__version__}")
+        init_settings([config_path])
+        available_frameworks = get_available_frameworks()
+        chatbot = Chatbot(available_frameworks)
+        try:
+            APIServer(chatbot, available_frameworks, host=args.host, port=args.port).run()
+        finally:
+            chatbot.close()
     else:
         ascii_art()
         change_default_log_level(args.log.upper())
@@ -51,8 +137,16 @@ def main():
         init_settings([config_path])
         available_frameworks = get_available_frameworks()
         chatbot = Chatbot(available_frameworks)
-        with UI(chatbot, available_frameworks, port=args.port):
-            pass
+        profiler = EventProfiler(args.profile) if args.profile else None
+        if profiler is not None:
+            profiler.start()
+        try:
+            queue_config = QueueConfig.from_settings(generation_concurrency=args.generation_concurrency, max_size=args.max_queue_size, max_threads=args.max_threads)
+            with UI(chatbot, available_frameworks, port=args.port, profiler=profiler, queue_config=queue_config):
+                pass
+        finally:
+            if profiler is not None:
+                profiler.stop()
 
 
 if __name__ == '__main__':
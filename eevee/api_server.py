@@ -0,0 +1,224 @@
+import os
+import time
+import json
+import uuid
+import asyncio
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import Set, List, Dict, Any, AsyncGenerator
+from .chatbot import Chatbot
+from .json_schema import compile_schema
+from .messages import Messages, ChatMessagePiece, Usage
+from .cancellation import CancellationToken
+from .settings import Settings
+from .color_logger import get_logger
+from .framework_models import get_model_framework, get_model_name_and_alias
+from ._types import Framework
+
+
+class APIServer:
+    """
+    Exposes the Chatbot through an OpenAI-compatible HTTP API.
+    Tools are only run if the request sets `"eevee_tools": true`.
+    If the EEVEE_API_KEY environment variable is set, requests must supply it as a bearer token.
+    """
+    def __init__(self, chatbot: Chatbot, available_frameworks: Set[Framework], host: str, port: int) -> None:
+        self.chatbot = chatbot
+        self.available_frameworks = available_frameworks
+        self.host: str = host
+        self.port: int = port
+        self.logger = get_logger()
+        self.api_key: str | None = os.environ.get('EEVEE_API_KEY', None)
+        self.executor = ThreadPoolExecutor(max_workers=Settings().api.max_workers, thread_name_prefix='api')
+        self.app = self._build_app()
+
+    @staticmethod
+    def _error(status_code: int, message: str, error_type: str) -> JSONResponse:
+        return JSONResponse(status_code=status_code, content={'error': {'message': message, 'type': error_type}})
+
+    @staticmethod
+    def _usage(usage: Usage) -> Dict[str, Any]:
+        return {
+            'prompt_tokens': usage.prompt_tokens, 
+            'completion_tokens': usage.completion_tokens, 
+            'total_tokens': usage.total_tokens,
+            'prompt_tokens_details': {'cached_tokens': usage.cached_tokens}
+        }
+
+    def _list_models(self) -> List[Dict[str, Any]]:
+        models: List[Dict[str, Any]] = list()
+        for framework in sorted(self.available_frameworks):
+            for model_string in Settings().models[framework]:
+                model, _ = get_model_name_and_alias(model_string)
+                models.append({'id': model, 'object': 'model', 'created': 0, 'owned_by': framework})
+        return models
+
+    @staticmethod
+    def _to_messages(request_messages: List[Dict[str, Any]], model: str) -> Messages:
+        messages = Messages()
+        for message in request_messages:
+            role = message.get('role')
+            content = message.get('content')
+            if isinstance(content, list):
+                content = ''.join(part.get('text', '') for part in content if part.get('type') == 'text')
+            if role in ['system', 'user']:
+                messages.append(role, content)
+            elif role == 'assistant':
+                messages.append(role, content, model=model)
+            else:
+                raise ValueError(f'Unsupported message role: {role}')
+        return messages
+
+    async def _stream(self, messages: Messages, *, model: str, temperature: float, as_json: bool, json_schema: Dict[str, Any] | None, json_retries: int | None, use_tools: bool) -> AsyncGenerator[ChatMessagePiece, None]:
+        # The connectors are synchronous, so they run on a worker thread. The bounded queue blocks that
+        # thread when the client reads slower than the model writes, instead of buffering without limit.
+        # A client disconnecting cancels the generation, closing the provider's stream.
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue[ChatMessagePiece | Exception | None] = asyncio.Queue(maxsize=Settings().api.stream_buffer_size)
+        cancellation_token = CancellationToken()
+
+        def put(item: ChatMessagePiece | Exception | None) -> None:
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            while True:
+                try:
+                    return future.result(timeout=0.5)
+                except TimeoutError:
+                    if cancellation_token.cancelled:
+                        future.cancel()
+                        return
+
+        def produce() -> None:
+            try:
+                for chat_piece in self.chatbot.stream_messages(messages, model=model, temperature=temperature, as_json=as_json, json_schema=json_schema, json_retries=json_retries,
+                                                                   use_tools=use_tools, raise_errors=True, cancellation_token=cancellation_token):
+                    put(chat_piece)
+            except Exception as e:
+                put(e)
+            finally:
+                put(None)
+
+        loop.run_in_executor(self.executor, produce)
+        try:
+            while (item := await queue.get()) is not None:
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            cancellation_token.cancel()
+            while not queue.empty():
+                queue.get_nowait()
+
+    def _build_app(self) -> FastAPI:
+        app = FastAPI(title="Eevee Chat API")
+
+        @app.middleware('http')
+        async def authenticate(request: Request, call_next):
+            if self.api_key and request.headers.get('authorization', '') != f'Bearer {self.api_key}':
+                return self._error(401, 'Invalid API key', 'invalid_request_error')
+            return await call_next(request)
+
+        @app.get('/v1/models')
+        async def list_models() -> Dict[str, Any]:
+            return {'object': 'list', 'data': self._list_models()}
+
+        @app.post('/v1/chat/completions')
+        async def chat_completions(request: Request):
+            try:
+                body: Dict[str, Any] = await request.json()
+            except json.JSONDecodeError as e:
+                return self._error(400, f'The request body is not valid JSON: {e}', 'invalid_request_error')
+            if not isinstance(body, dict):
+                return self._error(400, 'The request body must be a JSON object', 'invalid_request_error')
+            model: str = body.get('model', '')
+            try:
+                framework = get_model_framework(model)
+            except ValueError as e:
+                return self._error(404, str(e), 'model_not_found')
+            if framework not in self.available_frameworks:
+                return self._error(404, f'Framework {framework} is not available', 'model_not_found')
+            try:
+                messages = self._to_messages(body.get('messages', []), model)
+            except ValueError as e:
+                return self._error(400, str(e), 'invalid_request_error')
+
+            response_format: Dict[str, Any] = body.get('response_format') or {}
+            json_schema: Dict[str, Any] | None = (response_format.get('json_schema') or {}).get('schema') if response_format.get('type') == 'json_schema' else None
+            if json_schema is not None:
+                try:
+                    compile_schema(json_schema)
+                except (KeyError, TypeError, AttributeError, ValueError) as e:
+                    return self._error(400, f'Invalid JSON Schema: {e}', 'invalid_request_error')
+
+            completion_id = f'chatcmpl-{uuid.uuid4().hex}'
+            created = int(time.time())
+            stream = self._stream(
+                messages,
+                model=model,
+                temperature=body.get('temperature', 1.),
+                as_json=response_format.get('type') in ('json_object', 'json_schema'),
+                json_schema=json_schema,
+                # Streamed content can't be taken back, so invalid JSON answers fail instead of being generated again
+                json_retries=0 if body.get('stream', False) else None,
+                use_tools=body.get('eevee_tools', False)
+            )
+
+            if not body.get('stream', False):
+                content = ''
+                usage = Usage()
+                try:
+                    async for chat_piece in stream:
+                        if chat_piece.discard:
+                            content = ''
+                        content += chat_piece.content or ''
+                        if chat_piece.usage is not None:
+                            usage += chat_piece.usage
+                except Exception as e:
+                    self.logger.error(f'Request {completion_id} failed: {e}')
+                    return self._error(502, f'{e.__class__.__name__}: {e}', 'upstream_error')
+                return {
+                    'id': completion_id, 'object': 'chat.completion', 'created': created, 'model': model,
+                    'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+                    'usage': self._usage(usage)
+                }
+
+            include_usage: bool = (body.get('stream_options') or {}).get('include_usage', False)
+
+            def chunk(delta: Dict[str, Any], finish_reason: str | None = None) -> str:
+                data = {
+                    'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model,
+                    'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+                }
+                return f'data: {json.dumps(data)}\n\n'
+
+            async def events() -> AsyncGenerator[str, None]:
+                usage = Usage()
+                yield chunk({'role': 'assistant', 'content': ''})
+                try:
+                    async for chat_piece in stream:
+                        if chat_piece.content:
+                            yield chunk({'content': chat_piece.content})
+                        if chat_piece.usage is not None:
+                            usage += chat_piece.usage
+                    yield chunk({}, finish_reason='stop')
+                    if include_usage:
+                        # Like OpenAI, the usage is sent in a last chunk without choices
+                        data = {'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model, 'choices': [], 'usage': self._usage(usage)}
+                        yield f'data: {json.dumps(data)}\n\n'
+                except Exception as e:
+                    self.logger.error(f'Request {completion_id} failed: {e}')
+                    yield f'data: {json.dumps({"error": {"message": f"{e.__class__.__name__}: {e}", "type": "upstream_error"}})}\n\n'
+                yield 'data: [DONE]\n\n'
+
+            return StreamingResponse(events(), media_type='text/event-stream')
+
+        return app
+
+    def run(self) -> None:
+        api = Settings().api
+        self.logger.info(f'Serving the API on http://{self.host}:{self.port}/v1')
+        try:
+            uvicorn.run(self.app, host=self.host, port=self.port, timeout_keep_alive=api.keep_alive_seconds, limit_concurrency=api.max_connections, log_level='warning')
+        finally:
+            self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,227 @@
+import os
+import json
+import time
+import threading
+from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterator, Iterable, Set, List
+from .chatbot import Chatbot
+from .messages import Messages, Usage
+from .settings import Settings
+from .color_logger import get_logger
+from .framework_models import get_model_framework
+from .chat_connectors.connector_interface import BatchRequest, BatchResult
+from ._types import Framework
+
+
+class BatchRunner:
+    """
+    Runs a JSONL file of prompts through the Chatbot, writing a JSONL file of results.
+    Each input line holds a `prompt` and a `model`, and optionally an `id`, `system_prompt`, `temperature`, `json` and `schema`.
+    Prompts whose ID already appears in the output file are skipped, so an interrupted run can be resumed.
+    """
+    STATE_FILE_SUFFIX = ".batches.json"
+
+    def __init__(self, chatbot: Chatbot, input_path: str, output_path: str, concurrency_per_framework: int | None = None) -> None:
+        self.chatbot = chatbot
+        self.input_path: str = input_path
+        self.output_path: str = output_path
+        self.concurrency_per_framework: int = concurrency_per_framework or Settings().batch.concurrency_per_framework
+        self.logger = get_logger()
+        self._write_lock = threading.Lock()
+        self._progress: tqdm | None = None
+
+    @property
+    def state_path(self) -> str:
+        return self.output_path + self.STATE_FILE_SUFFIX
+
+    def _read_prompts(self) -> Iterator[Dict[str, Any]]:
+        with open(self.input_path, 'r') as f:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                prompt: Dict[str, Any] = json.loads(line)
+                prompt['id'] = str(prompt.get('id', line_number))
+                yield prompt
+
+    def _completed_ids(self) -> Set[str]:
+        completed: Set[str] = set()
+        if not os.path.exists(self.output_path):
+            return completed
+        with open(self.output_path, 'r') as f:
+            for line in f:
+                try:
+                    completed.add(json.loads(line)['id'])
+                except (json.JSONDecodeError, KeyError):
+                    continue  # a line cut short by a crash
+        return completed
+
+    def _load_state(self) -> List[Dict[str, Any]]:
+        if not os.path.exists(self.state_path):
+            return []
+        with open(self.state_path, 'r') as f:
+            return json.load(f)
+
+    def _save_state(self, state: List[Dict[str, Any]]) -> None:
+        if not state:
+            if os.path.exists(self.state_path):
+                os.remove(self.state_path)
+            return
+        with open(self.state_path, 'w') as f:
+            json.dump(state, f)
+
+    def _write(self, result: Dict[str, Any]) -> None:
+        with self._write_lock:
+            with open(self.output_path, 'a') as f:
+                f.write(json.dumps(result) + '\n')
+            if self._progress is not None:
+                self._progress.update(1)
+
+    def _usage(self, model: str, usage: Usage | None) -> Dict[str, Any] | None:
+        if usage is None:
+            return None
+        return {**usage.as_dict(), 'cost': self.chatbot.usage_ledger.cost(model, usage)}
+
+    def _messages(self, prompt: Dict[str, Any]) -> Messages:
+        messages = Messages()
+        messages.append('system', prompt.get('system_prompt') or Chatbot.DEFAULT_SYSTEM_PROMPT)
+        messages.append('user', prompt['prompt'])
+        return messages
+
+    def _run_prompt(self, prompt: Dict[str, Any]) -> None:
+        messages = self._messages(prompt)
+        ttft: float | None = None
+        response: str | None = None
+        error: str | None = None
+        start = time.perf_counter()
+        try:
+            for chat_piece in self.chatbot.stream_messages(messages, model=prompt['model'], temperature=prompt.get('temperature', 0.), as_json=prompt.get('json', False), json_schema=prompt.get('schema'), raise_errors=True):
+                if chat_piece.content and ttft is None:
+                    ttft = time.perf_counter() - start
+            response = messages[-1].content if messages[-1].role == 'assistant' else None
+        except Exception as e:
+            error = f'{e.__class__.__name__}: {e}'
+        self._write({
+            'id': prompt['id'],
+            'model': prompt['model'],
+            'response': response,
+            'error': error,
+            'tool_calls': sum(len(m.tool_calls) for m in messages if m.role == 'assistant'),
+            'timing': {'ttft': ttft, 'total': time.perf_counter() - start},
+            'usage': self._usage(prompt['model'], sum((m.usage for m in messages if m.usage is not None), Usage()))
+        })
+
+    def _run_concurrently(self, prompts: Iterable[Dict[str, Any]]) -> None:
+        executors: Dict[Framework, ThreadPoolExecutor] = {
+            framework: ThreadPoolExecutor(max_workers=self.concurrency_per_framework, thread_name_prefix=f'batch-{framework}')
+            for framework in self.chatbot.clients.keys()
+        }
+        # Bounds the number of prompts read ahead of the workers
+        in_flight = threading.BoundedSemaphore(2 * self.concurrency_per_framework * len(executors))
+        try:
+            for prompt in prompts:
+                try:
+                    framework = get_model_framework(prompt['model'])
+                    if framework not in executors:
+                        raise ValueError(f'Framework {framework} is not available')
+                except Exception as e:
+                    self._write({'id': prompt['id'], 'model': prompt.get('model'), 'response': None, 'error': f'{e.__class__.__name__}: {e}', 'tool_calls': 0, 'timing': None, 'usage': None})
+                    continue
+                in_flight.acquire()
+                future = executors[framework].submit(self._run_prompt, prompt)
+                future.add_done_callback(lambda _: in_flight.release())
+        finally:
+            for executor in executors.values():
+                executor.shutdown(wait=True)
+
+    def _submit_provider_batches(self, prompts: List[Dict[str, Any]], state: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Submits prompts to the batch APIs of the providers supporting them, and returns the prompts left to run directly
+        """
+        batch_size: int = Settings().batch.provider_batch_size
+        by_framework: Dict[Framework, List[Dict[str, Any]]] = dict()
+        remaining: List[Dict[str, Any]] = list()
+        for prompt in prompts:
+            try:
+                framework = get_model_framework(prompt['model'])
+            except ValueError:
+                remaining.append(prompt)
+                continue
+            # JSON answers are validated as they stream, which the batch APIs can't do
+            if prompt.get('json', False) or prompt.get('schema') or framework not in self.chatbot.clients:
+                remaining.append(prompt)
+            else:
+                by_framework.setdefault(framework, []).append(prompt)
+
+        for framework, framework_prompts in by_framework.items():
+            for i in range(0, len(framework_prompts), batch_size):
+                chunk = framework_prompts[i:i+batch_size]
+                requests = [BatchRequest(custom_id=p['id'], model=p['model'], temperature=p.get('temperature', 0.), messages=self._messages(p)) for p in chunk]
+                try:
+                    batch_id = self.chatbot.clients[framework].submit_batch(requests)
+                except NotImplementedError:
+                    remaining += framework_prompts[i:]
+                    break
+                self.logger.info(f'Submitted batch {batch_id} of {len(chunk)} prompts to {framework}', color='cyan')
+                state.append({'framework': framework, 'batch_id': batch_id, 'models': {p['id']: p['model'] for p in chunk}})
+                self._save_state(state)
+        return remaining
+
+    def _collect_provider_batches(self, state: List[Dict[str, Any]], wait: bool) -> None:
+        poll_interval: float = Settings().batch.poll_interval_seconds
+        # Batches of providers without an API key this time are kept for a later run
+        unavailable = [batch for batch in state if batch['framework'] not in self.chatbot.clients]
+        for batch in unavailable:
+            self.logger.warning(f"Skipping batch {batch['batch_id']}, as {batch['framework']} is not available")
+        pending = [batch for batch in state if batch not in unavailable]
+        while pending:
+            for batch in list(pending):
+                results: List[BatchResult] | None = self.chatbot.clients[batch['framework']].retrieve_batch(batch['batch_id'])
+                if results is None:
+                    continue
+                # Batches which failed, expired or were cancelled lack the results of some prompts
+                missing = set(batch['models'].keys()) - {result.custom_id for result in results}
+                results += [BatchResult(custom_id=custom_id, error=f"Batch {batch['batch_id']} ended without a result") for custom_id in sorted(missing)]
+                for result in results:
+                    model = batch['models'].get(result.custom_id)
+                    if result.usage is not None and model:
+                        self.chatbot.usage_ledger.record(model, result.usage)
+                    self._write({
+                        'id': result.custom_id,
+                        'model': model,
+                        'response': result.content,
+                        'error': result.error,
+                        'tool_calls': 0,
+                        'timing': None,
+                        'usage': self._usage(model, result.usage) if model else None,
+                        'batch_id': batch['batch_id']
+                    })
+                pending.remove(batch)
+                state.remove(batch)
+                self._save_state(state)
+            if pending:
+                if not wait:
+                    self.logger.info(f'{len(pending)} provider batches are still running, run again to collect their results')
+                    return
+                time.sleep(poll_interval)
+
+    def run(self, provider_batch: bool = False, wait: bool = True) -> None:
+        completed = self._completed_ids()
+        state = self._load_state()
+        submitted = {custom_id for batch in state for custom_id in batch['models'].keys()}
+        prompts: Iterable[Dict[str, Any]] = (p for p in self._read_prompts() if p['id'] not in completed and p['id'] not in submitted)
+        if provider_batch:
+            prompts = self._submit_provider_batches(list(prompts), state)
+
+        # Make sure a line cut short by a crash doesn't swallow the next result
+        if os.path.exists(self.output_path) and os.path.getsize(self.output_path) > 0:
+            with open(self.output_path, 'rb+') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    f.write(b'\n')
+
+        total = sum(1 for _ in self._read_prompts())
+        with tqdm(total=total, initial=len(completed)) as self._progress:
+            self._run_concurrently(prompts)
+            self._collect_provider_batches(state, wait)
+        self._progress = None
@@ -0,0 +1,59 @@
+import zlib
+import hashlib
+import zstandard
+from typing import Set, Tuple
+from .storage_backends.storage_interface import StorageBackend
+
+
+class BlobStore:
+    """
+    A content-addressed store of compressed texts: each text is saved once, under the hash of its content
+    """
+    NAMESPACE = "saved_chats/blobs"
+    ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+    def __init__(self, storage: StorageBackend, compression_level: int = 3) -> None:
+        self._storage: StorageBackend = storage
+        self._compression_level: int = compression_level
+
+    @staticmethod
+    def ref(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def put(self, text: str) -> str:
+        data = text.encode('utf-8')
+        ref = self.ref(data)
+        if not self._storage.exists(self.NAMESPACE, ref):
+            self._storage.write(self.NAMESPACE, ref, zstandard.ZstdCompressor(level=self._compression_level).compress(data))
+        return ref
+
+    @classmethod
+    def encode(cls, text: str, compression_level: int = 3) -> Tuple[str, bytes]:
+        """
+        Returns the reference and compressed data of a text, to be stored later with `put_encoded`
+        """
+        data = text.encode('utf-8')
+        return cls.ref(data), zstandard.ZstdCompressor(level=compression_level).compress(data)
+
+    def put_encoded(self, ref: str, compressed: bytes) -> None:
+        if not self._storage.exists(self.NAMESPACE, ref):
+            self._storage.write(self.NAMESPACE, ref, compressed)
+
+    def get(self, ref: str) -> str:
+        data = self._storage.read(self.NAMESPACE, ref)
+        if data is None:
+            raise KeyError(f'No blob {ref}')
+        if data.startswith(self.ZSTD_MAGIC):
+            return zstandard.ZstdDecompressor().decompress(data).decode('utf-8')
+        return zlib.decompress(data).decode('utf-8')
+
+    def collect_garbage(self, referenced: Set[str]) -> int:
+        """
+        Deletes all blobs which are not referenced, and returns how many were deleted
+        """
+        deleted = 0
+        for ref in self._storage.list_keys(self.NAMESPACE):
+            if ref not in referenced:
+                self._storage.delete(self.NAMESPACE, ref)
+                deleted += 1
+        return deleted
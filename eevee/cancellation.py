@@ -0,0 +1,81 @@
+import threading
+from contextlib import contextmanager
+from typing import List, Callable, Iterable, Iterator, TypeVar, Any
+from .color_logger import get_logger
+
+
+T = TypeVar('T')
+
+
+class CancellationToken:
+    """
+    Signals a running generation to stop. Callbacks registered with `on_cancel`, like closing a provider's
+    stream or cancelling pending tool calls, run once the token is cancelled, from the cancelling thread.
+    """
+    def __init__(self) -> None:
+        self._event = threading.Event()
+        self._callbacks: List[Callable[[], Any]] = list()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, list()
+        for callback in callbacks:
+            self._run(callback)
+
+    def wait(self, timeout: float | None = None) -> bool:
+        return self._event.wait(timeout)
+
+    def on_cancel(self, callback: Callable[[], Any]) -> Callable[[], None]:
+        """
+        Registers a callback to run on cancellation (immediately if already cancelled), and returns a function unregistering it
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._unregister(callback)
+        self._run(callback)
+        return lambda: None
+
+    def _unregister(self, callback: Callable[[], Any]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    @staticmethod
+    def _run(callback: Callable[[], Any]) -> None:
+        try:
+            callback()
+        except Exception as e:
+            get_logger().debug(f'Cancellation callback failed: {e}')
+
+
+def until_cancelled(iterable: Iterable[T], cancellation_token: CancellationToken | None) -> Iterator[T]:
+    """
+    Iterates until the token is cancelled
+    """
+    for item in iterable:
+        if cancellation_token is not None and cancellation_token.cancelled:
+            return
+        yield item
+
+
+@contextmanager
+def closed_on_cancel(resource: Any, cancellation_token: CancellationToken | None) -> Iterator[Any]:
+    """
+    Closes the resource (a stream or a response) once the token is cancelled, even while another thread is blocked reading it,
+    and when the block exits
+    """
+    unregister = cancellation_token.on_cancel(resource.close) if cancellation_token is not None else (lambda: None)
+    try:
+        yield resource
+    finally:
+        unregister()
+        resource.close()
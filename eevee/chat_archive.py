@@ -0,0 +1,142 @@
+import io
+import os
+import json
+import zstandard
+from tqdm import tqdm
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future
+from typing import List, Tuple, Set, Iterator, Iterable, Callable, Any
+from .saved_chat import SavedChat
+from .blob_store import BlobStore
+from .settings import Settings
+from .color_logger import get_logger
+from .storage_backends.storage_interface import StorageBackend
+
+
+def _encode_chats(chats: List[Tuple[str, bytes]]) -> Tuple[bytes, List[str], int]:
+    lines: List[bytes] = list()
+    refs: List[str] = list()
+    for key, data in chats:
+        chat = json.loads(data)
+        refs += [m['content_ref'] for m in chat['messages'] if m.get('content_ref')]
+        lines.append(json.dumps({'type': 'chat', 'key': key, 'chat': chat}, ensure_ascii=False).encode('utf-8') + b'\n')
+    return b''.join(lines), refs, len(chats)
+
+
+def _decode_records(lines: List[bytes], compression_level: int) -> List[Tuple[str, str, bytes, bytes]]:
+    decoded: List[Tuple[str, str, bytes, bytes]] = list()
+    for line in lines:
+        record = json.loads(line)
+        match record['type']:
+            case 'chat':
+                data, index = SavedChat.serialize(record['chat'])
+                decoded.append(('chat', record['key'], data, index))
+            case 'blob':
+                ref, compressed = BlobStore.encode(record['content'], compression_level)
+                if ref != record['ref']:
+                    raise ValueError(f'Blob {record["ref"]} is corrupted')
+                decoded.append(('blob', ref, compressed, b''))
+            case _:
+                raise ValueError(f'Unknown archive record type: {record["type"]}')
+    return decoded
+
+
+class ChatArchive:
+    """
+    Streams all saved chats, along with the tool outputs they refer to, into and out of a single zstd-compressed JSONL archive.
+    Chats are encoded and decoded by worker processes a chunk at a time, so memory use doesn't depend on the archive size.
+    """
+    FORMAT = "eevee-chats"
+    VERSION = 1
+
+    def __init__(self, storage: StorageBackend) -> None:
+        archive = Settings().archive
+        self.storage = storage
+        self.blob_store = BlobStore(storage)
+        self.workers: int = archive.workers or os.cpu_count() or 1
+        self.chunk_size: int = archive.chunk_size
+        self.compression_level: int = archive.compression_level
+        self.logger = get_logger()
+
+    def _chunks(self, items: Iterable[Any]) -> Iterator[List[Any]]:
+        chunk: List[Any] = list()
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk = list()
+        if chunk:
+            yield chunk
+
+    def _map_bounded(self, executor: ProcessPoolExecutor, fn: Callable, chunks: Iterable[List[Any]], *args: Any) -> Iterator[Any]:
+        # Results are consumed in order, with only a few chunks in flight, so nothing accumulates in memory
+        pending: deque[Future] = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(fn, chunk, *args))
+            if len(pending) >= 2 * self.workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def _read_chats(self, keys: List[str]) -> Iterator[Tuple[str, bytes]]:
+        for key in keys:
+            data = self.storage.read(SavedChat.NAMESPACE, key)
+            if data is not None:
+                yield key, data
+
+    def export_to(self, path: str) -> int:
+        """
+        Writes all saved chats to an archive, and returns the number of chats written
+        """
+        exported = 0
+        keys = [k for k in self.storage.list_keys(SavedChat.NAMESPACE) if SavedChat.is_chat_filename(k)]
+        exported_refs: Set[str] = set()
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f, \
+             zstandard.ZstdCompressor(level=self.compression_level).stream_writer(f) as writer, \
+             ProcessPoolExecutor(max_workers=self.workers) as executor, \
+             tqdm(total=len(keys), unit='chat') as progress:
+            writer.write(json.dumps({'type': 'header', 'format': self.FORMAT, 'version': self.VERSION}).encode('utf-8') + b'\n')
+            for lines, refs, count in self._map_bounded(executor, _encode_chats, self._chunks(self._read_chats(keys))):
+                # Tool outputs come before the chats referring to them, so an interrupted import never leaves a chat without them
+                for ref in refs:
+                    if ref in exported_refs:
+                        continue
+                    exported_refs.add(ref)
+                    try:
+                        content = self.blob_store.get(ref)
+                    except KeyError:
+                        self.logger.warning(f'Blob {ref} is missing, exporting without it')
+                        continue
+                    writer.write(json.dumps({'type': 'blob', 'ref': ref, 'content': content}, ensure_ascii=False).encode('utf-8') + b'\n')
+                writer.write(lines)
+                exported += count
+                progress.update(count)
+        os.replace(temp_path, path)
+        self.logger.info(f'Exported {exported} chats and {len(exported_refs)} tool outputs to {path}')
+        return exported
+
+    def import_from(self, path: str) -> int:
+        """
+        Writes all chats of an archive to the storage, overwriting chats with the same title and time, and returns the number of chats written
+        """
+        imported = 0
+        with open(path, 'rb') as f, \
+             ProcessPoolExecutor(max_workers=self.workers) as executor, \
+             tqdm(unit='chat') as progress:
+            reader = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(f))  # type: ignore
+            header = json.loads(reader.readline() or b'{}')
+            if header.get('format') != self.FORMAT or header.get('version', 0) > self.VERSION:
+                raise ValueError(f'{path} is not a supported chat archive')
+            for decoded in self._map_bounded(executor, _decode_records, self._chunks(line for line in reader if line.strip()), self.compression_level):
+                # Archives written by older versions have the tool outputs after the chats referring to them
+                for record_type, key, data, index in sorted(decoded, key=lambda record: record[0] != 'blob'):
+                    if record_type == 'blob':
+                        self.blob_store.put_encoded(key, data)
+                    else:
+                        self.storage.write(SavedChat.NAMESPACE, key, data)
+                        self.storage.write(SavedChat.INDEX_NAMESPACE, key, index)
+                        imported += 1
+                        progress.update(1)
+        self.logger.info(f'Imported {imported} chats from {path}')
+        return imported
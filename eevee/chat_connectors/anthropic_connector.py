@@ -1,16 +1,21 @@
 from anthropic import Anthropic
 from anthropic._types import NOT_GIVEN
 from typing import List, Generator, Dict, Any
-from .connector_interface import Connector
-from ..messages import Messages, ChatMessagePiece
+from .connector_interface import Connector, BatchRequest, BatchResult
+from ..messages import Messages, ChatMessagePiece, Usage
+from ..client_registry import ClientRegistry
+from ..cancellation import CancellationToken, until_cancelled, closed_on_cancel
 
 
 class AnthropicConnector(Connector):
     def __init__(self) -> None:
         super().__init__()
-        self.client = Anthropic()
+        self.client = Anthropic(http_client=ClientRegistry().http_client('anthropic'))
 
-    def get_streaming_response(self, model: str, temperature: float, messages: Messages, tools: List[Dict[str, Any]]) -> Generator[ChatMessagePiece, None, None]:
+    def close(self) -> None:
+        self.client.close()
+
+    def get_streaming_response(self, model: str, temperature: float, messages: Messages, tools: List[Dict[str, Any]], cancellation_token: CancellationToken | None = None) -> Generator[ChatMessagePiece, None, None]:
         response = self.client.messages.create(
             messages=messages.to('anthropic'),  # type: ignore
             system=messages.system_prompt or NOT_GIVEN,
@@ -19,10 +24,59 @@ class AnthropicConnector(Connector):
             model=model,
             max_tokens=4096  # maximum defined by Anthropic
         )
-        for chunk in response:
-            if chunk.type == 'content_block_delta':
-                yield ChatMessagePiece(content=chunk.delta.text)
+        usage: Usage | None = None
+        with closed_on_cancel(response, cancellation_token):
+            for chunk in until_cancelled(response, cancellation_token):
+                if chunk.type == 'content_block_delta':
+                    yield ChatMessagePiece(content=chunk.delta.text)
+                elif chunk.type == 'message_start':
+                    usage = self._usage(chunk.message.usage)
+                elif chunk.type == 'message_delta' and usage is not None:
+                    # The output tokens so far, the last delta has the total
+                    usage.completion_tokens = chunk.usage.output_tokens
+        if usage is not None:
+            yield ChatMessagePiece(usage=usage)
+
+    @staticmethod
+    def _usage(usage: Any) -> Usage:
+        # Anthropic's input tokens don't include the ones read from or written to the prompt cache
+        cache_read_tokens = getattr(usage, 'cache_read_input_tokens', None) or 0
+        cache_creation_tokens = getattr(usage, 'cache_creation_input_tokens', None) or 0
+        return Usage(
+            prompt_tokens=usage.input_tokens + cache_read_tokens + cache_creation_tokens,
+            completion_tokens=usage.output_tokens,
+            cached_tokens=cache_read_tokens
+        )
     
-    def get_json_response(self, model: str, temperature: float, messages: Messages, tools: List[Dict[str, Any]]) -> Generator[ChatMessagePiece, None, None]:
+    def get_json_response(self, model: str, temperature: float, messages: Messages, tools: List[Dict[str, Any]], cancellation_token: CancellationToken | None = None) -> Generator[ChatMessagePiece, None, None]:
         yield ChatMessagePiece(warning_message="Anthropic models do not support forcing JSON responses")
-        yield from self.get_streaming_response(model, temperature, messages, tools)
+        yield from self.get_streaming_response(model, temperature, messages, tools, cancellation_token)
+
+    def submit_batch(self, requests: List[BatchRequest]) -> str:
+        batch_requests = list()
+        for request in requests:
+            params: Dict[str, Any] = {
+                "model": request.model,
+                "messages": request.messages.to('anthropic'),
+                "temperature": request.temperature,
+                "max_tokens": 4096
+            }
+            if request.messages.system_prompt:
+                params["system"] = request.messages.system_prompt
+            batch_requests.append({"custom_id": request.custom_id, "params": params})
+        batch = self.client.beta.messages.batches.create(requests=batch_requests)  # type: ignore
+        return batch.id
+
+    def retrieve_batch(self, batch_id: str) -> List[BatchResult] | None:
+        if self.client.beta.messages.batches.retrieve(batch_id).processing_status != 'ended':
+            return None
+        results: List[BatchResult] = list()
+        for response in self.client.beta.messages.batches.results(batch_id):
+            if response.result.type == 'succeeded':
+                content = ''.join(block.text for block in response.result.message.content if block.type == 'text')
+                results.append(BatchResult(custom_id=response.custom_id, content=content, usage=self._usage(response.result.message.usage)))
+            elif response.result.type == 'errored':
+                results.append(BatchResult(custom_id=response.custom_id, error=str(response.result.error.error)))
+            else:
+                results.append(BatchResult(custom_id=response.custom_id, error=f'Request {response.result.type}'))
+        return results
@@ -1,6 +1,24 @@
 from abc import abstractmethod
+from dataclasses import dataclass
 from typing import Generator, List, Dict, Any
-from ..messages import Messages, ChatMessagePiece
+from ..messages import Messages, ChatMessagePiece, Usage
+from ..cancellation import CancellationToken
+
+
+@dataclass
+class BatchRequest:
+    custom_id: str
+    model: str
+    temperature: float
+    messages: Messages
+
+
+@dataclass
+class BatchResult:
+    custom_id: str
+    content: str | None = None
+    error: str | None = None
+    usage: Usage | None = None
 
 
 class Connector:
@@ -8,9 +26,27 @@ class Connector:
         pass
 
     @abstractmethod
-    def get_streaming_response(self, model: str, temperature: float, messages: Messages, tools: List[Dict[str, Any]]) -> Generator[ChatMessagePiece, None, None]:
+    def get_streaming_response(self, model: str, temperature: float, messages: Messages, tools: List[Dict[str, Any]], cancellation_token: CancellationToken | None = None) -> Generator[ChatMessagePiece, None, None]:
+        """
+        Once the cancellation token is cancelled, the response should stop and its stream closed
+        """
         raise NotImplementedError()
     
+    def close(self) -> None:
+        pass
+
     @abstractmethod
-    def get_json_response(self, model: str, temperature: float, messages: Messages, tools: List[Dict[str, Any]]) -> Generator[ChatMessagePiece, None, None]:
+    def get_json_response(self, model: str, temperature: float, messages: Messages, tools: List[Dict[str, Any]], cancellation_token: CancellationToken | None = None) -> Generator[ChatMessagePiece, None, None]:
+        raise NotImplementedError()
+
+    def submit_batch(self, requests: List[BatchRequest]) -> str:
+        """
+        Submits requests to the provider's batch API, and returns the batch ID
+        """
+        raise NotImplementedError()
+
+    def retrieve_batch(self, batch_id: str) -> List[BatchResult] | None:
+        """
+        Returns the results of a batch submitted with `submit_batch`, or None if it is still running
+        """
         raise NotImplementedError()
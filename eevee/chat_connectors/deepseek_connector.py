@@ -1,13 +1,21 @@
 import os
 from typing import List, Dict, Any, Generator
 from .openai_connector import OpenAIConnector
+from .connector_interface import BatchRequest, BatchResult
 from ..messages import Messages, ChatMessagePiece
+from ..cancellation import CancellationToken
 
 
 class DeepSeekConnector(OpenAIConnector):
     def __init__(self) -> None:
-        super().__init__(base_url='https://api.deepseek.com/v1', api_key=os.environ['DEEPSEEK_API_KEY'])
+        super().__init__(base_url='https://api.deepseek.com/v1', api_key=os.environ['DEEPSEEK_API_KEY'], framework='deepseek')
 
-    def get_json_response(self, model: str, temperature: float, messages: Messages, tools: List[Dict[str, Any]]) -> Generator[ChatMessagePiece, None, None]:
+    def get_json_response(self, model: str, temperature: float, messages: Messages, tools: List[Dict[str, Any]], cancellation_token: CancellationToken | None = None) -> Generator[ChatMessagePiece, None, None]:
         yield ChatMessagePiece(warning_message="DeepSeek models do not support forcing JSON responses")
-        yield from self.get_streaming_response(model, temperature, messages, tools)
+        yield from self.get_streaming_response(model, temperature, messages, tools, cancellation_token)
+
+    def submit_batch(self, requests: List[BatchRequest]) -> str:
+        raise NotImplementedError('DeepSeek does not offer a batch API')
+
+    def retrieve_batch(self, batch_id: str) -> List[BatchResult] | None:
+        raise NotImplementedError('DeepSeek does not offer a batch API')
@@ -1,24 +1,34 @@
 import google.generativeai as genai
 from typing import List, Generator, Dict, Any
 from .connector_interface import Connector
-from ..messages import Messages, ChatMessagePiece
+from ..messages import Messages, ChatMessagePiece, Usage
+from ..client_registry import ClientRegistry
+from ..cancellation import CancellationToken, until_cancelled
 
 
 class GoogleConnector(Connector):
     def __init__(self) -> None:
         super().__init__()
 
-    def get_streaming_response(self, model: str, temperature: float, messages: Messages, tools: List[Dict[str, Any]]) -> Generator[ChatMessagePiece, None, None]:
-        gemini_model = genai.GenerativeModel(model)
+    def get_streaming_response(self, model: str, temperature: float, messages: Messages, tools: List[Dict[str, Any]], cancellation_token: CancellationToken | None = None) -> Generator[ChatMessagePiece, None, None]:
+        gemini_model = ClientRegistry().gemini_model(model)
         response = gemini_model.generate_content(
             contents=messages.to('google'),  # type: ignore
             generation_config=genai.types.GenerationConfig(
                 candidate_count=1,
                 temperature=temperature)
         )
-        for chunk in response:
+        for chunk in until_cancelled(response, cancellation_token):
             yield ChatMessagePiece(content=chunk.text, model=model)
+        # Only reported by recent versions of the SDK
+        usage_metadata = getattr(response, 'usage_metadata', None)
+        if usage_metadata:
+            yield ChatMessagePiece(usage=Usage(
+                prompt_tokens=usage_metadata.prompt_token_count,
+                completion_tokens=usage_metadata.candidates_token_count,
+                cached_tokens=getattr(usage_metadata, 'cached_content_token_count', 0) or 0
+            ))
 
-    def get_json_response(self, model: str, temperature: float, messages: Messages, tools: List[Dict[str, Any]]) -> Generator[ChatMessagePiece, None, None]:
+    def get_json_response(self, model: str, temperature: float, messages: Messages, tools: List[Dict[str, Any]], cancellation_token: CancellationToken | None = None) -> Generator[ChatMessagePiece, None, None]:
         yield ChatMessagePiece(warning_message="Google models do not support forcing JSON responses")
-        yield from self.get_streaming_response(model, temperature, messages, tools)
+        yield from self.get_streaming_response(model, temperature, messages, tools, cancellation_token)
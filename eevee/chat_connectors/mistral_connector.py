@@ -4,18 +4,36 @@ from mistralai.client import MistralClient
 from mistralai.models.chat_completion import ToolCall as MistralToolCall
 from typing import List, Generator, Dict, Any
 from .connector_interface import Connector
-from ..messages import Messages, ToolCall, ChatMessagePiece
+from ..messages import Messages, ToolCall, ChatMessagePiece, Usage
+from ..client_registry import ClientRegistry
+from ..cancellation import CancellationToken, until_cancelled
+
+
+class MistralClientWithPool(MistralClient):
+    """
+    MistralClient doesn't accept an external HTTP client, so its own one is replaced with the shared pool
+    """
+    def __init__(self) -> None:
+        super().__init__()
+        self._client.close()
+        self._client = ClientRegistry().http_client('mistral')
+
+    def __del__(self) -> None:
+        pass  # the pool is closed by the ClientRegistry
 
 
 class MistralConnector(Connector):
     def __init__(self) -> None:
         self.supports_json_response = True
-        self.client = MistralClient()
+        self.client = MistralClientWithPool()
 
     def _tool_calls_from_chunks(self, chunks) -> Generator[ChatMessagePiece, None, None]:
         tool_calls = list()
+        usage: Usage | None = None
         for chunk in chunks:
-            mistral_tool_calls: List[MistralToolCall] = chunk.choices[0].delta.tool_calls
+            if chunk.usage:
+                usage = self._usage(chunk.usage)
+            mistral_tool_calls: List[MistralToolCall] = chunk.choices[0].delta.tool_calls or []
             for t in mistral_tool_calls:
                 tool_calls.append(ToolCall(
                     call_id=t.id,
@@ -23,51 +41,60 @@ class MistralConnector(Connector):
                     arguments=json.loads(t.function.arguments)
                 ))
         yield ChatMessagePiece(tool_calls=tool_calls)
+        if usage is not None:
+            yield ChatMessagePiece(usage=usage)
 
-    def get_streaming_response(self, model: str, temperature: float, messages: Messages, tools: List[Dict[str, Any]]) -> Generator[ChatMessagePiece, None, None]:
+    @staticmethod
+    def _usage(usage: Any) -> Usage:
+        return Usage(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens or 0)
+
+    def get_streaming_response(self, model: str, temperature: float, messages: Messages, tools: List[Dict[str, Any]], cancellation_token: CancellationToken | None = None) -> Generator[ChatMessagePiece, None, None]:
+        yield from self._stream_chat(model, temperature, messages, tools, cancellation_token)
+
+    def _stream_chat(self, model: str, temperature: float, messages: Messages, tools: List[Dict[str, Any]], cancellation_token: CancellationToken | None, response_format: Dict[str, str] | None = None) -> Generator[ChatMessagePiece, None, None]:
         response = self.client.chat_stream(
             model=model, 
             temperature=temperature,
             messages=messages.to('mistral'), 
-            tools=tools)
+            tools=tools or None,
+            response_format=response_format)
 
-        chunk = None
-        for chunk in response:
-            if chunk.choices[0].delta.content or chunk.choices[0].delta.tool_calls is not None:  # type: ignore
-                break
+        # The stream is a generator, so it can only be closed from the thread reading it, once the next chunk arrives
+        try:
+            stream = until_cancelled(response, cancellation_token)
+            chunk = None
+            for chunk in stream:
+                if chunk.choices[0].delta.content or chunk.choices[0].delta.tool_calls is not None:  # type: ignore
+                    break
         
-        if chunk is None: raise RuntimeError('Got empty completion!')
-        chunks = itertools.chain([chunk], response)
+            if cancellation_token is not None and cancellation_token.cancelled: return
+            if chunk is None: raise RuntimeError('Got empty completion!')
+            chunks = itertools.chain([chunk], stream)
 
-        if chunk.choices[0].delta.tool_calls:  # type: ignore
-            yield from self._tool_calls_from_chunks(chunks)
+            if chunk.choices[0].delta.tool_calls:  # type: ignore
+                yield from self._tool_calls_from_chunks(chunks)
         
-        else:
-            for chunk in chunks:  # type: ignore
-                if chunk.choices[0].finish_reason is not None:
-                    break
+            else:
+                for chunk in chunks:  # type: ignore
+                    if chunk.choices[0].finish_reason is not None:
+                        # The usage is sent along with the last chunk
+                        if chunk.usage:
+                            yield ChatMessagePiece(usage=self._usage(chunk.usage))
+                        break
 
-                # in case tools calls begin after some content was sent
-                if chunk.choices[0].delta.tool_calls is not None:  
-                    remaining_chunks = itertools.chain([chunk], chunks)
-                    yield from self._tool_calls_from_chunks(remaining_chunks)
+                    # in case tools calls begin after some content was sent
+                    if chunk.choices[0].delta.tool_calls is not None:  
+                        remaining_chunks = itertools.chain([chunk], chunks)
+                        yield from self._tool_calls_from_chunks(remaining_chunks)
 
-                # got part of message content
-                token = chunk.choices[0].delta.content
-                if token:
-                    yield ChatMessagePiece(content=token)
+                    # got part of message content
+                    token = chunk.choices[0].delta.content
+                    if token:
+                        yield ChatMessagePiece(content=token)
+        finally:
+            response.close()
         
-    def get_json_response(self, model: str, temperature: float, messages: Messages, tools: List[Dict[str, Any]]) -> Generator[ChatMessagePiece, None, None]:
+    def get_json_response(self, model: str, temperature: float, messages: Messages, tools: List[Dict[str, Any]], cancellation_token: CancellationToken | None = None) -> Generator[ChatMessagePiece, None, None]:
         if tools:
             yield ChatMessagePiece(warning_message="Mistral models do not support tools when forcing JSON response")
-        
-        response = self.client.chat(
-            model=model, 
-            temperature=temperature,
-            messages=messages.to('mistral'), 
-            tools=tools)
-        
-        content = response.choices[0].message.content
-        if isinstance(content, list):
-            content = ' '.join(content)
-        yield ChatMessagePiece(content=content)
+        yield from self._stream_chat(model, temperature, messages, [], cancellation_token, response_format={"type": "json_object"})
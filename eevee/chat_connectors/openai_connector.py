@@ -1,15 +1,21 @@
 import json
 import itertools 
-from openai import OpenAI
+from openai import OpenAI, NOT_GIVEN
 from typing import Generator, List, Dict, Any
-from .connector_interface import Connector
-from ..messages import ToolCall, Messages, ChatMessagePiece
+from .connector_interface import Connector, BatchRequest, BatchResult
+from ..messages import ToolCall, Messages, ChatMessagePiece, Usage
+from ..client_registry import ClientRegistry
+from ..cancellation import CancellationToken, until_cancelled, closed_on_cancel
+from .._types import Framework
 
 
 class OpenAIConnector(Connector):
-    def __init__(self, api_key: str | None = None, base_url: str | None = None) -> None:
+    def __init__(self, api_key: str | None = None, base_url: str | None = None, framework: Framework = 'openai') -> None:
         super().__init__()
-        self.client = OpenAI(api_key=api_key, base_url=base_url)
+        self.client = OpenAI(api_key=api_key, base_url=base_url, http_client=ClientRegistry().http_client(framework))
+
+    def close(self) -> None:
+        self.client.close()
 
     def _tool_calls_from_chunks(self, chunks) -> Generator[ChatMessagePiece, None, None]:
         tool_calls = list()
@@ -34,55 +40,105 @@ class OpenAIConnector(Connector):
         
         yield ChatMessagePiece(tool_calls=[ToolCall(call_id=tool['id'], function=tool['function'], arguments=json.loads(tool['arguments'])) for tool in tool_calls])
 
-    def get_streaming_response(self, model: str, temperature: float, messages: Messages, tools: List[Dict[str, Any]]) -> Generator[ChatMessagePiece, None, None]:
+    def get_streaming_response(self, model: str, temperature: float, messages: Messages, tools: List[Dict[str, Any]], cancellation_token: CancellationToken | None = None) -> Generator[ChatMessagePiece, None, None]:
+        yield from self._stream_completion(model, temperature, messages, tools, cancellation_token)
+
+    def _stream_completion(self, model: str, temperature: float, messages: Messages, tools: List[Dict[str, Any]], cancellation_token: CancellationToken | None, response_format: Dict[str, str] | None = None) -> Generator[ChatMessagePiece, None, None]:
         completion = self.client.chat.completions.create(
             model=model,
             temperature=temperature,
             messages=messages.to('openai'),  # type: ignore
-            tools=tools,                     # type: ignore
-            stream=True
+            tools=tools or NOT_GIVEN,        # type: ignore
+            response_format=response_format or NOT_GIVEN,  # type: ignore
+            stream=True,
+            stream_options={"include_usage": True}
         )
 
-        chunk = None
-        for chunk in completion:
-            if chunk.choices[0].delta.content is not None or chunk.choices[0].delta.tool_calls is not None:  # type: ignore
-                break
+        with closed_on_cancel(completion, cancellation_token):
+            stream = until_cancelled(completion, cancellation_token)
+            chunk = None
+            for chunk in stream:
+                # The usage is sent in a last chunk without choices
+                if not chunk.choices or chunk.choices[0].delta.content is not None or chunk.choices[0].delta.tool_calls is not None:  # type: ignore
+                    break
         
-        if chunk is None: raise RuntimeError('Got empty completion!')
-        chunks = itertools.chain([chunk], completion)
+            if cancellation_token is not None and cancellation_token.cancelled: return
+            if chunk is None: raise RuntimeError('Got empty completion!')
+            chunks = itertools.chain([chunk], stream)
 
-        if chunk.choices[0].delta.tool_calls:  # type: ignore
-            yield from self._tool_calls_from_chunks(chunks)
+            if chunk.choices and chunk.choices[0].delta.tool_calls:  # type: ignore
+                yield from self._tool_calls_from_chunks(chunks)
         
-        else:
-            for chunk in chunks:  # type: ignore
-                if chunk.choices[0].finish_reason is not None:
-                    break
+            else:
+                for chunk in chunks:  # type: ignore
+                    if not chunk.choices or chunk.choices[0].finish_reason is not None:
+                        break
+
+                    # sometimes gpt calls tools after starting the message
+                    if chunk.choices[0].delta.tool_calls is not None:  
+                        remaining_chunks = itertools.chain([chunk], chunks)
+                        yield from self._tool_calls_from_chunks(remaining_chunks)
+
+                    # got part of message content
+                    token = chunk.choices[0].delta.content
+                    if token:
+                        yield ChatMessagePiece(content=token)
 
-                # sometimes gpt calls tools after starting the message
-                if chunk.choices[0].delta.tool_calls is not None:  
-                    remaining_chunks = itertools.chain([chunk], chunks)
-                    yield from self._tool_calls_from_chunks(remaining_chunks)
+            for chunk in itertools.chain([chunk], stream):
+                if chunk.usage:
+                    yield ChatMessagePiece(usage=self._usage(chunk.usage))
 
-                # got part of message content
-                token = chunk.choices[0].delta.content
-                if token:
-                    yield ChatMessagePiece(content=token)
+    @staticmethod
+    def _usage(usage: Any) -> Usage:
+        """
+        Reads the usage of a response, or of a batch request (as a dictionary)
+        """
+        # Fields the SDK doesn't know of are kept as dictionaries
+        get = lambda obj, key: obj.get(key, None) if isinstance(obj, dict) else getattr(obj, key, None)
+        details = get(usage, 'prompt_tokens_details')
+        # DeepSeek reports its cache hits separately
+        cached_tokens = (get(details, 'cached_tokens') if details else None) or get(usage, 'prompt_cache_hit_tokens') or 0
+        return Usage(prompt_tokens=get(usage, 'prompt_tokens') or 0, completion_tokens=get(usage, 'completion_tokens') or 0, cached_tokens=cached_tokens)
 
     
-    def get_json_response(self, model: str, temperature: float, messages: Messages, tools: List[Dict[str, Any]]) -> Generator[ChatMessagePiece, None, None]:
-        message = self.client.chat.completions.create(
-            model=model,
-            temperature=temperature,
-            messages=messages.to('openai'),  # type: ignore
-            tools=tools,                     # type: ignore
-            response_format={"type": "json_object"}
-        ).choices[0].message
-
-        if message.tool_calls:
-            tool_calls: List[ToolCall] = list()
-            for tool_call in message.tool_calls:
-                tool_calls.append(ToolCall(call_id=tool_call.id, function=tool_call.function.name, arguments=json.loads(tool_call.function.arguments)))
-            yield ChatMessagePiece(tool_calls=tool_calls)
-        else:
-            yield ChatMessagePiece(content=message.content)      
+    def get_json_response(self, model: str, temperature: float, messages: Messages, tools: List[Dict[str, Any]], cancellation_token: CancellationToken | None = None) -> Generator[ChatMessagePiece, None, None]:
+        yield from self._stream_completion(model, temperature, messages, tools, cancellation_token, response_format={"type": "json_object"})
+
+    def submit_batch(self, requests: List[BatchRequest]) -> str:
+        lines = [json.dumps({
+            "custom_id": request.custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": request.model,
+                "temperature": request.temperature,
+                "messages": request.messages.to('openai')
+            }
+        }) for request in requests]
+        batch_file = self.client.files.create(file=("batch.jsonl", '\n'.join(lines).encode('utf-8')), purpose="batch")
+        batch = self.client.batches.create(input_file_id=batch_file.id, endpoint="/v1/chat/completions", completion_window="24h")
+        return batch.id
+
+    def retrieve_batch(self, batch_id: str) -> List[BatchResult] | None:
+        batch = self.client.batches.retrieve(batch_id)
+        if batch.status in ['validating', 'in_progress', 'finalizing', 'cancelling']:
+            return None
+        # Failed, expired and cancelled batches may still have the results of some requests
+        results: List[BatchResult] = list()
+        for file_id in [batch.output_file_id, batch.error_file_id]:
+            if not file_id:
+                continue
+            for line in self.client.files.content(file_id).text.splitlines():
+                if not line.strip():
+                    continue
+                output = json.loads(line)
+                response = output.get('response') or {}
+                if output.get('error') or response.get('status_code') != 200:
+                    results.append(BatchResult(custom_id=output['custom_id'], error=str(output.get('error') or response.get('body'))))
+                else:
+                    results.append(BatchResult(
+                        custom_id=output['custom_id'], 
+                        content=response['body']['choices'][0]['message']['content'],
+                        usage=self._usage(response['body']['usage']) if response['body'].get('usage') else None
+                    ))
+        return results
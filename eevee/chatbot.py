@@ -1,33 +1,91 @@
 import os
+import json
+import shutil
+import time
 import traceback
+from queue import Queue
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, Future, CancelledError, wait
 from datetime import datetime
 from typing import Set, Dict, List, Generator, Any, Tuple
-from .messages import Messages, Message, ChatMessagePiece
-from .tools import tools_params_definitions, tool_display_message
+from .messages import Messages, Message, ChatMessagePiece, ToolCall, Usage
+from .cancellation import CancellationToken
+from .blob_store import BlobStore
+from .tools import tool_display_message
+from .tool_registry import ToolRegistry
+from .single_flight import SingleFlight
+from .stream_coalescing import coalesce_pieces
+from .json_stream import JsonStreamValidator, InvalidJsonStream
 from .color_logger import get_logger
 from .framework_models import get_model_framework
 from .saved_chat import SavedChat
+from .conversation_tree import ConversationTree
+from .client_registry import ClientRegistry
+from .response_cache import ResponseCache
+from .semantic_cache import SemanticCache
+from .usage_ledger import UsageLedger
+from .settings import Settings
+from .utils import data_directory
 from .chat_connectors.connector_interface import Connector
 from .chat_connectors.openai_connector import OpenAIConnector
 from .chat_connectors.anthropic_connector import AnthropicConnector
 from .chat_connectors.mistral_connector import MistralConnector
 from .chat_connectors.deepseek_connector import DeepSeekConnector
 from .chat_connectors.google_connector import GoogleConnector
+from .storage_backends.storage_interface import StorageBackend
+from .storage_backends.filesystem_backend import FilesystemBackend
+from .storage_backends.sqlite_backend import SQLiteBackend
+from .storage_backends.redis_backend import RedisBackend
+from .storage_backends.write_behind_backend import WriteBehindBackend
 from ._types import Framework
 from . import ROOT_DIR
 
 
+@dataclass
+class ResponseTiming:
+    ttft: float | None = None
+    total: float | None = None
+
+
 class Chatbot:
+    SESSIONS_NAMESPACE = "sessions"
+    # Namespaces of the filesystem backend, and the SQLite database, as kept in the installation folder
+    LEGACY_STORAGE_NAMES = ["saved_chats", "sessions", "preferences", "usage", "eevee.db", "eevee.db-wal"]
+    MAX_CONCURRENT_TOOL_CALLS = 8
+    CANCELLED_TOOL_OUTPUT = "The tool call was cancelled by the user"
+    DEFAULT_SYSTEM_PROMPT = "You are a helpful AI assistance, and your task is to assist the user with all its requests in the best possible way"
+    JSON_INSTRUCTIONS = "Answer with JSON only, without any text before or after it."
+    JSON_SCHEMA_INSTRUCTIONS = "The JSON must match this JSON Schema:\n{schema}"
+
     def __init__(self, available_frameworks: Set[Framework]) -> None:
         if not available_frameworks:
             raise RuntimeError('No available frameworks found! Make sure you supplied API keys')
 
         self.clients: Dict[Framework, Connector] = dict()
-        self.callables = {f.__name__: f for f in tools_params_definitions.keys()}
-        self.tools = self._build_tools()
+        self.tool_registry = ToolRegistry()
+        self.tool_executor = ThreadPoolExecutor(max_workers=self.MAX_CONCURRENT_TOOL_CALLS, thread_name_prefix='tool')
+        self.single_flight: SingleFlight[str] = SingleFlight()
+        self.single_flight_timeouts: Dict[str, float] = self._single_flight_timeouts()
+        streaming_settings = Settings().streaming
+        self.coalesce_window_seconds: float = streaming_settings.coalesce_window_seconds
+        self.coalesce_max_bytes: int = streaming_settings.coalesce_max_bytes
+        self.max_pending_pieces: int = streaming_settings.max_pending_pieces
+        self.json_retries: int = Settings().json_mode.retries
         self.messages = Messages()
+        self.branches: Dict[str, Messages] = dict()
+        self.partially_loaded_chat: SavedChat | None = None
+        # All branches of the conversation, where `messages` is the active one
+        self.tree: ConversationTree = ConversationTree()
+        self.timings: Dict[str, ResponseTiming] = dict()
         self.logger = get_logger()
         self.start_time = datetime.now()
+        self.response_cache = self._build_response_cache()
+        self.semantic_cache = self._build_semantic_cache()
+        self.storage = self._build_storage()
+        self.session_id: str = Settings().storage.session_id
+        self.blob_store = BlobStore(self.storage)
+        self.usage_ledger = UsageLedger(self.storage, self.session_id)
+        Message.configure_spilling(self.blob_store, Settings().memory.spill_tool_outputs_bytes)
 
         for framework in available_frameworks:
             match framework:
@@ -45,44 +103,91 @@ class Chatbot:
                     raise ValueError(f'No connector defined for framework {framework}!')
             self.clients[framework] = client
 
-    def _build_tools(self) -> List[Dict[str, Any]]:
-        tools = list()
-        for func, v in tools_params_definitions.items():
-            params = {}
-            required = []
-            for p in v:
-                params[p[0]] = p[1]
-                if p[2]: 
-                    required.append(p[0])
-
-            tools.append({
-                "type": "function",
-                "function": {
-                    "name": func.__name__,
-                    "description": func.__doc__,
-                    "parameters": {
-                        "type": "object",
-                        "properties": params
-                    },
-                    "required": required
-                }
-            })
-        return tools 
-    
-    @property
-    def saved_chats_dir(self) -> str:
-        SAVED_CHATS_DIR = "saved_chats"
-        directory = os.path.join(ROOT_DIR, SAVED_CHATS_DIR)
-        if not os.path.exists(directory):
-            os.makedirs(directory)
-        return directory
-    
+    def close(self) -> None:
+        self.tool_executor.shutdown(wait=False, cancel_futures=True)
+        self.tool_registry.close()
+        for client in self.clients.values():
+            client.close()
+        ClientRegistry().close()
+        self.storage.close()
+
+    @staticmethod
+    def _single_flight_timeouts() -> Dict[str, float]:
+        single_flight_settings = Settings().single_flight
+        if not single_flight_settings.enabled:
+            return dict()
+        timeouts = single_flight_settings.get('timeouts', None) or {}
+        return {name: timeouts.get(name, single_flight_settings.timeout_seconds) for name in single_flight_settings.tools}
+
+    @staticmethod
+    def _migrate_legacy_storage(directory: str) -> None:
+        """
+        Data used to be kept inside the installation folder by default. Whatever the data directory doesn't have yet
+        is copied from there, so it's only read once.
+        """
+        for name in Chatbot.LEGACY_STORAGE_NAMES:
+            legacy_path, path = os.path.join(ROOT_DIR, name), os.path.join(directory, name)
+            if os.path.exists(path) or not os.path.exists(legacy_path):
+                continue
+            os.makedirs(directory, exist_ok=True)
+            if os.path.isdir(legacy_path):
+                shutil.copytree(legacy_path, path)
+            else:
+                shutil.copy2(legacy_path, path)
+
+    def _build_storage(self) -> StorageBackend:
+        storage_settings = Settings().storage
+        directory = data_directory()
+        if not storage_settings.directory:
+            self._migrate_legacy_storage(directory)
+        storage: StorageBackend
+        match storage_settings.backend:
+            case 'filesystem':
+                storage = FilesystemBackend(directory)
+            case 'sqlite':
+                os.makedirs(directory, exist_ok=True)
+                storage = SQLiteBackend(os.path.join(directory, 'eevee.db'))
+            case 'redis':
+                storage = RedisBackend(storage_settings.redis_url)
+            case _:
+                raise ValueError(f'Unknown storage backend {storage_settings.backend}!')
+        if storage_settings.write_behind:
+            storage = WriteBehindBackend(storage, flush_interval_seconds=storage_settings.flush_interval_seconds, max_pending=storage_settings.max_pending_writes)
+        return storage
+
+    def _build_response_cache(self) -> ResponseCache | None:
+        cache_settings = Settings().cache
+        if not cache_settings.enabled:
+            return None
+        directory = os.path.join(data_directory(), "response_cache") if cache_settings.disk else None
+        return ResponseCache(directory, max_entries=cache_settings.max_entries, ttl_seconds=cache_settings.ttl_seconds)
+
+    def _build_semantic_cache(self) -> SemanticCache | None:
+        cache_settings = Settings().semantic_cache
+        if not cache_settings.enabled:
+            return None
+        return SemanticCache(max_entries=cache_settings.max_entries, threshold=cache_settings.threshold, dimensions=cache_settings.dimensions)
+
     def reset_chat(self) -> None:
         self.messages = Messages()
+        self.branches = dict()
+        self.partially_loaded_chat = None
+        self.tree = ConversationTree()
         self.start_time = datetime.now()
 
+    def _sync_tree(self) -> None:
+        # A partially loaded chat is a single branch, whose tree is built once it's fully loaded
+        if self.partially_loaded_chat is None:
+            self.tree.sync(self.messages)
+
     def delete_last_interaction(self) -> None:
+        if self.branches:
+            self.discard_compare_branches()
+            return None
+        self.load_older_messages()
         if self.messages.empty: return None
+        # The removed messages stay in the tree as a branch of their own
+        self._sync_tree()
         self.messages.pop()
         last_message = self.messages[-1]
         while not last_message.displayed:
@@ -92,81 +197,448 @@ class Chatbot:
             last_message = self.messages[-1]
 
     def _prepare_for_response(self, prompt: str, system_prompt: str) -> None:
+        self.load_older_messages()
+        if self.branches:
+            self.discard_compare_branches()
         if self.messages.empty:
             self.messages.append("system", system_prompt)
-        else:
-            self.messages.edit(0, content=system_prompt)
+        elif system_prompt and self.messages[0].content != system_prompt:
+            # All branches share the system message, so a new one starts a new root rather than changing theirs
+            self._sync_tree()
+            self.messages = Messages([Message('system', system_prompt), *self.messages[1:]])
         self.messages.append('user', prompt)      
 
-    def get_stream_response(self, prompt: str, *, system_prompt: str, model: str, temperature: float) -> Generator[ChatMessagePiece, None, None]:        
+    def _response_cache_key(self, messages: Messages, *, model: str, temperature: float, as_json: bool, json_schema: Dict[str, Any] | None, use_tools: bool) -> str | None:
+        # Only deterministic requests are cached
+        if self.response_cache is None or temperature != 0:
+            return None
         framework = get_model_framework(model)
-        self._prepare_for_response(prompt=prompt, system_prompt=system_prompt)
+        tools = self.tool_registry.digest(framework) if use_tools else None
+        # The schema is only part of the key when set, so keys of other requests are unchanged
+        schema = {'json_schema': json_schema} if json_schema else {}
+        return ResponseCache.key(model=model, temperature=temperature, as_json=as_json, tools=tools, messages=messages.to(framework), **schema)
+
+    def _semantic_cache_key(self, messages: Messages, *, model: str, as_json: bool, json_schema: Dict[str, Any] | None) -> Tuple[str, str] | None:
+        if self.semantic_cache is None or json_schema or messages.empty or messages[-1].role != 'user':
+            return None
+        # A prompt only means the same thing as a cached one if it has no other context
+        if Settings().semantic_cache.opening_turn_only and len([m for m in messages if m.role == 'user']) > 1:
+            return None
+        return SemanticCache.partition(model, messages.system_prompt, as_json), messages[-1].content or ''
 
+    def _replay_cached_response(self, messages: Messages, cached_messages: List[Dict[str, Any]], model: str) -> Generator[ChatMessagePiece, None, None]:
+        REPLAY_CHUNK_SIZE = 64
+        self.logger.info(f"Serving cached response of {model}", color='cyan')
+        replayed_messages = Messages.from_dict(cached_messages)
+        for message in replayed_messages:
+            message.usage = None  # serving it costs nothing
+        messages.extend(replayed_messages)
+        content = messages[-1].content or ''
+        for i in range(0, len(content), REPLAY_CHUNK_SIZE):
+            yield ChatMessagePiece(content=content[i:i+REPLAY_CHUNK_SIZE], model=model)
+
+    def _call_tool(self, tool_call: ToolCall, cancellation_token: CancellationToken | None) -> str:
+        name, arguments = tool_call.function, tool_call.arguments
+        timeout = self.single_flight_timeouts.get(name, None)
+        if timeout is None:
+            return self.tool_registry.call(name, arguments, cancellation_token)
+        # Identical calls made meanwhile by other chats share this one
+        key = json.dumps([name, arguments], sort_keys=True, ensure_ascii=False, default=str)
+        try:
+            return self.single_flight.run(key, lambda token: self.tool_registry.call(name, arguments, token), timeout, cancellation_token)
+        except TimeoutError:
+            return f'ERROR: {name} did not finish within {timeout} seconds'
+        except CancelledError:
+            return self.CANCELLED_TOOL_OUTPUT
+
+    @staticmethod
+    def _wait_for_tool(future: Future, cancellation_token: CancellationToken | None) -> str | None:
+        """
+        Returns the tool output, or None if the generation was cancelled before the tool finished
+        """
+        if cancellation_token is None:
+            return future.result()
+        unregister = cancellation_token.on_cancel(future.cancel)
+        try:
+            while not wait([future], timeout=0.1).done:
+                if cancellation_token.cancelled:
+                    return None  # a running tool can't be stopped, but it's no longer waited for
+            return None if future.cancelled() else future.result()
+        finally:
+            unregister()
+
+    def _run_tools(self, messages: Messages, tool_calls: List[ToolCall], cancellation_token: CancellationToken | None) -> Generator[ChatMessagePiece, None, None]:
+        for tool_call in tool_calls:
+            yield ChatMessagePiece(info_message=tool_display_message(tool_call.function, **tool_call.arguments))
+            self.logger.info(f"Running tool {tool_call.function}: {str(tool_call.arguments)}", color='yellow')
+        futures = [self.tool_executor.submit(self._call_tool, tool_call, cancellation_token) for tool_call in tool_calls]
+        for tool_call, future in zip(tool_calls, futures):
+            tool_output = self._wait_for_tool(future, cancellation_token)
+            if tool_output is None:
+                # Every tool call must have an output, so the conversation can be continued
+                messages.append(role='tool', content=self.CANCELLED_TOOL_OUTPUT, tool_calls=[tool_call])
+                messages[-1].truncated = True
+            else:
+                self.logger.debug("Tool output:\n" + tool_output)
+                messages.append(role='tool', content=tool_output, tool_calls=[tool_call])
+
+    def _record_usage(self, messages: Messages, first_new_message_index: int, model: str, usage: Usage) -> None:
+        # Added to the answer, or to the message calling tools if the request didn't end with an answer
+        answer = next((m for m in reversed(messages[first_new_message_index:]) if m.role == 'assistant'), None)
+        if answer is not None:
+            answer.usage = usage if answer.usage is None else answer.usage + usage
+        self.usage_ledger.record(model, usage)
+
+    def _with_json_instructions(self, messages: Messages, json_schema: Dict[str, Any] | None) -> Messages:
+        """
+        Returns a copy of the messages whose system prompt asks for JSON (matching the schema, if any). Besides models
+        without a JSON mode, OpenAI's JSON mode fails requests whose messages don't mention JSON.
+        """
+        instructions = self.JSON_INSTRUCTIONS
+        if json_schema:
+            instructions += '\n' + self.JSON_SCHEMA_INSTRUCTIONS.format(schema=json.dumps(json_schema))
+        request_messages = Messages(messages)
+        if messages.system_prompt is not None:
+            request_messages[0] = Message('system', f'{messages.system_prompt}\n\n{instructions}')
+        else:
+            request_messages.insert(0, Message('system', instructions))
+        return request_messages
+
+    @staticmethod
+    def _discard_answer(messages: Messages, round_start: int) -> None:
+        last_message = messages[messages.last_message_index]
+        if len(messages) > round_start and last_message.role == 'assistant':
+            # The message is kept for its usage, and the next attempt's content is added to it
+            last_message.content = None
+
+    def _record_cancellation(self, messages: Messages, first_new_message_index: int) -> None:
+        self.logger.info("Generation cancelled", color='cyan')
+        last_message = messages[-1] if len(messages) > first_new_message_index else None
+        if last_message is not None and last_message.role == 'assistant' and not last_message.tool_calls:
+            last_message.truncated = True
+
+    def stream_messages(self, 
+                        messages: Messages, 
+                        *, 
+                        model: str, 
+                        temperature: float, 
+                        as_json: bool = False, 
+                        json_schema: Dict[str, Any] | None = None,
+                        json_retries: int | None = None,
+                        use_tools: bool = True, 
+                        raise_errors: bool = False, 
+                        use_cache: bool = True,
+                        cancellation_token: CancellationToken | None = None
+                        ) -> Generator[ChatMessagePiece, None, None]:
+        """
+        Runs the model and tool loop over the provided messages, appending the answer (and any tool calls) to them.
+        Errors are yielded as a message, unless `raise_errors` is set. Unless `use_cache` is set, cached answers are ignored.
+        Once the cancellation token is cancelled, the provider's stream is closed, pending tool calls are cancelled,
+        and the partial answer is kept, marked as truncated.
+        JSON answers (`as_json`, implied by `json_schema`) are validated as they stream. An answer which turns invalid,
+        or breaks the schema, is stopped and generated again up to `json_retries` times (by default, as configured),
+        yielding a `discard` piece before each retry. Once out of retries, the error is raised or yielded as a message.
+        """
+        as_json = as_json or json_schema is not None
+        json_retries = self.json_retries if json_retries is None else json_retries
+        framework = get_model_framework(model)
+        tools = self.tool_registry.payload(framework) if use_tools else []
+        cancelled = lambda: cancellation_token is not None and cancellation_token.cancelled
+        first_new_message_index = len(messages)
         try:
+            cache_key = self._response_cache_key(messages, model=model, temperature=temperature, as_json=as_json, json_schema=json_schema, use_tools=use_tools) if use_cache else None
+            if cache_key:
+                cached_messages = self.response_cache.get(cache_key)  # type: ignore
+                if cached_messages:
+                    yield from self._replay_cached_response(messages, cached_messages, model)
+                    return
+            semantic_cache_key = self._semantic_cache_key(messages, model=model, as_json=as_json, json_schema=json_schema) if use_cache else None
+            if semantic_cache_key:
+                cached_messages = self.semantic_cache.get(*semantic_cache_key)  # type: ignore
+                if cached_messages:
+                    yield from self._replay_cached_response(messages, cached_messages, model)
+                    return
+
             final_message = False
-            while not final_message:
+            while not final_message and not cancelled():
                 final_message = True
-                generator = self.clients[framework].get_streaming_response(model=model, temperature=temperature, messages=self.messages, tools=self.tools)
-                for chat_piece in generator:
-                    if chat_piece.tool_calls:
-                        final_message = False
-                        if self.messages[self.messages.last_message_index].role == 'assistant':
-                            self.messages.update(self.messages.last_message_index, tool_calls=chat_piece.tool_calls)
-                        else:
-                            self.messages.append('assistant', content=None, tool_calls=chat_piece.tool_calls, model=model)
-                        for tool_call in chat_piece.tool_calls:
-                            yield ChatMessagePiece(info_message=tool_display_message(tool_call.function, **tool_call.arguments))
-                            self.logger.info(f"Running tool {tool_call.function}: {str(tool_call.arguments)}", color='yellow')
-                            tool_output = self.callables[tool_call.function](**tool_call.arguments)
-                            self.logger.debug("Tool output:\n" + tool_output)
-                            self.messages.append(role='tool', content=tool_output, tool_calls=[tool_call])
-                    else:
-                        if self.messages[self.messages.last_message_index].role == 'assistant':
-                            self.messages.update(self.messages.last_message_index, content=chat_piece.content)
+                round_start = len(messages)
+                json_validator = JsonStreamValidator(json_schema) if as_json else None
+                if as_json:
+                    generator = self.clients[framework].get_json_response(model=model, temperature=temperature, messages=self._with_json_instructions(messages, json_schema), tools=tools, cancellation_token=cancellation_token)
+                else:
+                    generator = self.clients[framework].get_streaming_response(model=model, temperature=temperature, messages=messages, tools=tools, cancellation_token=cancellation_token)
+                if self.coalesce_window_seconds > 0:
+                    generator = coalesce_pieces(generator, self.coalesce_window_seconds, self.coalesce_max_bytes, self.max_pending_pieces)
+                try:
+                    for chat_piece in generator:
+                        if chat_piece.tool_calls:
+                            final_message = False
+                            if messages[messages.last_message_index].role == 'assistant':
+                                messages.update(messages.last_message_index, tool_calls=chat_piece.tool_calls)
+                            else:
+                                messages.append('assistant', content=None, tool_calls=chat_piece.tool_calls, model=model)
+                            yield from self._run_tools(messages, chat_piece.tool_calls, cancellation_token)
+                        elif chat_piece.usage is not None:
+                            self._record_usage(messages, first_new_message_index, model, chat_piece.usage)
+                            chat_piece.model = model
+                            yield chat_piece
+                        elif chat_piece.content is None:
+                            yield chat_piece
                         else:
-                            self.messages.append('assistant', content=chat_piece.content, model=model)
-                        chat_piece.model = model
-                        yield chat_piece
+                            if json_validator is not None:
+                                json_validator.feed(chat_piece.content)
+                            if messages[messages.last_message_index].role == 'assistant':
+                                messages.update(messages.last_message_index, content=chat_piece.content)
+                            else:
+                                messages.append('assistant', content=chat_piece.content, model=model)
+                            chat_piece.model = model
+                            yield chat_piece
+                    if json_validator is not None and final_message and not cancelled():
+                        json_validator.finish()
+                except InvalidJsonStream as e:
+                    # Stops reading the provider's stream
+                    generator.close()
+                    if cancelled() or json_retries <= 0:
+                        raise
+                    json_retries -= 1
+                    self.logger.warning(f'Invalid JSON answer of {model}, generating it again: {e}')
+                    self._discard_answer(messages, round_start)
+                    final_message = False
+                    yield ChatMessagePiece(warning_message=f'The answer was not valid JSON ({e}), generating it again', discard=True)
+
+            if cancelled():
+                self._record_cancellation(messages, first_new_message_index)
+            elif len(messages) > first_new_message_index:
+                new_messages = [m.as_dict() for m in messages[first_new_message_index:]]
+                if cache_key:
+                    self.response_cache.put(cache_key, new_messages)  # type: ignore
+                if semantic_cache_key:
+                    self.semantic_cache.put(*semantic_cache_key, new_messages)  # type: ignore
         
         except Exception as e:
+            # Closing the provider's stream while it's read fails the read
+            if cancelled():
+                self._record_cancellation(messages, first_new_message_index)
+                return
+            if raise_errors:
+                raise
             self.logger.error(traceback.format_exc())
             yield ChatMessagePiece(content=f'❌ _**{e.__class__.__name__}:** {e}_')
 
-    def get_json_response(self, prompt: str, *, system_prompt: str, model: str, temperature: float) -> Generator[ChatMessagePiece, None, None]:
-        framework = get_model_framework(model)
+    def get_stream_response(self, prompt: str, *, system_prompt: str, model: str, temperature: float, cancellation_token: CancellationToken | None = None) -> Generator[ChatMessagePiece, None, None]:        
         self._prepare_for_response(prompt=prompt, system_prompt=system_prompt)
+        yield from self.stream_messages(self.messages, model=model, temperature=temperature, cancellation_token=cancellation_token)
 
-        final_message = False
-        while not final_message:
-            final_message = True
-            response = self.clients[framework].get_json_response(model=model, temperature=temperature, messages=self.messages, tools=self.tools)
-            for chat_piece in response:
-                if chat_piece.tool_calls:
-                    final_message = False
-                    self.messages.append(role='assistant', content=None, tool_calls=chat_piece.tool_calls, model=model)
-                    for tool_call in chat_piece.tool_calls:
-                        yield ChatMessagePiece(info_message=tool_display_message(tool_call.function, **tool_call.arguments))
-                        self.logger.info(f"Running tool {tool_call.function}: {str(tool_call.arguments)}", color='yellow')
-                        tool_output = self.callables[tool_call.function](**tool_call.arguments)
-                        self.logger.debug("Tool output:\n" + tool_output)
-                        self.messages.append(role='tool', content=tool_output, tool_calls=[tool_call])
+    def get_compare_stream_response(self, prompt: str, *, system_prompt: str, models: List[str], temperature: float, cancellation_token: CancellationToken | None = None) -> Generator[Tuple[str, ChatMessagePiece], None, None]:
+        """
+        Streams the same prompt to several models concurrently. Each model answers on its own branch of the 
+        conversation, and the main thread is left waiting on the prompt until `choose_compare_branch` is called.
+        """
+        self._prepare_for_response(prompt=prompt, system_prompt=system_prompt)
+        self.branches = {model: Messages(self.messages) for model in models}
+        self.timings = {model: ResponseTiming() for model in models}
+        pieces: Queue[Tuple[str, ChatMessagePiece | None]] = Queue()
+        # Also cancelled when the caller stops consuming the answers
+        branches_token = CancellationToken()
+        unregister = cancellation_token.on_cancel(branches_token.cancel) if cancellation_token is not None else (lambda: None)
+
+        def stream_branch(model: str) -> None:
+            start = time.perf_counter()
+            try:
+                for chat_piece in self.stream_messages(self.branches[model], model=model, temperature=temperature, cancellation_token=branches_token):
+                    if chat_piece.content and self.timings[model].ttft is None:
+                        self.timings[model].ttft = time.perf_counter() - start
+                    pieces.put((model, chat_piece))
+            finally:
+                self.timings[model].total = time.perf_counter() - start
+                pieces.put((model, None))
+
+        executor = ThreadPoolExecutor(max_workers=len(models), thread_name_prefix='compare')
+        try:
+            for model in models:
+                executor.submit(stream_branch, model)
+            remaining = len(models)
+            while remaining:
+                model, chat_piece = pieces.get()
+                if chat_piece is None:
+                    remaining -= 1
+                    timing = self.timings[model]
+                    self.logger.info(f"Model {model} finished: TTFT {timing.ttft or 0:.2f}s, total {timing.total or 0:.2f}s", color='cyan')
                 else:
-                    self.messages.append(role='assistant', content=chat_piece.content, model=model)
-                    chat_piece.model = model
-                    yield chat_piece
+                    yield model, chat_piece
+        finally:
+            unregister()
+            branches_token.cancel()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def choose_compare_branch(self, model: str) -> None:
+        if model not in self.branches:
+            raise ValueError(f'No compared answer of model {model}!')
+        # The other answers are kept as sibling branches
+        for other_model, branch in self.branches.items():
+            if other_model != model and self.partially_loaded_chat is None:
+                self.tree.sync(branch)
+        self.messages = self.branches[model]
+        self.branches = dict()
+        self._sync_tree()
+
+    def list_branches(self) -> List[int]:
+        """
+        Returns the last nodes of all branches of the conversation in the tree
+        """
+        if self.partially_loaded_chat is not None:
+            return []  # chats with several branches are never partially loaded
+        self._sync_tree()
+        return [leaf for leaf in self.tree.leaves() if self.tree.nodes[leaf].message.role != 'system']
+
+    def switch_branch(self, node: int) -> None:
+        self.load_older_messages()
+        if self.branches:
+            self.discard_compare_branches()
+        self._sync_tree()
+        self.messages = self.tree.messages(node)
+        self.tree.active_node = node
+
+    def _turn_message_index(self, turn: int | None) -> int:
+        user_messages_indices = [i for i, m in enumerate(self.messages) if m.role == 'user']
+        turn = turn or len(user_messages_indices)
+        if not 1 <= turn <= len(user_messages_indices):
+            raise ValueError(f'No turn {turn}, the conversation has {len(user_messages_indices)} turns')
+        return user_messages_indices[turn - 1]
+
+    def fork(self, turn: int | None = None) -> None:
+        """
+        Moves back to before the prompt of the given turn (starting at 1, or the last one if not provided), 
+        so the next prompt starts a new branch
+        """
+        self.load_older_messages()
+        if self.branches:
+            self.discard_compare_branches()
+        self._sync_tree()
+        self.messages = Messages(self.messages[:self._turn_message_index(turn)])
+        self._sync_tree()
+
+    def regenerate(self, turn: int | None = None, *, model: str, temperature: float, as_json: bool = False, json_schema: Dict[str, Any] | None = None, cancellation_token: CancellationToken | None = None) -> Generator[ChatMessagePiece, None, None]:
+        """
+        Answers the prompt of the given turn (starting at 1, or the last one if not provided) again, on a new branch
+        """
+        self.load_older_messages()
+        if self.branches:
+            self.discard_compare_branches()
+        self._sync_tree()
+        self.messages = Messages(self.messages[:self._turn_message_index(turn) + 1])
+        self._sync_tree()
+        return self.stream_messages(self.messages, model=model, temperature=temperature, as_json=as_json, json_schema=json_schema, use_cache=False, cancellation_token=cancellation_token)
+
+    def discard_compare_branches(self) -> None:
+        self.branches = dict()
+        if not self.messages.empty and self.messages[-1].role == 'user':
+            self.messages.pop()
+
+    def get_json_response(self, prompt: str, *, system_prompt: str, model: str, temperature: float, json_schema: Dict[str, Any] | None = None, cancellation_token: CancellationToken | None = None) -> Generator[ChatMessagePiece, None, None]:
+        self._prepare_for_response(prompt=prompt, system_prompt=system_prompt)
+        yield from self.stream_messages(self.messages, model=model, temperature=temperature, as_json=True, json_schema=json_schema, cancellation_token=cancellation_token)
 
     def export_chat(self) -> None:
-        SavedChat(messages=self.messages, start_time=self.start_time, directory=self.saved_chats_dir).save_to_file()
+        self.load_older_messages()
+        self._sync_tree()
+        usage = {model: model_usage.as_dict() for model, model_usage in self.chat_usage().items()}
+        SavedChat(messages=self.messages, start_time=self.start_time, storage=self.storage, tree=self.tree, usage=usage).save()
 
-    def load_chat(self, title: str, start_time: datetime) -> None:
+    def chat_usage(self) -> Dict[str, Usage]:
+        """
+        Returns the tokens used by the chat per model, including all its branches and the answers being compared
+        """
+        if self.partially_loaded_chat is not None:
+            # Nothing was added to the loaded chat yet, so the totals saved with it are complete
+            saved_usage: Dict[str, Dict[str, int]] = self.partially_loaded_chat.from_metadata('usage') or {}
+            return {model: Usage.from_dict(model_usage) for model, model_usage in saved_usage.items()}
+        self._sync_tree()
+        messages = [node.message for node in self.tree.nodes]
+        for branch in self.branches.values():
+            messages += branch[len(self.messages):]
+        usage: Dict[str, Usage] = dict()
+        for message in messages:
+            if message.usage is not None and message.model:
+                usage[message.model] = usage.get(message.model, Usage()) + message.usage
+        return usage
+
+    def load_chat(self, title: str, start_time: datetime, last_turns: int | None = None) -> None:
+        """
+        Loads a saved chat. If `last_turns` is provided, only the latest turns are loaded, and the rest 
+        are loaded when needed, or by calling `load_older_messages`.
+        """
         self.reset_chat()
-        saved_chat = SavedChat.from_chat_title_and_time(title, start_time, directory=self.saved_chats_dir)
+        saved_chat = SavedChat.from_chat_title_and_time(title, start_time, storage=self.storage, last_turns=last_turns)
         self.messages = saved_chat.messages
+        if saved_chat.first_message_index > 0:
+            self.partially_loaded_chat = saved_chat
+        else:
+            self.tree = saved_chat.tree
+
+    def load_older_messages(self, turns: int | None = None) -> None:
+        if self.partially_loaded_chat is None:
+            return None
+        older_messages = self.partially_loaded_chat.read_older_turns(turns)
+        self.messages = Messages(older_messages + self.messages)
+        if self.partially_loaded_chat.first_message_index == 0:
+            self.partially_loaded_chat = None
+            self.tree = ConversationTree.from_messages(self.messages)
+
+    def delete_chat(self, title: str, start_time: datetime) -> None:
+        SavedChat.delete(title, start_time, storage=self.storage)
+
+    def save_session(self) -> None:
+        session: Dict[str, Any] = {"start_time": self.start_time.strftime(SavedChat.TIME_FORMAT)}
+        if self.partially_loaded_chat is not None:
+            # Nothing was added to the loaded chat yet, so pointing to it is enough
+            session["saved_chat"] = {
+                "title": self.partially_loaded_chat.title, 
+                "start_time": self.partially_loaded_chat.start_time.strftime(SavedChat.TIME_FORMAT)
+            }
+        else:
+            self._sync_tree()
+            session["messages"] = self.tree.as_dict(self.blob_store)
+            session["active"] = self.tree.active_node
+        self.storage.write(self.SESSIONS_NAMESPACE, f'{self.session_id}.json', json.dumps(session).encode('utf-8'))
+
+    def restore_session(self) -> bool:
+        data = self.storage.read(self.SESSIONS_NAMESPACE, f'{self.session_id}.json')
+        if data is None:
+            return False
+        session = json.loads(data)
+        self.reset_chat()
+        if 'saved_chat' in session:
+            saved_chat_time = datetime.strptime(session['saved_chat']['start_time'], SavedChat.TIME_FORMAT)
+            self.load_chat(session['saved_chat']['title'], saved_chat_time, last_turns=Settings().ui.loaded_turns)
+        else:
+            self.tree = ConversationTree.from_dict(session['messages'], session.get('active', None))
+            self.messages = self.tree.messages()
+        self.start_time = datetime.strptime(session['start_time'], SavedChat.TIME_FORMAT)
+        return True
+
+    def collect_garbage(self) -> int:
+        """
+        Deletes blobs no saved chat, stored session or message in memory refers to. 
+        Should not run while other processes using the same storage are mid-response.
+        """
+        referenced: Set[str] = {m.content_ref for m in self.messages if m.content_ref}
+        for branch in self.branches.values():
+            referenced |= {m.content_ref for m in branch if m.content_ref}
+        for namespace in [SavedChat.NAMESPACE, self.SESSIONS_NAMESPACE]:
+            for key in self.storage.list_keys(namespace):
+                data = self.storage.read(namespace, key)
+                if data is not None:
+                    referenced |= SavedChat.referenced_blobs(data)
+        deleted = self.blob_store.collect_garbage(referenced)
+        self.logger.info(f'Deleted {deleted} unreferenced blobs')
+        return deleted
 
     def get_displayed_messages(self) -> List[Message]:
         return [message for message in self.messages if message.displayed]
     
     def list_saved_chats(self) -> List[Tuple[str, datetime]]:
-        chat_filenames = [f for f in os.listdir(self.saved_chats_dir) if os.path.isfile(os.path.join(self.saved_chats_dir, f)) and f.startswith(SavedChat.FILE_PREFIX) and f.endswith(SavedChat.FILE_SUFFIX)]
+        chat_filenames = [f for f in self.storage.list_keys(SavedChat.NAMESPACE) if SavedChat.is_chat_filename(f)]
         saved_list = [SavedChat.filename_to_title_and_time(filename) for filename in chat_filenames]
         return sorted(saved_list, key=lambda t: t[1], reverse=True)
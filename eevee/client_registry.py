@@ -0,0 +1,95 @@
+import httpx
+import requests
+import threading
+import google.generativeai as genai
+from requests.adapters import HTTPAdapter
+from googleapiclient.discovery import build, Resource
+from typing import Dict, Tuple, List
+from .settings import Settings
+from .color_logger import get_logger
+from ._types import Framework
+
+
+class ClientRegistry:
+    """
+    A Singleton holding the HTTP pools, model handles and discovery services shared by all connectors and tools
+    """
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls, *args, **kwargs):
+        with cls._lock:
+            if cls._instance is None:
+                instance = super(ClientRegistry, cls).__new__(cls)
+                instance._http_clients = dict()
+                instance._requests_session = None
+                instance._gemini_models = dict()
+                instance._discovery_services = threading.local()
+                instance._all_discovery_services = list()
+                cls._instance = instance
+        return cls._instance
+
+    _http_clients: Dict[Framework, httpx.Client]
+    _requests_session: requests.Session | None
+    _gemini_models: Dict[str, genai.GenerativeModel]
+    _discovery_services: threading.local
+    _all_discovery_services: List[Resource]
+
+    def http_client(self, framework: Framework) -> httpx.Client:
+        with self._lock:
+            if framework not in self._http_clients:
+                http = Settings().http
+                limits = httpx.Limits(
+                    max_connections=http.max_connections,
+                    max_keepalive_connections=http.max_keepalive_connections,
+                    keepalive_expiry=http.keepalive_expiry_seconds
+                )
+                self._http_clients[framework] = httpx.Client(
+                    transport=httpx.HTTPTransport(limits=limits, retries=http.retries),
+                    timeout=http.timeout_seconds,
+                    follow_redirects=True
+                )
+            return self._http_clients[framework]
+
+    def requests_session(self) -> requests.Session:
+        with self._lock:
+            if self._requests_session is None:
+                http = Settings().http
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=http.max_keepalive_connections, pool_maxsize=http.max_connections, max_retries=http.retries)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._requests_session = session
+            return self._requests_session
+
+    def gemini_model(self, model: str) -> genai.GenerativeModel:
+        with self._lock:
+            if model not in self._gemini_models:
+                self._gemini_models[model] = genai.GenerativeModel(model)
+            return self._gemini_models[model]
+
+    def discovery_service(self, service_name: str, version: str, developer_key: str) -> Resource:
+        # Discovery services are built on httplib2, which is not thread-safe, so each thread gets its own
+        services: Dict[Tuple[str, str, str], Resource] = getattr(self._discovery_services, 'services', None) or dict()
+        self._discovery_services.services = services
+        key = (service_name, version, developer_key)
+        if key not in services:
+            services[key] = build(service_name, version, developerKey=developer_key, cache_discovery=False)
+            with self._lock:
+                self._all_discovery_services.append(services[key])
+        return services[key]
+
+    def close(self) -> None:
+        with self._lock:
+            for framework, client in self._http_clients.items():
+                get_logger().debug(f'Closing HTTP pool of {framework}')
+                client.close()
+            if self._requests_session is not None:
+                self._requests_session.close()
+            for service in self._all_discovery_services:
+                service.close()
+            self._http_clients = dict()
+            self._requests_session = None
+            self._gemini_models = dict()
+            self._discovery_services = threading.local()
+            self._all_discovery_services = list()
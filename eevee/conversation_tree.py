@@ -0,0 +1,99 @@
+from dataclasses import dataclass, field
+from typing import List, Dict, Any
+from .messages import Message, Messages
+from .blob_store import BlobStore
+
+
+@dataclass(slots=True)
+class MessageNode:
+    message: Message
+    parent: int | None
+    children: List[int] = field(default_factory=list)
+
+
+class ConversationTree:
+    """
+    All branches of a conversation. Branches share the nodes, and so the message objects, of their common prefix.
+    The active branch is the path from the root to `active_node`.
+    """
+    def __init__(self) -> None:
+        self.nodes: List[MessageNode] = list()
+        self.active_node: int | None = None
+
+    @classmethod
+    def from_messages(cls, messages: Messages):
+        tree = cls()
+        tree.sync(messages)
+        return tree
+
+    @classmethod
+    def from_dict(cls, messages_as_dict: List[Dict[str, Any]], active_node: int | None = None):
+        """
+        Messages without a `parent` follow the message before them, so a plain list of messages is a single branch
+        """
+        tree = cls()
+        for i, (message, message_as_dict) in enumerate(zip(Messages.from_dict(messages_as_dict), messages_as_dict)):
+            tree._add(message, message_as_dict.get('parent', i - 1 if i > 0 else None))
+        tree.active_node = active_node if active_node is not None else (len(tree.nodes) - 1 if tree.nodes else None)
+        return tree
+
+    def as_dict(self, blob_store: BlobStore | None = None) -> List[Dict[str, Any]]:
+        messages_as_dict: List[Dict[str, Any]] = list()
+        for i, node in enumerate(self.nodes):
+            message_as_dict = node.message.as_dict(blob_store)
+            if node.parent != (i - 1 if i > 0 else None):
+                message_as_dict['parent'] = node.parent
+            messages_as_dict.append(message_as_dict)
+        return messages_as_dict
+
+    @property
+    def linear(self) -> bool:
+        return all(node.parent == (i - 1 if i > 0 else None) for i, node in enumerate(self.nodes))
+
+    def _add(self, message: Message, parent: int | None) -> int:
+        self.nodes.append(MessageNode(message=message, parent=parent))
+        node = len(self.nodes) - 1
+        if parent is not None:
+            self.nodes[parent].children.append(node)
+        return node
+
+    def _children(self, node: int | None) -> List[int]:
+        if node is None:
+            return [i for i, n in enumerate(self.nodes) if n.parent is None]
+        return self.nodes[node].children
+
+    def path(self, node: int | None = None) -> List[int]:
+        """
+        The nodes from the root to the given node (the active one if not provided)
+        """
+        node = self.active_node if node is None else node
+        path: List[int] = list()
+        while node is not None:
+            path.append(node)
+            node = self.nodes[node].parent
+        return path[::-1]
+
+    def messages(self, node: int | None = None) -> Messages:
+        return Messages(self.nodes[i].message for i in self.path(node))
+
+    def sync(self, messages: Messages) -> None:
+        """
+        Makes the messages the active branch. Messages already in the tree are matched by identity,
+        and the rest are added as new nodes, so nothing is ever removed.
+        """
+        node: int | None = None
+        for message in messages:
+            child = next((c for c in self._children(node) if self.nodes[c].message is message), None)
+            node = child if child is not None else self._add(message, node)
+        self.active_node = node
+
+    def leaves(self) -> List[int]:
+        return [i for i, node in enumerate(self.nodes) if not node.children]
+
+    def leaf_of(self, node: int) -> int:
+        """
+        The leaf reached from the node by following its latest children
+        """
+        while self.nodes[node].children:
+            node = self.nodes[node].children[-1]
+        return node
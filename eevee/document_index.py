@@ -0,0 +1,290 @@
+import os
+import re
+import json
+import time
+import random
+import threading
+import numpy as np
+from dataclasses import dataclass
+from typing import List, Dict, Tuple, Iterator
+from .embeddings import HashingVectorizer
+from .color_logger import get_logger
+from .settings import Settings
+from .utils import data_directory
+
+
+@dataclass(slots=True)
+class DocumentChunk:
+    path: str
+    # Character offset of the chunk in the file
+    offset: int
+    text: str
+
+
+@dataclass(slots=True)
+class IndexedFile:
+    mtime_ns: int
+    size: int
+    first_row: int
+    rows: int
+
+
+@dataclass(slots=True)
+class IndexUpdate:
+    added: int = 0
+    updated: int = 0
+    removed: int = 0
+    unchanged: int = 0
+    chunks: int = 0
+
+
+_PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+
+
+def chunk_text(text: str, chunk_chars: int) -> Iterator[Tuple[int, str]]:
+    """
+    Splits the text into chunks of whole paragraphs up to `chunk_chars` long, and yields each with its offset.
+    Longer paragraphs are split on their own.
+    """
+    breaks = [m.end() for m in _PARAGRAPH_BREAK.finditer(text)]
+    paragraphs = list(zip([0] + breaks, breaks + [len(text)]))
+    start, end = 0, 0
+    for paragraph_start, paragraph_end in paragraphs:
+        if paragraph_end - start > chunk_chars and end > start:
+            yield start, text[start:end]
+            start = paragraph_start
+        while paragraph_end - start > chunk_chars:
+            yield start, text[start:start + chunk_chars]
+            start += chunk_chars
+        end = paragraph_end
+    if end > start:
+        yield start, text[start:end]
+
+
+class DocumentIndex:
+    """
+    A TF-IDF index of the chunks of local files, stored in a directory: an inverted index of the chunk vectors in
+    NumPy files, memory-mapped when loaded, and the chunks texts and indexed files in a JSON manifest.
+    Vectors are hashed term frequencies, weighted by the inverse document frequencies on the query side only,
+    so updating some files never requires re-embedding the others. Only the non-zero terms of each chunk are stored,
+    grouped by term, so a query only reads the chunks sharing one of its terms.
+    """
+    # Chunk rows and normalized term frequencies of each term, which starts at its offset
+    ROWS_FILE = "rows.npy"
+    WEIGHTS_FILE = "weights.npy"
+    OFFSETS_FILE = "offsets.npy"
+    MANIFEST_FILE = "manifest.json"
+    # Written by older versions, holding dense vectors
+    LEGACY_FILES = ["vectors.npy"]
+    LAYOUT = "inverted"
+
+    def __init__(self, directory: str) -> None:
+        documents_settings = Settings().documents
+        self.directory: str = directory
+        self.extensions: List[str] = documents_settings.extensions
+        self.chunk_chars: int = documents_settings.chunk_chars
+        self.max_file_bytes: int = documents_settings.max_file_bytes
+        self.logger = get_logger()
+        self.files: Dict[str, IndexedFile] = dict()
+        self.chunks: List[DocumentChunk] = list()
+        self.vectorizer = HashingVectorizer(documents_settings.dimensions)
+        self.rows: np.ndarray = np.zeros(0, dtype=np.int32)
+        self.weights: np.ndarray = np.zeros(0, dtype=np.float16)
+        self.offsets: np.ndarray = np.zeros(self.vectorizer.dimensions + 1, dtype=np.int64)
+        self.idf: np.ndarray = np.ones(self.vectorizer.dimensions, dtype=np.float32)
+        self.loaded_mtime_ns: int | None = None
+        self._load()
+
+    def _path(self, filename: str) -> str:
+        return os.path.join(self.directory, filename)
+
+    def manifest_mtime_ns(self) -> int | None:
+        try:
+            return os.stat(self._path(self.MANIFEST_FILE)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def _load(self) -> None:
+        mtime_ns = self.manifest_mtime_ns()
+        if mtime_ns is None:
+            return
+        with open(self._path(self.MANIFEST_FILE), 'r') as f:
+            manifest = json.load(f)
+        if manifest.get('layout') != self.LAYOUT:
+            self.logger.warning('The document index was written by an older version, it will be rebuilt')
+            return
+        if manifest['dimensions'] != self.vectorizer.dimensions:
+            self.logger.warning(f'The document index has {manifest["dimensions"]} dimensions instead of {self.vectorizer.dimensions}, it will be rebuilt')
+            return
+        self.files = {path: IndexedFile(*values) for path, values in manifest['files'].items()}
+        self.chunks = [DocumentChunk(*values) for values in manifest['chunks']]
+        # Not read into memory, pages are loaded by the OS as queries touch them
+        self.rows = np.load(self._path(self.ROWS_FILE), mmap_mode='r')
+        self.weights = np.load(self._path(self.WEIGHTS_FILE), mmap_mode='r')
+        self.offsets = np.load(self._path(self.OFFSETS_FILE))
+        # A term's document frequency is the number of chunks it is stored for
+        self.idf = self._idf(np.diff(self.offsets).astype(np.float32), len(self.chunks))
+        self.loaded_mtime_ns = mtime_ns
+
+    @staticmethod
+    def _idf(document_frequencies: np.ndarray, total: int) -> np.ndarray:
+        return (np.log((total + 1) / (document_frequencies + 1)) + 1).astype(np.float32)
+
+    def _walk(self, root: str) -> Iterator[str]:
+        index_directory = os.path.abspath(self.directory)
+        for directory, subdirectories, filenames in os.walk(root):
+            subdirectories[:] = [d for d in subdirectories if not d.startswith('.') and os.path.join(directory, d) != index_directory]
+            for filename in filenames:
+                if not filename.startswith('.') and os.path.splitext(filename)[1].lower() in self.extensions:
+                    yield os.path.join(directory, filename)
+
+    def _read_chunks(self, path: str) -> List[DocumentChunk]:
+        with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+            text = f.read()
+        return [DocumentChunk(path=path, offset=offset, text=chunk.strip()) for offset, chunk in chunk_text(text, self.chunk_chars) if chunk.strip()]
+
+    def update(self, root: str) -> IndexUpdate:
+        """
+        Indexes the files under the directory, only reading those added or changed since they were last indexed,
+        and drops the files that were deleted from it. Files indexed from other directories are kept.
+        """
+        root = os.path.abspath(root)
+        stats = IndexUpdate()
+        current: Dict[str, os.stat_result] = dict()
+        for path in self._walk(root):
+            stat = os.stat(path)
+            if stat.st_size <= self.max_file_bytes:
+                current[path] = stat
+
+        kept: Dict[str, IndexedFile] = dict()
+        for path, indexed in self.files.items():
+            in_root = path.startswith(root + os.sep)
+            if not in_root or (path in current and (current[path].st_mtime_ns, current[path].st_size) == (indexed.mtime_ns, indexed.size)):
+                kept[path] = indexed
+                stats.unchanged += in_root
+            elif path in current:
+                stats.updated += 1
+            else:
+                stats.removed += 1
+        changed = [path for path in current if path not in kept]
+        stats.added = len(changed) - stats.updated
+
+        new_chunks: Dict[str, List[DocumentChunk]] = dict()
+        for path in changed:
+            try:
+                new_chunks[path] = self._read_chunks(path)
+            except OSError as e:
+                self.logger.warning(f'Failed reading {path}: {e}')
+        total_rows = sum(f.rows for f in kept.values()) + sum(len(chunks) for chunks in new_chunks.values())
+        stats.chunks = total_rows
+        if not changed and stats.removed == 0 and self.loaded_mtime_ns is not None:
+            return stats
+        self._write(kept, new_chunks, current)
+        self._load()
+        return stats
+
+    def _write(self, kept: Dict[str, IndexedFile], new_chunks: Dict[str, List[DocumentChunk]], current: Dict[str, os.stat_result]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        files: Dict[str, IndexedFile] = dict()
+        chunks: List[DocumentChunk] = list()
+        # Unchanged files are copied over as they are, without embedding them again, only moving their rows
+        new_rows = np.full(len(self.chunks), -1, dtype=np.int64)
+        row = 0
+        for path, indexed in kept.items():
+            new_rows[indexed.first_row:indexed.first_row + indexed.rows] = np.arange(row, row + indexed.rows)
+            chunks += self.chunks[indexed.first_row:indexed.first_row + indexed.rows]
+            files[path] = IndexedFile(indexed.mtime_ns, indexed.size, row, indexed.rows)
+            row += indexed.rows
+        old_terms = np.repeat(np.arange(self.vectorizer.dimensions, dtype=np.int32), np.diff(self.offsets))
+        moved_rows = new_rows[self.rows]
+        kept_entries = moved_rows >= 0
+        rows: List[np.ndarray] = [moved_rows[kept_entries]]
+        terms: List[np.ndarray] = [old_terms[kept_entries]]
+        weights: List[np.ndarray] = [np.asarray(self.weights)[kept_entries].astype(np.float32)]
+
+        for path, file_chunks in new_chunks.items():
+            for i, chunk in enumerate(file_chunks):
+                chunk_terms, frequencies = self.vectorizer.sparse_term_frequencies(chunk.text)
+                rows.append(np.full(len(chunk_terms), row + i))
+                terms.append(chunk_terms)
+                weights.append(frequencies / np.linalg.norm(frequencies) if len(frequencies) else frequencies)
+            chunks += file_chunks
+            files[path] = IndexedFile(current[path].st_mtime_ns, current[path].st_size, row, len(file_chunks))
+            row += len(file_chunks)
+
+        all_rows, all_terms, all_weights = np.concatenate(rows), np.concatenate(terms), np.concatenate(weights)
+        order = np.lexsort((all_rows, all_terms))
+        offsets = np.zeros(self.vectorizer.dimensions + 1, dtype=np.int64)
+        np.cumsum(np.bincount(all_terms, minlength=self.vectorizer.dimensions), out=offsets[1:])
+        # Chunk vectors are normalized, so their weights are within [-1, 1] where half precision loses little
+        for filename, array in [(self.ROWS_FILE, all_rows[order].astype(np.int32)), (self.WEIGHTS_FILE, all_weights[order].astype(np.float16)), (self.OFFSETS_FILE, offsets)]:
+            with open(self._path(filename + '.tmp'), 'wb') as f:
+                np.save(f, array)
+            os.replace(self._path(filename + '.tmp'), self._path(filename))
+        manifest = {
+            'layout': self.LAYOUT,
+            'dimensions': self.vectorizer.dimensions,
+            'files': {path: [f.mtime_ns, f.size, f.first_row, f.rows] for path, f in files.items()},
+            'chunks': [[c.path, c.offset, c.text] for c in chunks],
+        }
+        with open(self._path(self.MANIFEST_FILE + '.tmp'), 'w') as f:
+            json.dump(manifest, f)
+        os.replace(self._path(self.MANIFEST_FILE + '.tmp'), self._path(self.MANIFEST_FILE))
+        for filename in self.LEGACY_FILES:
+            if os.path.exists(self._path(filename)):
+                os.remove(self._path(filename))
+
+    def size_bytes(self) -> int:
+        return sum(os.path.getsize(self._path(f)) for f in [self.ROWS_FILE, self.WEIGHTS_FILE, self.OFFSETS_FILE, self.MANIFEST_FILE] if os.path.exists(self._path(f)))
+
+    def search(self, query: str, top_k: int) -> List[Tuple[DocumentChunk, float]]:
+        if not self.chunks:
+            return []
+        query_terms, frequencies = self.vectorizer.sparse_term_frequencies(query)
+        query_weights = frequencies * self.idf[query_terms]
+        norm = np.linalg.norm(query_weights)
+        if not norm:
+            return []
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        for term, weight in zip(query_terms, query_weights / norm):
+            start, end = self.offsets[term], self.offsets[term + 1]
+            # Each chunk is stored once per term, so its rows are unique
+            scores[self.rows[start:end]] += self.weights[start:end] * weight
+        top_k = min(top_k, len(scores))
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        return [(self.chunks[i], float(scores[i])) for i in top[np.argsort(-scores[top])] if scores[i] > 0]
+
+    def benchmark(self, queries: int = 200, top_k: int = 5) -> Dict[str, float]:
+        """
+        Times queries made of a few words of random chunks, and returns their latency percentiles in milliseconds
+        """
+        if not self.chunks:
+            return dict()
+        latencies: List[float] = list()
+        for chunk in random.choices(self.chunks, k=queries):
+            words = chunk.text.split()
+            start = random.randrange(max(len(words) - 5, 1))
+            query = ' '.join(words[start:start + 5])
+            query_start = time.perf_counter()
+            self.search(query, top_k)
+            latencies.append((time.perf_counter() - query_start) * 1000)
+        return {f'p{p}': float(np.percentile(latencies, p)) for p in (50, 95, 99)}
+
+
+def default_index_directory() -> str:
+    return Settings().documents.index_directory or os.path.join(data_directory(), "document_index")
+
+
+_index: DocumentIndex | None = None
+_index_lock = threading.Lock()
+
+
+def document_index() -> DocumentIndex:
+    """
+    The index searched by the tools, reloaded when it was updated since it was loaded
+    """
+    global _index
+    with _index_lock:
+        if _index is None or _index.manifest_mtime_ns() != _index.loaded_mtime_ns:
+            _index = DocumentIndex(default_index_directory())
+        return _index
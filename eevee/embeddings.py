@@ -0,0 +1,43 @@
+import re
+import zlib
+import numpy as np
+from typing import List, Tuple
+
+
+class HashingVectorizer:
+    """
+    A stateless bag-of-words embedder, hashing unigrams and bigrams into a fixed number of dimensions
+    """
+    TOKEN_PATTERN = re.compile(r'\w+')
+
+    def __init__(self, dimensions: int = 1024) -> None:
+        self.dimensions: int = dimensions
+
+    def tokenize(self, text: str) -> List[str]:
+        words = self.TOKEN_PATTERN.findall(text.lower())
+        return words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+
+    def term_frequencies(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for token in self.tokenize(text):
+            h = zlib.crc32(token.encode('utf-8'))
+            vector[h % self.dimensions] += 1. if h & 0x80000000 else -1.
+        return vector
+
+    def sparse_term_frequencies(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The non-zero dimensions of `term_frequencies`, in increasing order, and their values
+        """
+        hashes = np.fromiter((zlib.crc32(token.encode('utf-8')) for token in self.tokenize(text)), dtype=np.uint32)
+        dimensions, positions = np.unique(hashes % self.dimensions, return_inverse=True)
+        values = np.bincount(positions, weights=np.where(hashes & 0x80000000, 1., -1.), minlength=len(dimensions))
+        nonzero = values != 0
+        return dimensions[nonzero].astype(np.int32), values[nonzero].astype(np.float32)
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = self.term_frequencies(text)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_many(self, texts: List[str]) -> np.ndarray:
+        return np.stack([self.embed(text) for text in texts]) if texts else np.zeros((0, self.dimensions), dtype=np.float32)
@@ -0,0 +1,195 @@
+import re
+from typing import Any, Callable, Dict, List, TypeAlias
+
+
+Validator: TypeAlias = Callable[[Any], Any]
+
+
+class SchemaValidationError(ValueError):
+    def __init__(self, path: str, message: str) -> None:
+        super().__init__(f'{path}: {message}')
+        self.path: str = path
+
+
+_TYPE_CHECKS: Dict[str, Callable[[Any], bool]] = {
+    'string': lambda v: isinstance(v, str),
+    # Before number, so errors name integers as such
+    'integer': lambda v: (isinstance(v, int) and not isinstance(v, bool)) or (isinstance(v, float) and v.is_integer()),
+    'number': lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    'boolean': lambda v: isinstance(v, bool),
+    'null': lambda v: v is None,
+    'object': lambda v: isinstance(v, dict),
+    'array': lambda v: isinstance(v, list),
+}
+
+_NOT_COERCED = object()
+
+
+def _coerce(value: Any, type_name: str) -> Any:
+    # Models sometimes quote numbers and booleans
+    if not isinstance(value, str):
+        return _NOT_COERCED
+    try:
+        match type_name:
+            case 'number':
+                return float(value) if any(c in value for c in '.eE') else int(value)
+            case 'integer':
+                return int(value)
+            case 'boolean' if value.lower() in ('true', 'false'):
+                return value.lower() == 'true'
+    except ValueError:
+        pass
+    return _NOT_COERCED
+
+
+def _type_name(value: Any) -> str:
+    for name, check in _TYPE_CHECKS.items():
+        if check(value):
+            return name
+    return type(value).__name__
+
+
+def compile_schema(schema: Dict[str, Any], coerce: bool = False, path: str = '$') -> Validator:
+    """
+    Compiles a JSON Schema into a function validating values against it, so the schema is only walked once.
+    The function raises a `SchemaValidationError` for invalid values, and returns the value otherwise. If `coerce` is set,
+    strings holding numbers or booleans are accepted where those are expected, and the converted value is returned.
+    Supports the keywords of the types, `enum`, `const`, `anyOf`, string, number and array bounds, `properties`,
+    `required` and `additionalProperties`. Other keywords are ignored. Errors are reported relative to `path`.
+    """
+    return _compile(schema, path, coerce)
+
+
+def _compile(schema: Dict[str, Any], path: str, coerce: bool) -> Validator:
+    checks: List[Validator] = list()
+    types: List[str] = [schema['type']] if isinstance(schema.get('type'), str) else schema.get('type', [])
+
+    if types:
+        type_checks = [_TYPE_CHECKS[t] for t in types]
+        def check_type(value: Any) -> Any:
+            if any(check(value) for check in type_checks):
+                # Integral floats are integers in JSON Schema, but not for the code receiving them
+                return int(value) if isinstance(value, float) and types == ['integer'] else value
+            if coerce:
+                for t in types:
+                    coerced = _coerce(value, t)
+                    if coerced is not _NOT_COERCED:
+                        return coerced
+            raise SchemaValidationError(path, f'expected {" or ".join(types)}, got {_type_name(value)}')
+        checks.append(check_type)
+
+    if 'enum' in schema:
+        enum = schema['enum']
+        def check_enum(value: Any) -> Any:
+            if value not in enum:
+                raise SchemaValidationError(path, f'{value!r} is not one of {enum}')
+            return value
+        checks.append(check_enum)
+
+    if 'const' in schema:
+        const = schema['const']
+        def check_const(value: Any) -> Any:
+            if value != const:
+                raise SchemaValidationError(path, f'expected {const!r}')
+            return value
+        checks.append(check_const)
+
+    if 'anyOf' in schema:
+        options = [_compile(option, path, coerce) for option in schema['anyOf']]
+        def check_any_of(value: Any) -> Any:
+            errors: List[str] = list()
+            for option in options:
+                try:
+                    return option(value)
+                except SchemaValidationError as e:
+                    errors.append(str(e))
+            raise SchemaValidationError(path, f'matches none of the options ({"; ".join(errors)})')
+        checks.append(check_any_of)
+
+    checks += _string_checks(schema, path) + _number_checks(schema, path) + _array_checks(schema, path, coerce) + _object_checks(schema, path, coerce)
+
+    if len(checks) == 1:
+        return checks[0]
+    def validate(value: Any) -> Any:
+        for check in checks:
+            value = check(value)
+        return value
+    return validate
+
+
+def _string_checks(schema: Dict[str, Any], path: str) -> List[Validator]:
+    min_length, max_length = schema.get('minLength'), schema.get('maxLength')
+    pattern = re.compile(schema['pattern']) if 'pattern' in schema else None
+    if min_length is None and max_length is None and pattern is None:
+        return []
+    def check_string(value: Any) -> Any:
+        if not isinstance(value, str):
+            return value
+        if min_length is not None and len(value) < min_length:
+            raise SchemaValidationError(path, f'shorter than {min_length} characters')
+        if max_length is not None and len(value) > max_length:
+            raise SchemaValidationError(path, f'longer than {max_length} characters')
+        if pattern is not None and not pattern.search(value):
+            raise SchemaValidationError(path, f'does not match {pattern.pattern}')
+        return value
+    return [check_string]
+
+
+def _number_checks(schema: Dict[str, Any], path: str) -> List[Validator]:
+    minimum, maximum, exclusive_minimum, exclusive_maximum = [schema.get(k) for k in ('minimum', 'maximum', 'exclusiveMinimum', 'exclusiveMaximum')]
+    if minimum is None and maximum is None and exclusive_minimum is None and exclusive_maximum is None:
+        return []
+    def check_number(value: Any) -> Any:
+        if not _TYPE_CHECKS['number'](value):
+            return value
+        if minimum is not None and value < minimum:
+            raise SchemaValidationError(path, f'less than {minimum}')
+        if maximum is not None and value > maximum:
+            raise SchemaValidationError(path, f'greater than {maximum}')
+        if exclusive_minimum is not None and value <= exclusive_minimum:
+            raise SchemaValidationError(path, f'not greater than {exclusive_minimum}')
+        if exclusive_maximum is not None and value >= exclusive_maximum:
+            raise SchemaValidationError(path, f'not less than {exclusive_maximum}')
+        return value
+    return [check_number]
+
+
+def _array_checks(schema: Dict[str, Any], path: str, coerce: bool) -> List[Validator]:
+    items = _compile(schema['items'], f'{path}[]', coerce) if isinstance(schema.get('items'), dict) else None
+    min_items, max_items = schema.get('minItems'), schema.get('maxItems')
+    if items is None and min_items is None and max_items is None:
+        return []
+    def check_array(value: Any) -> Any:
+        if not isinstance(value, list):
+            return value
+        if min_items is not None and len(value) < min_items:
+            raise SchemaValidationError(path, f'fewer than {min_items} items')
+        if max_items is not None and len(value) > max_items:
+            raise SchemaValidationError(path, f'more than {max_items} items')
+        return [items(item) for item in value] if items is not None else value
+    return [check_array]
+
+
+def _object_checks(schema: Dict[str, Any], path: str, coerce: bool) -> List[Validator]:
+    properties = {name: _compile(s, f'{path}.{name}', coerce) for name, s in schema.get('properties', {}).items()}
+    required: List[str] = schema.get('required', [])
+    additional = schema.get('additionalProperties', True)
+    additional_validator = _compile(additional, f'{path}.*', coerce) if isinstance(additional, dict) else None
+    if not properties and not required and additional is True:
+        return []
+    def check_object(value: Any) -> Any:
+        if not isinstance(value, dict):
+            return value
+        missing = [name for name in required if name not in value]
+        if missing:
+            raise SchemaValidationError(path, f'missing required {", ".join(missing)}')
+        validated = dict()
+        for name, item in value.items():
+            if name in properties:
+                validated[name] = properties[name](item)
+            elif additional is False:
+                raise SchemaValidationError(path, f'unexpected property {name}')
+            else:
+                validated[name] = additional_validator(item) if additional_validator is not None else item
+        return validated
+    return [check_object]
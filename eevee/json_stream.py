@@ -0,0 +1,282 @@
+import io
+import re
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+from .json_schema import compile_schema, Validator, SchemaValidationError
+
+
+class InvalidJsonStream(ValueError):
+    """
+    Raised as soon as a streamed answer can no longer be valid JSON, or one of its values breaks the schema
+    """
+
+
+_WHITESPACE = frozenset(' \t\n\r')
+_NUMBER = re.compile(r'-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?')
+_NUMBER_CHARS = frozenset('0123456789+-.eE')
+_LITERALS = {'t': 'true', 'f': 'false', 'n': 'null'}
+_ESCAPES = frozenset('"\\/bfnrtu')
+_HEX = frozenset('0123456789abcdefABCDEF')
+# Characters of a string which need no attention
+_STRING_RUN = re.compile(r'[^"\\\x00-\x1f]*')
+# The JSON Schema types a value may have, by its first character
+_TYPES_BY_FIRST_CHAR = {'{': ('object',), '[': ('array',), '"': ('string',), 't': ('boolean',), 'f': ('boolean',), 'n': ('null',)}
+_NUMBER_TYPES = ('number', 'integer')
+
+
+@dataclass(slots=True)
+class _Container:
+    closing: str
+    schema: Dict[str, Any] | None
+    path: str
+    start: int
+    items: int = 0
+    key: str | None = None
+
+
+class JsonStreamValidator:
+    """
+    Parses a JSON answer incrementally as it is streamed, so an answer which can't be valid JSON is noticed at its
+    first invalid character rather than once it is complete. With a JSON Schema, the type of each value is checked
+    as it starts, unexpected properties and extra array items as they appear, and each value against its part of the
+    schema once complete. A Markdown code fence around the JSON, which some models add, is accepted.
+    """
+    def __init__(self, schema: Dict[str, Any] | None = None) -> None:
+        self.schema: Dict[str, Any] | None = schema or None
+        self._validators: Dict[Tuple[int, str], Validator] = dict()
+        if self.schema is not None:
+            try:
+                self._validator(self.schema, '$')
+            except (KeyError, TypeError, AttributeError, re.error) as e:
+                raise ValueError(f'Invalid JSON Schema: {e}') from e
+        # The whole answer, which values are read back from as they end
+        self._buffer = io.StringIO()
+        self._length: int = 0
+        self._state: str = 'preamble'
+        self._stack: List[_Container] = list()
+        # Start, schema and path of the scalar being parsed
+        self._value: Tuple[int, Dict[str, Any] | None, str] = (0, None, '$')
+        self._string_is_key: bool = False
+        self._escape: int = 0
+        self._literal: str = ''
+        self._root: Tuple[int, int] | None = None
+
+    @property
+    def started(self) -> bool:
+        return self._state not in ('preamble', 'fence')
+
+    @property
+    def complete(self) -> bool:
+        return self._root is not None
+
+    def feed(self, text: str) -> None:
+        offset = self._length
+        self._buffer.seek(offset)
+        self._buffer.write(text)
+        self._length += len(text)
+        i = 0
+        while i < len(text):
+            i = self._step(text, i, offset)
+
+    def finish(self) -> Any:
+        """
+        Returns the parsed answer, once the stream has ended
+        """
+        if self._state == 'number':
+            self._end_number(self._length)
+        if self._root is None:
+            raise InvalidJsonStream('the answer ended before its JSON was complete' if self.started else 'the answer has no JSON')
+        return json.loads(self._text(*self._root))
+
+    def _text(self, start: int, end: int) -> str:
+        # Only the value is copied, rather than the whole answer each time it has grown
+        self._buffer.seek(start)
+        return self._buffer.read(end - start)
+
+    def _validator(self, schema: Dict[str, Any], path: str) -> Validator:
+        key = (id(schema), path)
+        if key not in self._validators:
+            self._validators[key] = compile_schema(schema, path=path)
+        return self._validators[key]
+
+    def _unexpected(self, char: str, position: int) -> InvalidJsonStream:
+        return InvalidJsonStream(f'unexpected {char!r} at character {position}')
+
+    def _step(self, text: str, i: int, offset: int) -> int:
+        """
+        Consumes the text from index `i` in the current state, and returns the index to continue from
+        """
+        char = text[i]
+        position = offset + i
+        state = self._state
+
+        if state == 'string':
+            if self._escape == 1:
+                if char not in _ESCAPES:
+                    raise InvalidJsonStream(f'invalid escape \\{char} at character {position}')
+                self._escape = 5 if char == 'u' else 0
+                return i + 1
+            if self._escape:
+                if char not in _HEX:
+                    raise InvalidJsonStream(f'invalid unicode escape at character {position}')
+                self._escape -= 1
+                self._escape = 0 if self._escape == 1 else self._escape
+                return i + 1
+            run_end = _STRING_RUN.match(text, i).end()  # type: ignore
+            if run_end > i:
+                return run_end
+            if char == '\\':
+                self._escape = 1
+            elif char == '"':
+                self._end_string(position + 1)
+            else:
+                raise InvalidJsonStream(f'unescaped control character in a string at character {position}')
+            return i + 1
+
+        if state == 'number':
+            if char in _NUMBER_CHARS:
+                return i + 1
+            self._end_number(position)
+            return i  # the character is read again after the number
+
+        if state == 'literal':
+            if char != self._literal[0]:
+                raise self._unexpected(char, position)
+            self._literal = self._literal[1:]
+            if not self._literal:
+                self._end_value(position + 1)
+            return i + 1
+
+        if state == 'fence':
+            # The rest of the fence's line holds its language
+            newline = text.find('\n', i)
+            if newline == -1:
+                return len(text)
+            self._state = 'preamble'
+            return newline + 1
+
+        if char in _WHITESPACE:
+            return i + 1
+
+        if state == 'preamble':
+            if char == '`':
+                self._state = 'fence'
+            else:
+                self._start_value(char, position, *self._slot())
+            return i + 1
+        if state == 'done':
+            if char != '`':
+                raise InvalidJsonStream(f'unexpected {char!r} after the JSON at character {position}')
+            return i + 1
+
+        container = self._stack[-1] if self._stack else None
+        if state in ('key_or_end', 'value_or_end') and container is not None and char == container.closing:
+            self._close(position)
+        elif state in ('key_or_end', 'key'):
+            if char != '"':
+                raise self._unexpected(char, position)
+            self._string_is_key = True
+            self._value = (position, None, '')
+            self._state = 'string'
+        elif state == 'colon':
+            if char != ':':
+                raise self._unexpected(char, position)
+            self._state = 'value'
+        elif state in ('value', 'value_or_end'):
+            self._start_value(char, position, *self._slot())
+        elif state == 'after_value' and container is not None:
+            if char == container.closing:
+                self._close(position)
+            elif char == ',':
+                self._state = 'key' if container.closing == '}' else 'value'
+            else:
+                raise self._unexpected(char, position)
+        else:
+            raise self._unexpected(char, position)
+        return i + 1
+
+    def _slot(self) -> Tuple[Dict[str, Any] | None, str]:
+        """
+        Returns the schema and path of the next value
+        """
+        if not self._stack:
+            return self.schema, '$'
+        container = self._stack[-1]
+        schema = container.schema
+        if container.closing == ']':
+            container.items += 1
+            path = f'{container.path}[]'
+            if schema is None:
+                return None, path
+            max_items = schema.get('maxItems')
+            if max_items is not None and container.items > max_items:
+                raise InvalidJsonStream(f'{container.path}: more than {max_items} items')
+            items = schema.get('items')
+            return (items if isinstance(items, dict) else None), path
+        path = f'{container.path}.{container.key}'
+        if schema is None:
+            return None, path
+        properties = schema.get('properties', {})
+        if container.key in properties:
+            return properties[container.key], path
+        additional = schema.get('additionalProperties', True)
+        return (additional if isinstance(additional, dict) else None), path
+
+    def _start_value(self, char: str, position: int, schema: Dict[str, Any] | None, path: str) -> None:
+        types = _TYPES_BY_FIRST_CHAR.get(char, _NUMBER_TYPES if char == '-' or char.isdigit() else None)
+        if types is None:
+            raise self._unexpected(char, position)
+        expected = schema.get('type') if schema is not None else None
+        if expected:
+            expected = [expected] if isinstance(expected, str) else expected
+            if not any(t in expected for t in types):
+                raise InvalidJsonStream(f'{path}: expected {" or ".join(expected)}, got {types[0]}')
+        if char in '{[':
+            self._stack.append(_Container(closing='}' if char == '{' else ']', schema=schema, path=path, start=position))
+            self._state = 'key_or_end' if char == '{' else 'value_or_end'
+            return
+        self._value = (position, schema, path)
+        if char == '"':
+            self._string_is_key = False
+            self._state = 'string'
+        elif char in _LITERALS:
+            self._literal = _LITERALS[char][1:]
+            self._state = 'literal'
+        else:
+            self._state = 'number'
+
+    def _end_string(self, end: int) -> None:
+        if not self._string_is_key:
+            self._end_value(end)
+            return
+        container = self._stack[-1]
+        container.key = json.loads(self._text(self._value[0], end))
+        schema = container.schema
+        if schema is not None and schema.get('additionalProperties', True) is False and container.key not in schema.get('properties', {}):
+            raise InvalidJsonStream(f'{container.path}: unexpected property {container.key}')
+        self._state = 'colon'
+
+    def _end_number(self, end: int) -> None:
+        start = self._value[0]
+        if not _NUMBER.fullmatch(self._text(start, end)):
+            raise InvalidJsonStream(f'invalid number {self._text(start, end)!r} at character {start}')
+        self._end_value(end)
+
+    def _close(self, position: int) -> None:
+        container = self._stack.pop()
+        self._value = (container.start, container.schema, container.path)
+        self._end_value(position + 1)
+
+    def _end_value(self, end: int) -> None:
+        start, schema, path = self._value
+        if schema:
+            try:
+                self._validator(schema, path)(json.loads(self._text(start, end)))
+            except SchemaValidationError as e:
+                raise InvalidJsonStream(str(e)) from e
+        if self._stack:
+            self._state = 'after_value'
+        else:
+            self._root = (start, end)
+            self._state = 'done'
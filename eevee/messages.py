@@ -1,51 +1,149 @@
 import json
-from typing import List, Dict, Any
-from dataclasses import dataclass, asdict
+from typing import List, Dict, Any, ClassVar
+from dataclasses import dataclass
 from mistralai.models.chat_completion import ChatMessage as MistralChatMessage, ToolCall as MistralToolCall, FunctionCall as MistralFunctionCall
+from .blob_store import BlobStore
 from ._types import Role, Framework
 
 
-@dataclass
+@dataclass(slots=True)
 class ToolCall:
     call_id: str
     function: str
     arguments: Dict[str, Any]
     
-    as_dict = asdict
+    def as_dict(self) -> Dict[str, Any]:
+        return {'call_id': self.call_id, 'function': self.function, 'arguments': self.arguments}
+
+
+@dataclass(slots=True)
+class Usage:
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    # The part of the prompt tokens read from the provider's prompt cache
+    cached_tokens: int = 0
+
+    def __add__(self, other: 'Usage') -> 'Usage':
+        return Usage(
+            prompt_tokens=self.prompt_tokens + other.prompt_tokens,
+            completion_tokens=self.completion_tokens + other.completion_tokens,
+            cached_tokens=self.cached_tokens + other.cached_tokens
+        )
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
 
+    def as_dict(self) -> Dict[str, int]:
+        return {'prompt_tokens': self.prompt_tokens, 'completion_tokens': self.completion_tokens, 'cached_tokens': self.cached_tokens}
 
-@dataclass
+    @classmethod
+    def from_dict(cls, usage_as_dict: Dict[str, int]):
+        return cls(
+            prompt_tokens=usage_as_dict.get('prompt_tokens', 0),
+            completion_tokens=usage_as_dict.get('completion_tokens', 0),
+            cached_tokens=usage_as_dict.get('cached_tokens', 0)
+        )
+
+
+@dataclass(slots=True)
 class ChatMessagePiece:
     content: str | None = None
     info_message: str | None = None
     warning_message: str | None = None
     model: str | None = None
     tool_calls: List[ToolCall] | None = None
+    # Tokens used by the request, reported by the provider once the response is complete
+    usage: Usage | None = None
+    # The content streamed so far for the current answer is to be dropped, as the answer is being generated again
+    discard: bool = False
 
-    as_dict = asdict
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'content': self.content,
+            'info_message': self.info_message,
+            'warning_message': self.warning_message,
+            'model': self.model,
+            'tool_calls': [t.as_dict() for t in self.tool_calls] if self.tool_calls is not None else None,
+            'usage': self.usage.as_dict() if self.usage is not None else None,
+            'discard': self.discard
+        }
 
 
 class Message:
-    def __init__(self, role: Role, content: str | None = None, tool_calls: List[ToolCall] = [], *, model: str | None = None) -> None:
+    __slots__ = ('role', '_content', 'content_ref', 'tool_calls', 'model', 'truncated', 'usage', '_payloads')
+
+    # Tool outputs longer than the threshold are kept in the blob store, and only loaded when read
+    blob_store: ClassVar[BlobStore | None] = None
+    spill_threshold: ClassVar[int] = 0
+
+    def __init__(self, role: Role, content: str | None = None, tool_calls: List[ToolCall] | None = None, *, model: str | None = None, content_ref: str | None = None, truncated: bool = False, usage: Usage | None = None) -> None:
         if role == 'assistant' and not model:
             raise ValueError('AI generated messages must be provided with model name')
         self.role: Role = role
-        self.content: str | None = content
-        self.tool_calls: List[ToolCall] = tool_calls
+        # Provider payloads of the message, shared by all branches the message is part of
+        self._payloads: Dict[Framework, Any] | None = None
+        self._content: str | None = None
+        self.content_ref: str | None = None
+        self.content = content
+        if content is None and content_ref is not None:
+            self.content_ref = content_ref
+        self.tool_calls: List[ToolCall] = tool_calls or []
         self.model: str | None = model
+        # Set when the generation was cancelled before the message was complete
+        self.truncated: bool = truncated
+        # Tokens used to generate the message, summed over all requests it took
+        self.usage: Usage | None = usage
+
+    @classmethod
+    def configure_spilling(cls, blob_store: BlobStore | None, threshold: int) -> None:
+        cls.blob_store = blob_store
+        cls.spill_threshold = threshold
+
+    @property
+    def content(self) -> str | None:
+        if self._content is None and self.content_ref is not None:
+            if self.blob_store is None:
+                raise RuntimeError(f'Message content is stored in blob {self.content_ref}, but no blob store is configured')
+            return self.blob_store.get(self.content_ref)
+        return self._content
+
+    @content.setter
+    def content(self, content: str | None) -> None:
+        self._payloads = None
+        if content is not None and self.role == 'tool' and self.blob_store is not None and 0 < self.spill_threshold < len(content):
+            self.content_ref = self.blob_store.put(content)
+            self._content = None
+        else:
+            self._content = content
+            self.content_ref = None
     
     def __str__(self) -> str:
         return f"{{ role: {self.role}, content: '{self.content or ''}', tool_calls: [{', '.join([str(t) for t in self.tool_calls])}]}}"
     
-    def as_dict(self) -> Dict[str, Any]:
-        dct = {
-            'role': self.role,
-            'content': self.content
-        }
+    def as_dict(self, blob_store: BlobStore | None = None) -> Dict[str, Any]:
+        """
+        If a blob store is provided, tool outputs are saved to it and only referenced
+        """
+        if blob_store is not None and self.role == 'tool' and (self.content_ref or self._content is not None):
+            dct = {
+                'role': self.role,
+                'content': None,
+                'content_ref': self.content_ref or blob_store.put(self._content)  # type: ignore
+            }
+        else:
+            dct = {
+                'role': self.role,
+                'content': self.content
+            }
         if self.tool_calls:
             dct['tool_calls'] = [t.as_dict() for t in self.tool_calls]
         if self.model:
             dct['model'] = self.model
+        if self.truncated:
+            dct['truncated'] = True
+        if self.usage is not None:
+            dct['usage'] = self.usage.as_dict()
         return dct
     
     @property
@@ -60,14 +158,26 @@ class Message:
             self.content = (self.content or '') + content
         if tool_calls:
             self.tool_calls = (self.tool_calls or []) + tool_calls
+            self._payloads = None
 
     def edit(self, content: str | None = None, tool_calls: List[ToolCall] | None = None) -> None:
         if content:
             self.content = content
         if tool_calls:
             self.tool_calls = tool_calls
+            self._payloads = None
     
     def to(self, framework: Framework):
+        # Spilled contents aren't cached, as that would keep them in memory
+        if self.content_ref is not None:
+            return self._to(framework)
+        if self._payloads is None:
+            self._payloads = dict()
+        if framework not in self._payloads:
+            self._payloads[framework] = self._to(framework)
+        return self._payloads[framework]
+
+    def _to(self, framework: Framework):
         match framework:
             case 'openai' | 'deepseek':
                 if self.role == 'tool':
@@ -151,12 +261,15 @@ class Messages(list[Message]):
                             arguments=tool_call['arguments']
                         )
                     )
-            messages.append(
-                role=message['role'],
-                content=message['content'],
+            messages.extend([Message(
+                message['role'],
+                message['content'],
                 tool_calls=tool_calls,
-                model=message.get('model', None)
-            )
+                model=message.get('model', None),
+                content_ref=message.get('content_ref', None),
+                truncated=message.get('truncated', False),
+                usage=Usage.from_dict(message['usage']) if message.get('usage') else None
+            )])
         return messages
 
     @property
@@ -179,10 +292,10 @@ class Messages(list[Message]):
         else:
             return None
     
-    def as_dict(self) -> List[Dict[str, Any]]:
-        return [m.as_dict() for m in self]
+    def as_dict(self, blob_store: BlobStore | None = None) -> List[Dict[str, Any]]:
+        return [m.as_dict(blob_store) for m in self]
 
-    def append(self, role: Role, content: str | None, tool_calls: List[ToolCall] = [], model: str | None = None) -> None:
+    def append(self, role: Role, content: str | None, tool_calls: List[ToolCall] | None = None, model: str | None = None) -> None:
         super().append(Message(role, content, tool_calls=tool_calls, model=model))
     
     def to(self, framework: Framework):
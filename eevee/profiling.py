@@ -0,0 +1,121 @@
+import os
+import re
+import sys
+import inspect
+import threading
+from collections import Counter
+from functools import wraps
+from contextlib import contextmanager
+from types import FrameType
+from typing import Dict, List, Any, Callable, Iterator
+from .color_logger import get_logger
+
+
+# Innermost frames of threads waiting for work, which are left out unless the thread is handling an event
+_IDLE_FRAMES = {
+    ('threading.py', 'wait'), ('threading.py', '_wait_for_tstate_lock'), ('queue.py', 'get'),
+    ('selectors.py', 'select'), ('base_events.py', '_run_once'), ('connection.py', 'poll'), ('socket.py', 'accept'),
+}
+
+# Threads of the same pool are counted together
+_NUMBERING = re.compile(r'[-_]?\d+')
+
+
+class EventProfiler:
+    """
+    Samples the stacks of all threads at a fixed interval, attributing the samples of threads handling a UI event
+    to that event, and those of other threads (tools, streams, the server) to the thread's name.
+    Samples are written in the folded stacks format, one stack and its count per line, with the event or thread as
+    the root frame, which flame graph tools (flamegraph.pl, inferno, speedscope) read as is.
+    Since all threads are sampled, time spent waiting (for a provider, a tool or a lock) shows up as well.
+    """
+    def __init__(self, output_path: str, interval_seconds: float = 0.005) -> None:
+        self.output_path: str = output_path
+        self.interval_seconds: float = interval_seconds
+        self.logger = get_logger()
+        self._stacks: Counter[str] = Counter()
+        self._event_samples: Counter[str] = Counter()
+        self._events: Dict[int, str] = dict()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='profiler', daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+        self.write()
+
+    def wrap(self, function: Callable[..., Any], event: str) -> Callable[..., Any]:
+        """
+        Marks the calls of an event's handler, so the samples of the thread running it are attributed to the event.
+        Generators are marked on each step, since each may run on another thread.
+        """
+        if inspect.isgeneratorfunction(function):
+            @wraps(function)
+            def generator_wrapper(*args, **kwargs):
+                generator = function(*args, **kwargs)
+                try:
+                    while True:
+                        with self._marked(event):
+                            try:
+                                item = next(generator)
+                            except StopIteration:
+                                return
+                        yield item
+                finally:
+                    generator.close()
+            return generator_wrapper
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with self._marked(event):
+                return function(*args, **kwargs)
+        return wrapper
+
+    @contextmanager
+    def _marked(self, event: str) -> Iterator[None]:
+        thread_id = threading.get_ident()
+        previous = self._events.get(thread_id, None)
+        self._events[thread_id] = event
+        try:
+            yield
+        finally:
+            if previous is None:
+                self._events.pop(thread_id, None)
+            else:
+                self._events[thread_id] = previous
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stopped.wait(self.interval_seconds):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                event = self._events.get(thread_id, None)
+                if event is None and (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in _IDLE_FRAMES:
+                    continue
+                root = f'event:{event}' if event is not None else 'thread:' + _NUMBERING.sub('', names.get(thread_id, str(thread_id)))
+                self._stacks[';'.join([root] + self._frames(frame))] += 1
+                if event is not None:
+                    self._event_samples[event] += 1
+
+    @staticmethod
+    def _frames(frame: FrameType | None) -> List[str]:
+        frames: List[str] = list()
+        while frame is not None:
+            frames.append(f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_qualname}".replace(';', ','))
+            frame = frame.f_back
+        return frames[::-1]
+
+    def write(self) -> None:
+        with open(self.output_path, 'w') as f:
+            for stack, count in sorted(self._stacks.items()):
+                f.write(f'{stack} {count}\n')
+        total = sum(self._event_samples.values())
+        summary = ', '.join(f'{event} {count * self.interval_seconds:.1f}s' for event, count in self._event_samples.most_common(10))
+        self.logger.info(f'Wrote {sum(self._stacks.values())} profile samples to {self.output_path}. '
+                         f'Sampled time per event ({total * self.interval_seconds:.1f}s in total): {summary or "none"}')
+
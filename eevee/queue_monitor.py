@@ -0,0 +1,99 @@
+import time
+import threading
+import numpy as np
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple, Any
+from .color_logger import get_logger
+
+
+@dataclass(slots=True)
+class PoolStats:
+    max_waiting: int = 0
+    max_running: int = 0
+    limit: int | None = None
+    # Seconds waited by the events which left the queue
+    waits: List[float] = field(default_factory=list)
+
+
+class QueueMonitor:
+    """
+    Samples the UI's event queue, and periodically logs, per concurrency pool, the most events that waited and ran at once,
+    and how long events waited before running. Waits are measured from the samples, so they are accurate up to the sampling interval.
+    """
+    def __init__(self, blocks: Any, report_interval_seconds: float, sample_interval_seconds: float = 0.25) -> None:
+        self.blocks = blocks
+        self.report_interval_seconds: float = report_interval_seconds
+        self.sample_interval_seconds: float = sample_interval_seconds
+        self.logger = get_logger()
+        self._pool_names: Dict[str, str] = self._names_of_pools(blocks)
+        # Pool and first sample of each waiting event
+        self._waiting: Dict[str, Tuple[str, float]] = dict()
+        self._stats: Dict[str, PoolStats] = dict()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='queue-monitor', daemon=True)
+
+    @staticmethod
+    def _names_of_pools(blocks: Any) -> Dict[str, str]:
+        names: Dict[str, List[str]] = dict()
+        for fn in getattr(blocks, 'fns', []):
+            name = getattr(fn, 'name', None)
+            if name and name != '<lambda>':
+                names.setdefault(str(fn.concurrency_id), [])
+                if name not in names[str(fn.concurrency_id)]:
+                    names[str(fn.concurrency_id)].append(name)
+        return {pool: '/'.join(pool_names) for pool, pool_names in names.items()}
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+        self.report()
+
+    def _run(self) -> None:
+        last_report = time.monotonic()
+        while not self._stopped.wait(self.sample_interval_seconds):
+            self._sample()
+            if time.monotonic() - last_report >= self.report_interval_seconds:
+                self.report()
+                last_report = time.monotonic()
+
+    def _sample(self) -> None:
+        queue = getattr(self.blocks, '_queue', None)
+        if queue is None:
+            return
+        now = time.monotonic()
+        waiting: Dict[str, str] = dict()
+        with self._lock:
+            for pool, event_queue in list(queue.event_queue_per_concurrency_id.items()):
+                stats = self._stats.setdefault(str(pool), PoolStats())
+                events = list(event_queue.queue)
+                waiting.update({event._id: str(pool) for event in events})
+                stats.max_waiting = max(stats.max_waiting, len(events))
+                stats.max_running = max(stats.max_running, event_queue.current_concurrency)
+                stats.limit = event_queue.concurrency_limit
+            for event_id in list(self._waiting.keys()):
+                if event_id not in waiting:
+                    pool, first_seen = self._waiting.pop(event_id)
+                    self._stats.setdefault(pool, PoolStats()).waits.append(now - first_seen)
+            for event_id, pool in waiting.items():
+                self._waiting.setdefault(event_id, (pool, now))
+
+    def report(self) -> None:
+        """
+        Logs the pools that were used since the last report, and starts counting again
+        """
+        with self._lock:
+            stats, self._stats = self._stats, dict()
+        lines: List[str] = list()
+        for pool, pool_stats in stats.items():
+            if not pool_stats.waits and not pool_stats.max_waiting and not pool_stats.max_running:
+                continue
+            waits = np.array(pool_stats.waits) if pool_stats.waits else np.zeros(1)
+            lines.append(f'{self._pool_names.get(pool, pool)}: up to {pool_stats.max_waiting} waiting and '
+                         f'{pool_stats.max_running}/{pool_stats.limit or "∞"} running, {len(pool_stats.waits)} waited '
+                         f'p50 {np.percentile(waits, 50):.2f}s, p95 {np.percentile(waits, 95):.2f}s, max {waits.max():.2f}s')
+        if lines:
+            self.logger.info('UI queue:\n' + '\n'.join(lines))
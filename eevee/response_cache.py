@@ -0,0 +1,107 @@
+import os
+import json
+import tempfile
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any
+from .color_logger import get_logger
+
+
+class ResponseCache:
+    """
+    An exact-match cache of complete responses, kept in memory as an LRU and optionally also on disk.
+    The disk holds up to `max_entries` responses as well, evicting the oldest written ones, and expired ones are
+    deleted as responses are added.
+    """
+    FILE_SUFFIX = ".json"
+    TEMP_SUFFIX = ".tmp"
+
+    def __init__(self, directory: str | None, max_entries: int, ttl_seconds: float = 0) -> None:
+        self._directory: str | None = directory
+        self._max_entries: int = max_entries
+        self._ttl_seconds: float = ttl_seconds
+        self._entries: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        if self._directory and not os.path.exists(self._directory):
+            os.makedirs(self._directory)
+
+    @staticmethod
+    def key(**request: Any) -> str:
+        serialized = json.dumps(request, sort_keys=True, ensure_ascii=False, default=lambda o: o.model_dump() if hasattr(o, 'model_dump') else str(o))
+        return hashlib.sha256(serialized.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self._directory, key + self.FILE_SUFFIX)  # type: ignore
+
+    def _expired(self, entry: Dict[str, Any]) -> bool:
+        return bool(self._ttl_seconds) and time.time() - entry['created'] > self._ttl_seconds
+
+    def get(self, key: str) -> List[Dict[str, Any]] | None:
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is None and self._directory:
+            try:
+                with open(self._path(key), 'r') as f:
+                    entry = json.load(f)
+            except FileNotFoundError:
+                return None
+            except Exception as e:
+                get_logger().warning(f'Failed reading cached response {key}: {e}')
+                return None
+            self._remember(key, entry)  # type: ignore
+        if entry is None:
+            return None
+        if self._expired(entry):
+            self.delete(key)
+            return None
+        return entry['messages']
+
+    def put(self, key: str, messages: List[Dict[str, Any]]) -> None:
+        entry = {'created': time.time(), 'messages': messages}
+        self._remember(key, entry)
+        if self._directory:
+            self._write(key, entry)
+            self._evict_from_disk()
+
+    def _write(self, key: str, entry: Dict[str, Any]) -> None:
+        # Written to a temporary file first, so a crash never leaves a partially written response behind
+        fd, temp_path = tempfile.mkstemp(dir=self._directory, prefix='.', suffix=self.TEMP_SUFFIX)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(entry, f)
+            os.replace(temp_path, self._path(key))
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def _evict_from_disk(self) -> None:
+        files: List[os.DirEntry] = [f for f in os.scandir(self._directory) if f.name.endswith(self.FILE_SUFFIX)]  # type: ignore
+        files.sort(key=lambda f: f.stat().st_mtime)
+        now = time.time()
+        expired = [f for f in files if self._ttl_seconds and now - f.stat().st_mtime > self._ttl_seconds]
+        oldest = files[len(expired):max(len(files) - self._max_entries, len(expired))]
+        for f in expired + oldest:
+            try:
+                os.remove(f.path)
+            except FileNotFoundError:
+                pass  # evicted by another process sharing the directory
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+        if self._directory:
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def _remember(self, key: str, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
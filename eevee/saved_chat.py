@@ -1,11 +1,15 @@
-import os
 import json
 from datetime import datetime
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, Tuple, Set, List
 from .messages import Messages
+from .blob_store import BlobStore
+from .conversation_tree import ConversationTree
+from .storage_backends.storage_interface import StorageBackend
 
 
 class SavedChat:
+    NAMESPACE = "saved_chats"
+    INDEX_NAMESPACE = "saved_chats/index"
     FILE_PREFIX = "chat_"
     FILE_SUFFIX = ".json"
     TIME_FORMAT = "%Y-%m-%d-%H-%M-%S"
@@ -14,48 +18,102 @@ class SavedChat:
     def __init__(self, 
                  messages: Messages, 
                  start_time: datetime, 
-                 directory: str, 
+                 storage: StorageBackend, 
                  title: str | None = None,
+                 tree: ConversationTree | None = None,
                  **metadata
                  ) -> None:
         self._messages: Messages = messages
+        self._tree: ConversationTree | None = tree
         self._start_time: datetime = start_time
         self._title: str = title or self._create_title()
-        self._path: str = os.path.join(directory, self.title_and_time_to_filename(self._title, self._start_time))
+        self._storage: StorageBackend = storage
+        self._key: str = self.title_and_time_to_filename(self._title, self._start_time)
         self._metadata: Dict[str, Any] = metadata
+        # When only the latest messages were loaded, this is the index of the first of them
+        self.first_message_index: int = 0
+        self._index: Dict[str, Any] | None = None
 
     @classmethod
-    def from_chat_file(cls, file_path: str):
+    def from_chat_file(cls, file_path: str, storage: StorageBackend):
         with open(file_path, 'r') as f:
             loaded_file: Dict[str, Any] = json.load(f)
-        messages = Messages.from_dict(loaded_file['messages'])
+        title, start_time = cls.filename_to_title_and_time(file_path.split('/')[-1])
+        return cls._from_loaded_file(loaded_file, title, start_time, storage)
+
+    @classmethod
+    def _from_loaded_file(cls, loaded_file: Dict[str, Any], title: str, start_time: datetime, storage: StorageBackend):
+        tree = ConversationTree.from_dict(loaded_file['messages'], loaded_file.get('active', None))
         metadata = loaded_file.get('metadata', {})
-        pieces = file_path.split('/')
-        directory = '/'.join(pieces[:-1])
-        title, start_time = cls.filename_to_title_and_time(pieces[-1])
-        return cls(messages, start_time, directory, title, **metadata)
+        return cls(tree.messages(), start_time, storage, title, tree=tree, **metadata)
     
     @classmethod
-    def from_chat_title_and_time(cls, title: str, start_time: datetime, directory: str):
-        filename = cls.title_and_time_to_filename(title, start_time)
-        file_path = os.path.join(directory, filename)
-        with open(file_path, 'r') as f:
-            loaded_file: Dict[str, Any] = json.load(f)
-        messages = Messages.from_dict(loaded_file['messages'])
-        metadata = loaded_file.get('metadata', {})  
-        return cls(messages, start_time, directory, title, **metadata)
+    def from_chat_title_and_time(cls, title: str, start_time: datetime, storage: StorageBackend, last_turns: int | None = None):
+        """
+        Loads a saved chat. If `last_turns` is provided, only the messages of the latest turns are read, 
+        and older ones can be read later with `read_older_messages`. Chats with several branches are always read whole.
+        """
+        key = cls.title_and_time_to_filename(title, start_time)
+        index = cls._read_index(storage, key) if last_turns else None
+        if index is None or not index['offsets'] or index.get('branched', False):
+            data = storage.read(cls.NAMESPACE, key)
+            if data is None:
+                raise FileNotFoundError(f'No saved chat {title} from {start_time}')
+            return cls._from_loaded_file(json.loads(data), title, start_time, storage)
+        
+        turns_starts = [i for i, role in enumerate(index['roles']) if role == 'user']
+        first_message_index = turns_starts[-last_turns] if len(turns_starts) > last_turns else 0  # type: ignore
+        header = storage.read_range(cls.NAMESPACE, key, 0, index['offsets'][0][0])
+        metadata = json.loads(header + b']}').get('metadata', {})  # type: ignore
+        saved_chat = cls(Messages(), start_time, storage, title, **metadata)
+        saved_chat._index = index
+        saved_chat.first_message_index = len(index['offsets'])
+        saved_chat._messages = saved_chat.read_older_messages(len(index['offsets']) - first_message_index)
+        return saved_chat
+
+    @classmethod
+    def _read_index(cls, storage: StorageBackend, key: str) -> Dict[str, Any] | None:
+        data = storage.read(cls.INDEX_NAMESPACE, key)
+        return json.loads(data) if data is not None else None
+
+    def read_older_messages(self, count: int | None = None) -> Messages:
+        """
+        Reads up to `count` messages preceding the ones already loaded (all of them if not provided)
+        """
+        end = self.first_message_index
+        start = max(0, end - count) if count is not None else 0
+        if start >= end:
+            return Messages()
+        offsets: List[List[int]] = self._index['offsets']
+        data = self._storage.read_range(self.NAMESPACE, self.key, offsets[start][0], offsets[end-1][1])
+        self.first_message_index = start
+        return Messages.from_dict(json.loads(b'[' + data + b']'))  # type: ignore
+
+    def read_older_turns(self, turns: int | None = None) -> Messages:
+        """
+        Reads up to `turns` turns preceding the messages already loaded (all of them if not provided)
+        """
+        if turns is None:
+            return self.read_older_messages()
+        turns_starts = [i for i, role in enumerate(self._index['roles'][:self.first_message_index]) if role == 'user']
+        start = turns_starts[-turns] if len(turns_starts) >= turns else 0
+        return self.read_older_messages(self.first_message_index - start)
     
     @property
     def messages(self) -> Messages:
         return self._messages
+
+    @property
+    def tree(self) -> ConversationTree:
+        return self._tree or ConversationTree.from_messages(self._messages)
     
     @property
     def start_time(self) -> datetime:
         return self._start_time
     
     @property
-    def path(self) -> str:
-        return self._path
+    def key(self) -> str:
+        return self._key
     
     @property
     def title(self) -> str:
@@ -65,6 +123,21 @@ class SavedChat:
     def title_and_time_to_filename(cls, title: str, start_time: datetime) -> str:
         return cls.FILE_PREFIX + title.replace(' ', '_') + '_' + start_time.strftime(cls.TIME_FORMAT) + cls.FILE_SUFFIX
     
+    @classmethod
+    def is_chat_filename(cls, filename: str) -> bool:
+        return filename.startswith(cls.FILE_PREFIX) and filename.endswith(cls.FILE_SUFFIX)
+    
+    @classmethod
+    def delete(cls, title: str, start_time: datetime, storage: StorageBackend) -> None:
+        key = cls.title_and_time_to_filename(title, start_time)
+        storage.delete(cls.NAMESPACE, key)
+        storage.delete(cls.INDEX_NAMESPACE, key)
+
+    @classmethod
+    def referenced_blobs(cls, data: bytes) -> Set[str]:
+        loaded_file: Dict[str, Any] = json.loads(data)
+        return {m['content_ref'] for m in loaded_file.get('messages', []) if m.get('content_ref')}
+
     @classmethod
     def filename_to_title_and_time(cls, filename: str) -> Tuple[str, datetime]:
         stripped = filename[len(cls.FILE_PREFIX):-len(cls.FILE_SUFFIX)]
@@ -77,7 +150,10 @@ class SavedChat:
         return self._metadata.get(key, None)
     
     def _create_title(self) -> str:
-        first_message_content = self.messages[1].content if self.messages.system_prompt is not None else self.messages[0].content
+        # The first message of the earliest branch, so forking the first turn keeps the chat's title
+        messages = [node.message for node in self._tree.nodes] if self._tree is not None else self.messages
+        first_message = next((m for m in messages if m.role != 'system'), None)
+        first_message_content = first_message.content if first_message is not None else None
         if not first_message_content:
             title = 'untitled'
         else:  
@@ -89,11 +165,45 @@ class SavedChat:
                 title += '...'
         return title
     
-    def save_to_file(self) -> None:
-        file_as_dict = {
-            "start_time": self.start_time.strftime(self.TIME_FORMAT),
-            "messages": self.messages.as_dict(),
-            "metadata": self._metadata
-        }
-        with open(self.path, 'w') as f:
-            f.write(json.dumps(file_as_dict, indent=4))
+    def save(self) -> None:
+        """
+        Saves the chat as JSON with one message per line, along with an index of the messages offsets in the file,
+        which allows reading only some of the messages later on
+        """
+        if self.first_message_index > 0:
+            raise RuntimeError("Can't save a partially loaded chat")
+        tree = self.tree
+        data, index = self.serialize({
+            "start_time": self.start_time.strftime(self.TIME_FORMAT), 
+            "metadata": self._metadata, 
+            "active": tree.active_node if tree.active_node != len(tree.nodes) - 1 else None,
+            "messages": tree.as_dict(BlobStore(self._storage))
+        })
+        self._storage.write(self.NAMESPACE, self.key, data)
+        self._storage.write(self.INDEX_NAMESPACE, self.key, index)
+
+    @classmethod
+    def serialize(cls, chat: Dict[str, Any]) -> Tuple[bytes, bytes]:
+        """
+        Encodes a chat dictionary as it is saved, and returns it along with its index
+        """
+        header_fields = {"start_time": chat["start_time"], "metadata": chat.get("metadata", {})}
+        if chat.get("active", None) is not None:
+            header_fields["active"] = chat["active"]
+        header = json.dumps(header_fields)
+        parts: List[bytes] = [header[:-1].encode('utf-8') + b', "messages": [\n']
+        position = len(parts[0])
+        offsets: List[List[int]] = list()
+        for i, message in enumerate(chat["messages"]):
+            line = json.dumps(message).encode('utf-8')
+            if i > 0:
+                parts.append(b',\n')
+                position += 2
+            offsets.append([position, position + len(line)])
+            parts.append(line)
+            position += len(line)
+        parts.append(b'\n]}')
+        index: Dict[str, Any] = {"offsets": offsets, "roles": [m["role"] for m in chat["messages"]]}
+        if "active" in header_fields or any("parent" in m for m in chat["messages"]):
+            index["branched"] = True
+        return b''.join(parts), json.dumps(index).encode('utf-8')
@@ -0,0 +1,60 @@
+import hashlib
+import threading
+import numpy as np
+from typing import List, Dict, Any
+from .embeddings import HashingVectorizer
+from .color_logger import get_logger
+
+
+class SemanticCache:
+    """
+    A bounded in-memory index of past answers, searched by the similarity of the prompt they answered.
+    Answers are only matched within the same partition (same model, system prompt and response format).
+    """
+    def __init__(self, max_entries: int, threshold: float, dimensions: int = 1024) -> None:
+        self.threshold: float = threshold
+        self.evictions: int = 0
+        self._vectorizer = HashingVectorizer(dimensions)
+        self._vectors = np.zeros((max_entries, dimensions), dtype=np.float32)
+        self._partitions: List[str | None] = [None] * max_entries
+        self._answers: List[List[Dict[str, Any]] | None] = [None] * max_entries
+        self._last_used = np.zeros(max_entries, dtype=np.int64)
+        self._clock: int = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def partition(model: str, system_prompt: str | None, as_json: bool) -> str:
+        return hashlib.sha256(f'{model}\n{as_json}\n{system_prompt or ""}'.encode('utf-8')).hexdigest()
+
+    def _tick(self) -> int:
+        self._clock += 1
+        return self._clock
+
+    def get(self, partition: str, prompt: str) -> List[Dict[str, Any]] | None:
+        query = self._vectorizer.embed(prompt)
+        with self._lock:
+            rows = [i for i, p in enumerate(self._partitions) if p == partition]
+            if not rows:
+                return None
+            scores = self._vectors[rows] @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+            row = rows[best]
+            self._last_used[row] = self._tick()
+            get_logger().debug(f'Semantic cache hit with similarity {scores[best]:.3f}')
+            return self._answers[row]
+
+    def put(self, partition: str, prompt: str, answer: List[Dict[str, Any]]) -> None:
+        vector = self._vectorizer.embed(prompt)
+        with self._lock:
+            if None in self._partitions:
+                row = self._partitions.index(None)
+            else:
+                row = int(np.argmin(self._last_used))
+                self.evictions += 1
+                get_logger().debug(f'Semantic cache is full, evicted entry {row} (total evictions: {self.evictions})')
+            self._vectors[row] = vector
+            self._partitions[row] = partition
+            self._answers[row] = answer
+            self._last_used[row] = self._tick()
@@ -11,6 +11,10 @@ def init_settings(config_files: List[str]) -> None:
     _CONFIG_FILES_PATHS = config_files
 
 
+def config_files() -> List[str]:
+    return list(_CONFIG_FILES_PATHS)
+
+
 class Settings:
     """
     A Singleton class for settings
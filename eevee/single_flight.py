@@ -0,0 +1,90 @@
+import time
+import threading
+from concurrent.futures import Future, CancelledError, wait
+from dataclasses import dataclass, field
+from typing import Dict, Callable, TypeVar, Generic
+from .cancellation import CancellationToken
+from .color_logger import get_logger
+
+
+T = TypeVar('T')
+
+
+@dataclass(slots=True)
+class _Flight(Generic[T]):
+    future: Future = field(default_factory=Future)
+    # Cancelled once all the callers waiting for the execution were cancelled
+    token: CancellationToken = field(default_factory=CancellationToken)
+    waiters: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+
+class SingleFlight(Generic[T]):
+    """
+    Shares one execution between concurrent calls with the same key: the first call runs the function,
+    and the calls made while it runs wait for its result instead of running it again.
+    A call only joins an execution started less than `timeout` seconds ago, and waits for it up to the rest of that time.
+    """
+    def __init__(self) -> None:
+        self.shared_calls: int = 0
+        self._flights: Dict[str, _Flight[T]] = dict()
+        self._lock = threading.Lock()
+        self.logger = get_logger()
+
+    def run(self, key: str, function: Callable[[CancellationToken], T], timeout: float, cancellation_token: CancellationToken | None = None) -> T:
+        """
+        Returns the result of the function, which receives the token of the shared execution.
+        Raises `TimeoutError` if the shared execution didn't finish in time, and `CancelledError` if the call was cancelled.
+        """
+        with self._lock:
+            flight = self._flights.get(key, None)
+            if flight is None or time.monotonic() - flight.started > timeout:
+                flight = self._flights[key] = _Flight()
+                leader = True
+            else:
+                leader = False
+                self.shared_calls += 1
+            flight.waiters += 1
+
+        left = False
+        def leave() -> None:
+            nonlocal left
+            with self._lock:
+                if left:
+                    return
+                left = True
+                flight.waiters -= 1
+                abandoned = flight.waiters == 0 and not flight.future.done()
+                # Later calls start their own execution, rather than joining a cancelled one
+                if abandoned and self._flights.get(key, None) is flight:
+                    del self._flights[key]
+            if abandoned:
+                flight.token.cancel()
+
+        unregister = cancellation_token.on_cancel(leave) if cancellation_token is not None else (lambda: None)
+        try:
+            if leader:
+                return self._execute(key, flight, function)
+            self.logger.debug(f'Waiting for the in-flight execution of {key}')
+            deadline = flight.started + timeout
+            while not wait([flight.future], timeout=min(0.1, max(deadline - time.monotonic(), 0))).done:
+                if cancellation_token is not None and cancellation_token.cancelled:
+                    raise CancelledError()
+                if time.monotonic() >= deadline:
+                    raise TimeoutError(f'Did not finish within {timeout} seconds')
+            return flight.future.result()
+        finally:
+            unregister()
+            leave()
+
+    def _execute(self, key: str, flight: _Flight[T], function: Callable[[CancellationToken], T]) -> T:
+        try:
+            flight.future.set_result(function(flight.token))
+        except BaseException as e:
+            flight.future.set_exception(e)
+        finally:
+            with self._lock:
+                # Unless a later call already replaced it after it timed out
+                if self._flights.get(key, None) is flight:
+                    del self._flights[key]
+        return flight.future.result()
@@ -0,0 +1,63 @@
+import os
+import tempfile
+from typing import List
+from .storage_interface import StorageBackend
+
+
+class FilesystemBackend(StorageBackend):
+    TEMP_SUFFIX = ".tmp"
+
+    def __init__(self, directory: str) -> None:
+        super().__init__()
+        self.directory: str = directory
+
+    def _namespace_dir(self, namespace: str) -> str:
+        directory = os.path.join(self.directory, namespace)
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        return directory
+
+    def _path(self, namespace: str, key: str) -> str:
+        return os.path.join(self._namespace_dir(namespace), key)
+
+    def read(self, namespace: str, key: str) -> bytes | None:
+        try:
+            with open(self._path(namespace, key), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def read_range(self, namespace: str, key: str, start: int, end: int) -> bytes | None:
+        try:
+            with open(self._path(namespace, key), 'rb') as f:
+                f.seek(start)
+                return f.read(end - start)
+        except FileNotFoundError:
+            return None
+
+    def write(self, namespace: str, key: str, data: bytes) -> None:
+        # Written to a temporary file first, so a crash never leaves a partially written value behind
+        fd, temp_path = tempfile.mkstemp(dir=self._namespace_dir(namespace), prefix='.', suffix=self.TEMP_SUFFIX)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, self._path(namespace, key))
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def delete(self, namespace: str, key: str) -> None:
+        try:
+            os.remove(self._path(namespace, key))
+        except FileNotFoundError:
+            pass
+
+    def list_keys(self, namespace: str) -> List[str]:
+        directory = self._namespace_dir(namespace)
+        return [
+            f for f in os.listdir(directory) 
+            if os.path.isfile(os.path.join(directory, f)) and not (f.startswith('.') and f.endswith(self.TEMP_SUFFIX))
+        ]
+
+    def exists(self, namespace: str, key: str) -> bool:
+        return os.path.isfile(self._path(namespace, key))
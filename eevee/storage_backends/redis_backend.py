@@ -0,0 +1,119 @@
+import socket
+import threading
+from urllib.parse import urlparse
+from typing import List, Any
+from .storage_interface import StorageBackend
+
+
+class RedisBackend(StorageBackend):
+    """
+    Stores data on any server speaking the Redis protocol (RESP), using a minimal built-in client.
+    Each namespace keeps a set of its keys, so listing doesn't require scanning the whole keyspace.
+    """
+    KEY_PREFIX = "eevee"
+
+    def __init__(self, url: str, timeout_seconds: float = 10) -> None:
+        super().__init__()
+        parsed = urlparse(url)
+        self.host: str = parsed.hostname or 'localhost'
+        self.port: int = parsed.port or 6379
+        self.db: int = int(parsed.path.lstrip('/') or 0)
+        self.password: str | None = parsed.password
+        self.timeout_seconds: float = timeout_seconds
+        self._lock = threading.Lock()
+        self._socket: socket.socket | None = None
+        self._reader: Any = None
+
+    def _connect(self) -> None:
+        self._socket = socket.create_connection((self.host, self.port), timeout=self.timeout_seconds)
+        self._reader = self._socket.makefile('rb')
+        if self.password:
+            self._send_and_receive('AUTH', self.password)
+        if self.db:
+            self._send_and_receive('SELECT', str(self.db))
+
+    def _disconnect(self) -> None:
+        if self._socket is not None:
+            try:
+                self._reader.close()
+                self._socket.close()
+            except OSError:
+                pass
+        self._socket = None
+        self._reader = None
+
+    def _read_reply(self) -> Any:
+        line: bytes = self._reader.readline()
+        if not line:
+            raise ConnectionError('Connection closed by server')
+        prefix, payload = line[:1], line[1:-2]
+        match prefix:
+            case b'+':
+                return payload.decode('utf-8')
+            case b'-':
+                raise RuntimeError(f'Redis error: {payload.decode("utf-8")}')
+            case b':':
+                return int(payload)
+            case b'$':
+                length = int(payload)
+                if length == -1:
+                    return None
+                data = self._reader.read(length + 2)
+                return data[:-2]
+            case b'*':
+                length = int(payload)
+                if length == -1:
+                    return None
+                return [self._read_reply() for _ in range(length)]
+            case _:
+                raise RuntimeError(f'Unexpected Redis reply: {line!r}')
+
+    def _send_and_receive(self, *args: str | bytes) -> Any:
+        encoded = [a if isinstance(a, bytes) else a.encode('utf-8') for a in args]
+        command = b'*%d\r\n' % len(encoded) + b''.join(b'$%d\r\n%s\r\n' % (len(a), a) for a in encoded)
+        self._socket.sendall(command)  # type: ignore
+        return self._read_reply()
+
+    def _command(self, *args: str | bytes) -> Any:
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._socket is None:
+                        self._connect()
+                    return self._send_and_receive(*args)
+                except (ConnectionError, OSError):
+                    self._disconnect()
+                    if attempt == 1:
+                        raise
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f'{self.KEY_PREFIX}:{namespace}:{key}'
+
+    def _index_key(self, namespace: str) -> str:
+        return f'{self.KEY_PREFIX}:{namespace}:__keys__'
+
+    def read(self, namespace: str, key: str) -> bytes | None:
+        return self._command('GET', self._key(namespace, key))
+
+    def read_range(self, namespace: str, key: str, start: int, end: int) -> bytes | None:
+        if not self.exists(namespace, key):
+            return None
+        return self._command('GETRANGE', self._key(namespace, key), str(start), str(end - 1))
+
+    def write(self, namespace: str, key: str, data: bytes) -> None:
+        self._command('SET', self._key(namespace, key), data)
+        self._command('SADD', self._index_key(namespace), key)
+
+    def delete(self, namespace: str, key: str) -> None:
+        self._command('DEL', self._key(namespace, key))
+        self._command('SREM', self._index_key(namespace), key)
+
+    def list_keys(self, namespace: str) -> List[str]:
+        return [k.decode('utf-8') for k in self._command('SMEMBERS', self._index_key(namespace)) or []]
+
+    def exists(self, namespace: str, key: str) -> bool:
+        return bool(self._command('EXISTS', self._key(namespace, key)))
+
+    def close(self) -> None:
+        with self._lock:
+            self._disconnect()
@@ -0,0 +1,47 @@
+import sqlite3
+import threading
+from typing import List
+from .storage_interface import StorageBackend
+
+
+class SQLiteBackend(StorageBackend):
+    def __init__(self, path: str) -> None:
+        super().__init__()
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # WAL lets several processes read while one of them writes
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA busy_timeout=5000")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS storage (namespace TEXT NOT NULL, key TEXT NOT NULL, value BLOB NOT NULL, PRIMARY KEY (namespace, key))")
+
+    def read(self, namespace: str, key: str) -> bytes | None:
+        with self._lock:
+            row = self._connection.execute("SELECT value FROM storage WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+        return bytes(row[0]) if row else None
+
+    def read_range(self, namespace: str, key: str, start: int, end: int) -> bytes | None:
+        with self._lock:
+            row = self._connection.execute("SELECT substr(value, ?, ?) FROM storage WHERE namespace = ? AND key = ?", (start + 1, end - start, namespace, key)).fetchone()
+        return bytes(row[0]) if row else None
+
+    def write(self, namespace: str, key: str, data: bytes) -> None:
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO storage (namespace, key, value) VALUES (?, ?, ?)", (namespace, key, data))
+
+    def delete(self, namespace: str, key: str) -> None:
+        with self._lock:
+            self._connection.execute("DELETE FROM storage WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def list_keys(self, namespace: str) -> List[str]:
+        with self._lock:
+            rows = self._connection.execute("SELECT key FROM storage WHERE namespace = ?", (namespace,)).fetchall()
+        return [row[0] for row in rows]
+
+    def exists(self, namespace: str, key: str) -> bool:
+        with self._lock:
+            row = self._connection.execute("SELECT 1 FROM storage WHERE namespace = ? AND key = ?", (namespace, key)).fetchone()
+        return row is not None
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
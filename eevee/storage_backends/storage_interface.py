@@ -0,0 +1,39 @@
+from abc import abstractmethod
+from typing import List
+
+
+class StorageBackend:
+    """
+    A key-value store of bytes, where keys are grouped into namespaces (saved chats, sessions, preferences, etc.)
+    """
+    def __init__(self) -> None:
+        pass
+
+    @abstractmethod
+    def read(self, namespace: str, key: str) -> bytes | None:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def write(self, namespace: str, key: str, data: bytes) -> None:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def delete(self, namespace: str, key: str) -> None:
+        raise NotImplementedError()
+
+    @abstractmethod
+    def list_keys(self, namespace: str) -> List[str]:
+        raise NotImplementedError()
+
+    def read_range(self, namespace: str, key: str, start: int, end: int) -> bytes | None:
+        """
+        Reads bytes [start, end) of the value
+        """
+        data = self.read(namespace, key)
+        return data[start:end] if data is not None else None
+
+    def exists(self, namespace: str, key: str) -> bool:
+        return self.read(namespace, key) is not None
+
+    def close(self) -> None:
+        pass
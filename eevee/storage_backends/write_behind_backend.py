@@ -0,0 +1,96 @@
+import threading
+from typing import List, Dict, Tuple
+from .storage_interface import StorageBackend
+from ..color_logger import get_logger
+
+
+class WriteBehindBackend(StorageBackend):
+    """
+    Wraps another backend so writes and deletes return immediately, and are applied by a background thread
+    every few seconds and on close. Repeated writes of the same key before a flush are written once,
+    and reads always see the latest pending value. Once `max_pending` keys are waiting, writes flush synchronously.
+    """
+    def __init__(self, backend: StorageBackend, flush_interval_seconds: float, max_pending: int) -> None:
+        super().__init__()
+        self.backend: StorageBackend = backend
+        self.flush_interval_seconds: float = flush_interval_seconds
+        self.max_pending: int = max_pending
+        # A pending value of None is a pending delete
+        self._pending: Dict[Tuple[str, str], bytes | None] = dict()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_interval_seconds):
+            self.flush()
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            with self._lock:
+                pending = list(self._pending.items())
+            for (namespace, key), data in pending:
+                try:
+                    if data is None:
+                        self.backend.delete(namespace, key)
+                    else:
+                        self.backend.write(namespace, key, data)
+                except Exception as e:
+                    get_logger().error(f'Failed persisting {namespace}/{key}, will retry: {e}')
+                    continue
+                with self._lock:
+                    # Unless it was written again in the meantime
+                    if (namespace, key) in self._pending and self._pending[(namespace, key)] is data:
+                        del self._pending[(namespace, key)]
+
+    def read(self, namespace: str, key: str) -> bytes | None:
+        with self._lock:
+            if (namespace, key) in self._pending:
+                return self._pending[(namespace, key)]
+        return self.backend.read(namespace, key)
+
+    def read_range(self, namespace: str, key: str, start: int, end: int) -> bytes | None:
+        with self._lock:
+            if (namespace, key) in self._pending:
+                data = self._pending[(namespace, key)]
+                return data[start:end] if data is not None else None
+        return self.backend.read_range(namespace, key, start, end)
+
+    def write(self, namespace: str, key: str, data: bytes) -> None:
+        self._enqueue(namespace, key, data)
+
+    def delete(self, namespace: str, key: str) -> None:
+        self._enqueue(namespace, key, None)
+
+    def _enqueue(self, namespace: str, key: str, data: bytes | None) -> None:
+        with self._lock:
+            self._pending[(namespace, key)] = data
+            overflowing = len(self._pending) > self.max_pending
+        if overflowing:
+            self.flush()
+
+    def list_keys(self, namespace: str) -> List[str]:
+        keys = set(self.backend.list_keys(namespace))
+        with self._lock:
+            for (pending_namespace, key), data in self._pending.items():
+                if pending_namespace != namespace:
+                    continue
+                if data is None:
+                    keys.discard(key)
+                else:
+                    keys.add(key)
+        return list(keys)
+
+    def exists(self, namespace: str, key: str) -> bool:
+        with self._lock:
+            if (namespace, key) in self._pending:
+                return self._pending[(namespace, key)] is not None
+        return self.backend.exists(namespace, key)
+
+    def close(self) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.flush()
+        self.backend.close()
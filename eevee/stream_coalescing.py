@@ -0,0 +1,98 @@
+import time
+import threading
+from queue import Queue, Empty, Full
+from typing import Iterator, Generator, List
+from .messages import ChatMessagePiece
+
+
+_END = object()
+
+
+def _is_content(piece: ChatMessagePiece) -> bool:
+    return piece.content is not None and not piece.tool_calls and piece.usage is None and piece.info_message is None and piece.warning_message is None
+
+
+def coalesce_pieces(pieces: Iterator[ChatMessagePiece], window_seconds: float, max_bytes: int, max_pending: int) -> Generator[ChatMessagePiece, None, None]:
+    """
+    Merges the content pieces of a model's stream, so a piece is passed on at most every `window_seconds`,
+    or once `max_bytes` of content are pending. The first content piece is passed on at once, so the time to first token
+    is unchanged, and other pieces (tool calls, usage and messages) flush the pending content and are passed on as they are.
+    The stream is read on a separate thread, up to `max_pending` pieces ahead: past that, it isn't read until the consumer
+    catches up, which slows down the provider instead of buffering without limit.
+    """
+    queue: Queue = Queue(maxsize=max_pending)
+    stopped = threading.Event()
+
+    def read() -> None:
+        try:
+            for piece in pieces:
+                while not stopped.is_set():
+                    try:
+                        queue.put(piece, timeout=0.1)
+                        break
+                    except Full:
+                        continue
+                if stopped.is_set():
+                    break
+            item = _END
+        except Exception as e:
+            item = e
+        finally:
+            if stopped.is_set() and hasattr(pieces, 'close'):
+                pieces.close()  # type: ignore
+        # The consumer is still waiting for this one, unless it stopped
+        while not stopped.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return
+            except Full:
+                continue
+
+    threading.Thread(target=read, name='stream-reader', daemon=True).start()
+
+    pending: List[str] = list()
+    pending_bytes = 0
+    pending_model: str | None = None
+    window_end = 0.
+    first_content = True
+
+    def flush() -> ChatMessagePiece | None:
+        nonlocal pending, pending_bytes
+        if not pending:
+            return None
+        piece = ChatMessagePiece(content=''.join(pending), model=pending_model)
+        pending, pending_bytes = list(), 0
+        return piece
+
+    try:
+        while True:
+            try:
+                item = queue.get(timeout=max(window_end - time.perf_counter(), 0) if pending else None)
+            except Empty:
+                yield flush()  # type: ignore
+                continue
+            if item is _END or isinstance(item, Exception):
+                merged = flush()
+                if merged is not None:
+                    yield merged
+                if item is _END:
+                    return
+                raise item
+            if not _is_content(item):
+                merged = flush()
+                if merged is not None:
+                    yield merged
+                yield item
+            elif first_content:
+                first_content = False
+                yield item
+            else:
+                if not pending:
+                    window_end = time.perf_counter() + window_seconds
+                    pending_model = item.model
+                pending.append(item.content)
+                pending_bytes += len(item.content.encode('utf-8'))
+                if pending_bytes >= max_bytes:
+                    yield flush()  # type: ignore
+    finally:
+        stopped.set()
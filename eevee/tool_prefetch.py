@@ -0,0 +1,158 @@
+import re
+import json
+import time
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future, wait
+from dataclasses import dataclass
+from typing import Dict, List, Tuple, Any, Callable
+from .cancellation import CancellationToken
+from .web_search import normalize_url
+from .color_logger import get_logger
+
+
+@dataclass(slots=True)
+class PrefetchStats:
+    prefetched: int = 0
+    # Calls served from prefetched outputs, including those waiting for a prefetch in progress
+    hits: int = 0
+    misses: int = 0
+    # Prefetched outputs evicted or expired without being used
+    wasted: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.
+
+
+@dataclass(slots=True)
+class _Entry:
+    output: str
+    size: int
+    created: float
+    used: bool = False
+
+
+_URL_PATTERN = re.compile(r'^URL: (\S+)$', re.MULTILINE)
+
+# Tool calls likely to follow each tool, built from its output
+PREFETCH_RULES: Dict[str, Tuple[str, Callable[[str], List[Dict[str, Any]]]]] = {
+    'web_search': ('visit_website', lambda output: [{'url': url} for url in _URL_PATTERN.findall(output)]),
+}
+
+# Arguments of the calls which lead to the same output, like the URL of a page with a trailing slash or tracking parameters
+CANONICAL_ARGUMENTS: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    'visit_website': lambda arguments: {**arguments, 'url': normalize_url(str(arguments.get('url', '')))},
+}
+
+
+class ToolPrefetcher:
+    """
+    Runs the tool calls a model is likely to make next in the background, such as visiting the top results of a web search,
+    so they are served from memory when the model gets to them instead of starting only after another model round trip.
+    Outputs are kept in an LRU bounded in bytes, and errors are never kept, so a failed prefetch is simply retried by the call.
+    """
+    def __init__(self,
+                 run: Callable[[str, Dict[str, Any]], str],
+                 top_k: int,
+                 concurrency: int,
+                 max_output_bytes: int,
+                 max_cache_bytes: int,
+                 ttl_seconds: float
+                 ) -> None:
+        self._run = run
+        self.top_k: int = top_k
+        self.max_output_bytes: int = max_output_bytes
+        self.max_cache_bytes: int = max_cache_bytes
+        self.ttl_seconds: float = ttl_seconds
+        self.stats = PrefetchStats()
+        self.logger = get_logger()
+        self._entries: OrderedDict[str, _Entry] = OrderedDict()
+        self._cache_bytes: int = 0
+        self._pending: Dict[str, Future] = dict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='prefetch')
+        self._targets = {target for target, _ in PREFETCH_RULES.values()}
+
+    @staticmethod
+    def _key(name: str, arguments: Dict[str, Any]) -> str:
+        canonical = CANONICAL_ARGUMENTS.get(name, None)
+        return json.dumps([name, canonical(arguments) if canonical is not None else arguments], sort_keys=True, ensure_ascii=False)
+
+    def after_call(self, name: str, arguments: Dict[str, Any], output: str) -> None:
+        """
+        Starts prefetching the calls following a successful call of the tool
+        """
+        rule = PREFETCH_RULES.get(name, None)
+        if rule is None or output.startswith('ERROR'):
+            return
+        target, next_calls = rule
+        for next_arguments in next_calls(output)[:self.top_k]:
+            key = self._key(target, next_arguments)
+            with self._lock:
+                if key in self._pending or key in self._entries:
+                    continue
+                self._pending[key] = self._executor.submit(self._prefetch, key, target, next_arguments)
+
+    def _prefetch(self, key: str, name: str, arguments: Dict[str, Any]) -> str:
+        try:
+            output = self._run(name, arguments)
+        except Exception as e:
+            output = f'ERROR: {e}'
+        size = len(output.encode('utf-8'))
+        with self._lock:
+            self._pending.pop(key, None)
+            if output.startswith('ERROR') or size > self.max_output_bytes:
+                return output
+            self.stats.prefetched += 1
+            self._entries[key] = _Entry(output=output, size=size, created=time.monotonic())
+            self._cache_bytes += size
+            while self._cache_bytes > self.max_cache_bytes:
+                self._evict(next(iter(self._entries)))
+        return output
+
+    def _evict(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._cache_bytes -= entry.size
+        if not entry.used:
+            self.stats.wasted += 1
+
+    def lookup(self, name: str, arguments: Dict[str, Any], cancellation_token: CancellationToken | None = None) -> str | None:
+        """
+        The prefetched output of the call, waiting for its prefetch if it's in progress, or None if the call has to be made
+        """
+        if name not in self._targets:
+            return None
+        key = self._key(name, arguments)
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is not None and self.ttl_seconds and time.monotonic() - entry.created > self.ttl_seconds:
+                self._evict(key)
+                entry = None
+            future = self._pending.get(key, None) if entry is None else None
+        output = entry.output if entry is not None else self._wait(future, cancellation_token) if future is not None else None
+        with self._lock:
+            if output is not None and not output.startswith('ERROR'):
+                self.stats.hits += 1
+                if key in self._entries:
+                    self._entries[key].used = True
+                    self._entries.move_to_end(key)
+            else:
+                output = None
+                self.stats.misses += 1
+            self.logger.debug(f'Prefetch {"hit" if output is not None else "miss"} for {name}, hit rate {self.stats.hit_rate:.0%}')
+        return output
+
+    @staticmethod
+    def _wait(future: Future, cancellation_token: CancellationToken | None) -> str | None:
+        while not wait([future], timeout=0.1).done:
+            if cancellation_token is not None and cancellation_token.cancelled:
+                return None
+        return None if future.cancelled() else future.result()
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self.stats.hits or self.stats.misses:
+            self.logger.info(f'Prefetching: {self.stats.hits} hits, {self.stats.misses} misses ({self.stats.hit_rate:.0%}), '
+                             f'{self.stats.prefetched} prefetched, {self.stats.wasted} unused')
@@ -0,0 +1,199 @@
+import json
+import asyncio
+import hashlib
+import inspect
+import threading
+from concurrent.futures import CancelledError
+from dataclasses import dataclass
+from importlib.metadata import entry_points
+from typing import Dict, List, Any, Callable, get_args
+from .json_schema import compile_schema, Validator, SchemaValidationError
+from .cancellation import CancellationToken
+from .tool_sandbox import ToolSandbox, SandboxLimits
+from .tool_prefetch import ToolPrefetcher
+from .settings import Settings
+from .color_logger import get_logger
+from .tools import tools_params_definitions, handle_tool_error
+from ._types import ToolsDefType, Framework
+
+
+@dataclass(slots=True)
+class Tool:
+    name: str
+    function: Callable[..., Any]
+    description: str
+    # JSON Schema of the tool's arguments
+    parameters: Dict[str, Any]
+    validate: Validator
+    is_async: bool
+    cancellable: bool
+
+
+class ToolRegistry:
+    """
+    The tools available to the models: the built-in ones, and those of installed packages declaring an entry point
+    in the `eevee.tools` group, which resolves to a definitions dictionary like `tools_params_definitions`.
+    Tools can be plain or `async` functions. Schemas, argument validators and the tools payload sent to each framework
+    are all built once, when the registry is created. Tools listed under `[sandbox.tools]` in the config run in a separate process.
+    When `[prefetch]` is enabled, the calls likely to follow a tool call are made ahead of time, see `ToolPrefetcher`.
+    """
+    ENTRY_POINTS_GROUP = "eevee.tools"
+    # Frameworks whose connectors support tool calling
+    TOOL_FRAMEWORKS: List[Framework] = ['openai', 'mistral', 'deepseek']
+
+    def __init__(self, definitions: ToolsDefType | None = None, load_entry_points: bool = True) -> None:
+        self.logger = get_logger()
+        self.tools: Dict[str, Tool] = dict()
+        for function, parameters in (definitions if definitions is not None else tools_params_definitions).items():
+            self.register(function, parameters)
+        if load_entry_points:
+            self._load_entry_points()
+        self._payloads: Dict[Framework, List[Dict[str, Any]]] = dict()
+        self._digests: Dict[Framework, str] = dict()
+        for framework in get_args(Framework):
+            self._payloads[framework] = self._build_payload(framework)
+            self._digests[framework] = hashlib.sha256(json.dumps(self._payloads[framework], sort_keys=True).encode('utf-8')).hexdigest()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_lock = threading.Lock()
+        self.sandbox = self._build_sandbox()
+        self.prefetcher = self._build_prefetcher()
+
+    def _build_sandbox(self) -> ToolSandbox:
+        sandbox_settings = Settings().sandbox
+        limits: Dict[str, SandboxLimits] = dict()
+        for name, overrides in (sandbox_settings.get('tools', None) or {}).items():
+            if name not in self.tools:
+                self.logger.warning(f'Sandboxed tool {name} is not defined')
+                continue
+            limits[name] = SandboxLimits(**{
+                field: overrides.get(field, sandbox_settings[field])
+                for field in ('timeout_seconds', 'cpu_seconds', 'memory_mb', 'max_output_bytes')
+            })
+        preload = sorted({self.tools[name].function.__module__ for name in limits})
+        return ToolSandbox(limits, preload)
+
+    def _build_prefetcher(self) -> ToolPrefetcher | None:
+        prefetch_settings = Settings().prefetch
+        if not prefetch_settings.enabled:
+            return None
+        return ToolPrefetcher(
+            lambda name, arguments: self._invoke(self.tools[name], arguments, None),
+            top_k=prefetch_settings.top_k,
+            concurrency=prefetch_settings.concurrency,
+            max_output_bytes=prefetch_settings.max_output_bytes,
+            max_cache_bytes=prefetch_settings.max_cache_bytes,
+            ttl_seconds=prefetch_settings.ttl_seconds
+        )
+
+    def _load_entry_points(self) -> None:
+        for entry_point in entry_points(group=self.ENTRY_POINTS_GROUP):
+            try:
+                definitions: ToolsDefType = entry_point.load()
+                for function, parameters in definitions.items():
+                    if function.__name__ in self.tools:
+                        self.logger.warning(f'Tool {function.__name__} of {entry_point.name} is already defined, skipping it')
+                        continue
+                    self.register(function, parameters)
+                self.logger.debug(f'Loaded tools of {entry_point.name}: {", ".join(f.__name__ for f in definitions.keys())}')
+            except Exception as e:
+                self.logger.error(f'Failed loading tools of {entry_point.name}: {e}')
+
+    def register(self, function: Callable[..., Any], parameters: List[Any]) -> None:
+        properties: Dict[str, Any] = dict()
+        required: List[str] = list()
+        for name, schema, is_required in parameters:
+            properties[name] = schema
+            if is_required:
+                required.append(name)
+        schema = {"type": "object", "properties": properties, "required": required}
+        self.tools[function.__name__] = Tool(
+            name=function.__name__,
+            function=function,
+            description=inspect.cleandoc(function.__doc__ or ''),
+            parameters=schema,
+            validate=compile_schema(schema, coerce=True),
+            is_async=inspect.iscoroutinefunction(function),
+            cancellable='cancellation_token' in inspect.signature(function).parameters
+        )
+
+    def _build_payload(self, framework: Framework) -> List[Dict[str, Any]]:
+        if framework not in self.TOOL_FRAMEWORKS:
+            return []
+        return [
+            {"type": "function", "function": {"name": tool.name, "description": tool.description, "parameters": tool.parameters}}
+            for tool in self.tools.values()
+        ]
+
+    def payload(self, framework: Framework) -> List[Dict[str, Any]]:
+        """
+        The tools definitions as sent to the framework's API. The same list is returned on every call, and must not be modified.
+        """
+        return self._payloads[framework]
+
+    def digest(self, framework: Framework) -> str:
+        """
+        A hash of the framework's payload, identifying it in cache keys
+        """
+        return self._digests[framework]
+
+    def call(self, name: str, arguments: Dict[str, Any], cancellation_token: CancellationToken | None = None) -> str:
+        """
+        Validates the arguments and runs the tool. Unknown tools, invalid arguments and errors raised by the tool
+        are returned as an error message, so the model can correct itself.
+        """
+        tool = self.tools.get(name, None)
+        if tool is None:
+            return f'ERROR: No tool named {name}'
+        try:
+            arguments = dict(tool.validate(arguments))
+        except SchemaValidationError as e:
+            return f'ERROR: Invalid arguments for {name}: {e}'
+        if self.prefetcher is not None:
+            output = self.prefetcher.lookup(name, arguments, cancellation_token)
+            if output is not None:
+                return output
+        output = self._invoke(tool, arguments, cancellation_token)
+        if self.prefetcher is not None:
+            self.prefetcher.after_call(name, arguments, output)
+        return output
+
+    def _invoke(self, tool: Tool, arguments: Dict[str, Any], cancellation_token: CancellationToken | None) -> str:
+        if self.sandbox.sandboxed(tool.name):
+            # Cancelling kills the process, so the token isn't passed on
+            return self.sandbox.run(tool.name, tool.function, arguments, cancellation_token)
+        if tool.cancellable:
+            arguments = {**arguments, 'cancellation_token': cancellation_token}
+        try:
+            if tool.is_async:
+                return self._run_async(tool.function(**arguments), cancellation_token)
+            return tool.function(**arguments)
+        except CancelledError:
+            return 'ERROR: The tool call was cancelled'
+        except Exception as e:
+            handle_tool_error(e)
+            return f'ERROR: {e}'
+
+    def _event_loop(self) -> asyncio.AbstractEventLoop:
+        # Async tools of all calls share one event loop, running on its own thread
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name='async-tools', daemon=True).start()
+            return self._loop
+
+    def _run_async(self, coroutine: Any, cancellation_token: CancellationToken | None) -> str:
+        future = asyncio.run_coroutine_threadsafe(coroutine, self._event_loop())
+        # Unlike a thread, a coroutine can be stopped midway
+        unregister = cancellation_token.on_cancel(future.cancel) if cancellation_token is not None else (lambda: None)
+        try:
+            return future.result()
+        finally:
+            unregister()
+
+    def close(self) -> None:
+        if self.prefetcher is not None:
+            self.prefetcher.close()
+        with self._loop_lock:
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._loop.stop)
+                self._loop = None
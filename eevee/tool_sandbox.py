@@ -0,0 +1,128 @@
+import sys
+import time
+import asyncio
+import inspect
+import threading
+import multiprocessing
+from multiprocessing import forkserver
+from types import ModuleType
+from dataclasses import dataclass
+from multiprocessing.connection import Connection
+from typing import Dict, List, Set, Any, Callable
+from .cancellation import CancellationToken
+from .color_logger import get_logger
+from . import settings
+
+try:
+    import resource
+except ImportError:  # not available on Windows, where limits aren't enforced
+    resource = None  # type: ignore
+
+
+@dataclass(slots=True)
+class SandboxLimits:
+    # Wall time after which the process is killed
+    timeout_seconds: float
+    cpu_seconds: int
+    memory_mb: int
+    max_output_bytes: int
+
+
+_OK = b'0'
+_ERROR = b'1'
+_TRUNCATED_MARK = "\n[Output truncated]"
+
+
+def _apply_limits(limits: SandboxLimits) -> None:
+    if resource is None:
+        return
+    if limits.cpu_seconds:
+        # The process gets SIGXCPU at the soft limit, and is killed at the hard one
+        resource.setrlimit(resource.RLIMIT_CPU, (limits.cpu_seconds, limits.cpu_seconds + 1))
+    if limits.memory_mb:
+        memory_bytes = limits.memory_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+
+
+def _run_tool(function: Callable[..., Any], arguments: Dict[str, Any], limits: SandboxLimits, config_files: List[str], connection: Connection) -> None:
+    """
+    Runs in the sandbox process. The output is encoded and capped here, and sent as raw bytes, so a huge output is never pickled
+    """
+    try:
+        _apply_limits(limits)
+        settings.init_settings(config_files)
+        output = function(**arguments)
+        if inspect.iscoroutine(output):
+            output = asyncio.run(output)
+        status, data = _OK, str(output).encode('utf-8')
+    except BaseException as e:
+        status, data = _ERROR, f'{e.__class__.__name__}: {e}'.encode('utf-8')
+    if len(data) > limits.max_output_bytes:
+        data = data[:limits.max_output_bytes].decode('utf-8', errors='ignore').encode('utf-8') + _TRUNCATED_MARK.encode('utf-8')
+    connection.send_bytes(status + data)
+    connection.close()
+
+
+class ToolSandbox:
+    """
+    Runs tools in a separate process per call, under CPU time and memory limits, with a hard timeout and a cap on the output size.
+    A process per call, rather than a pool, is what allows killing a hung tool, or one whose generation was cancelled,
+    without affecting other calls. Processes are forked from a server preloading the tools' modules, so they start quickly.
+    """
+    def __init__(self, limits: Dict[str, SandboxLimits], preload: List[str]) -> None:
+        self.limits: Dict[str, SandboxLimits] = limits
+        self.logger = get_logger()
+        methods = multiprocessing.get_all_start_methods()
+        self._context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        if 'forkserver' in methods and limits:
+            self._context.set_forkserver_preload(['__main__', __name__, *self._main_imports(), *preload])
+            # Importing the preloaded modules takes a while, so the server is started ahead of the first call
+            threading.Thread(target=forkserver.ensure_running, name='forkserver-start', daemon=True).start()
+
+    @staticmethod
+    def _main_imports() -> List[str]:
+        # Each process runs the main script again before the tool (the `__main__` preload doesn't reach them on Python 3.11),
+        # which is only quick if the modules it imports are already loaded
+        main = sys.modules.get('__main__', None)
+        modules: Set[str] = set()
+        for value in (vars(main).values() if main is not None else []):
+            if isinstance(value, ModuleType):
+                modules.add(value.__name__)
+            elif isinstance(getattr(value, '__module__', None), str) and value.__module__ != '__main__':
+                modules.add(value.__module__)
+        return sorted(modules)
+
+    def sandboxed(self, name: str) -> bool:
+        return name in self.limits
+
+    def run(self, name: str, function: Callable[..., Any], arguments: Dict[str, Any], cancellation_token: CancellationToken | None = None) -> str:
+        limits = self.limits[name]
+        reader, writer = self._context.Pipe(duplex=False)
+        process = self._context.Process(
+            target=_run_tool,
+            args=(function, arguments, limits, settings.config_files(), writer),
+            name=f'tool-{name}',
+            daemon=True
+        )
+        start = time.perf_counter()
+        process.start()
+        writer.close()
+        unregister = cancellation_token.on_cancel(process.kill) if cancellation_token is not None else (lambda: None)
+        try:
+            if not reader.poll(limits.timeout_seconds):
+                return f'ERROR: {name} did not finish within {limits.timeout_seconds} seconds'
+            try:
+                data = reader.recv_bytes()
+            except EOFError:
+                # Killed before writing its output, by a limit or a cancellation
+                process.join(timeout=1)
+                return f'ERROR: {name} was stopped (exit code {process.exitcode}), it may have exceeded its CPU or memory limits'
+            status, output = data[:1], data[1:].decode('utf-8')
+            self.logger.debug(f'Sandboxed {name} finished in {time.perf_counter() - start:.2f}s')
+            return output if status == _OK else f'ERROR: {output}'
+        finally:
+            unregister()
+            reader.close()
+            if process.is_alive():
+                process.kill()
+            process.join(timeout=1)
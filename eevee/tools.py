@@ -1,22 +1,16 @@
 import re
-import os
 import inspect
-import requests
 from urllib.parse import urlparse
-from tqdm import tqdm
 from bs4 import BeautifulSoup
-from duckduckgo_search import DDGS
-from googleapiclient.discovery import build
-from typing import List, Tuple
 from .color_logger import get_logger
 from .settings import Settings
+from .client_registry import ClientRegistry
+from .cancellation import CancellationToken, closed_on_cancel
+from .web_search import search_aggregator
+from .document_index import document_index
 from ._types import ToolsDefType
 
 
-_GOOGLE_SEARCH_API_KEY = os.environ.get('GOOGLE_SEARCH_API_KEY', None)
-_GOOGLE_SEARCH_CSE_ID = os.environ.get('GOOGLE_SEARCH_CSE_ID', None)
-
-
 def handle_tool_error(e: Exception) -> None:
     get_logger().error(f'ERROR [{e.__class__.__name__} in {inspect.stack()[1].function}]: {str(e)}', color='red')
 
@@ -41,37 +35,10 @@ def web_search(query: str, max_results: int = 10) -> str:
     if max_results < 1: max_results = 1
     elif max_results > 10: max_results = 10
 
-    def duckduckgo_search(query: str, max_results: int) -> List[Tuple[str, str, str]]:
-        results = []
-        ddgs = DDGS() 
-        results = ddgs.text(query, max_results=max_results)
-        for result in tqdm(results):
-            url = result['href']
-            if url is None:
-                continue
-            body = result['body']
-            title = result['title'] or ''
-            results.append((title, url, body))
-        return results
-    
-    def google_search(query: str, max_results: int, api_key: str, cse_id: str) -> List[Tuple[str, str, str]]:
-        results = []
-        service = build("customsearch", "v1", developerKey=api_key)
-        response = service.cse().list(q=query, cx=cse_id, num=max_results).execute()
-        for result in tqdm(response['items']):
-            results.append((result['title'], result['link'], result['snippet']))
-        return results
-
     try:
-        if _GOOGLE_SEARCH_API_KEY and _GOOGLE_SEARCH_CSE_ID:
-            get_logger().debug('Searching the web with Google')
-            results = google_search(query=query, max_results=max_results, api_key=_GOOGLE_SEARCH_API_KEY, cse_id=_GOOGLE_SEARCH_CSE_ID)
-        else:
-            get_logger().debug('Searching the web with DuckDuckGo')
-            results = duckduckgo_search(query=query, max_results=max_results)
-        
+        results = search_aggregator().search(query=query, max_results=max_results)
         if results:
-            return '\n=====\n'.join(f"Title: {title}\nURL: {url}\nDescription: {body}\n" for (title, url, body) in results)
+            return '\n=====\n'.join(f"Title: {r.title}\nURL: {r.url}\nDescription: {r.description}\n" for r in results)
         else:
             return "No results"
 
@@ -80,15 +47,17 @@ def web_search(query: str, max_results: int = 10) -> str:
         return f"Error while searching the web: {e}"
 
 
-def visit_website(url: str) -> str:
+def visit_website(url: str, cancellation_token: CancellationToken | None = None) -> str:
     """
     Goes to the provided URL and returns a simple version of the page text. Images and styling are excluded.
     """
     try:
         headers = {'User-Agent': Settings().web.user_agent}
-        response = requests.get(url, timeout=Settings().web.surf_timeout_seconds, headers=headers)
+        response = ClientRegistry().requests_session().get(url, timeout=Settings().web.surf_timeout_seconds, headers=headers, stream=True)
+        with closed_on_cancel(response, cancellation_token):
+            content = response.content
         if response.status_code == 200:
-            soup = BeautifulSoup(response.content, 'html.parser')
+            soup = BeautifulSoup(content, 'html.parser')
             text = soup.get_text()
 
             # Clean whitespaces
@@ -104,6 +73,29 @@ def visit_website(url: str) -> str:
         return f"ERROR: {e}"
 
 
+def search_documents(query: str, max_results: int = 5) -> str:
+    """
+    Search the user's local documents for the provided query, and returns the most relevant passages and the files they are from.
+    Passages are separated by: =====
+    """
+    if max_results < 1: max_results = 1
+    elif max_results > 20: max_results = 20
+
+    try:
+        index = document_index()
+        if not index.chunks:
+            return "No documents are indexed"
+        results = index.search(query, top_k=max_results)
+        if results:
+            return '\n=====\n'.join(f"File: {chunk.path}\nPassage: {chunk.text}\n" for chunk, _ in results)
+        else:
+            return "No results"
+
+    except Exception as e:
+        handle_tool_error(e)
+        return f"Error while searching the documents: {e}"
+
+
 #######
     
 
@@ -111,6 +103,8 @@ def tool_display_message(tool_name: str, **arguments) -> str:
     match tool_name:
         case 'web_search':
             return f'Searching the web: {arguments["query"]}'
+        case 'search_documents':
+            return f'Searching documents: {arguments["query"]}'
         case 'visit_website':
             domain = urlparse(arguments['url']).netloc
             return f'Visiting website: {domain}'
@@ -121,6 +115,8 @@ def tool_display_message(tool_name: str, **arguments) -> str:
 
 tools_params_definitions: ToolsDefType = {
     web_search: [("query", {"type": "string", "description": "The query to search on the web"}, True),
-                 ("max_results", {"type": "number", "description": "Maximal number of results to retrieve. Must be between 1 and 10, default is 10."}, False)],
+                 ("max_results", {"type": "integer", "description": "Maximal number of results to retrieve. Must be between 1 and 10, default is 10."}, False)],
     visit_website: [("url", {"type": "string", "description": "The URL of the page to scrape"}, True)],
+    search_documents: [("query", {"type": "string", "description": "The query to search in the documents"}, True),
+                       ("max_results", {"type": "integer", "description": "Maximal number of passages to retrieve. Must be between 1 and 20, default is 5."}, False)],
 }
\ No newline at end of file
@@ -1,52 +1,140 @@
-import os
 import json
-import pathlib
+import time
+import threading
 import gradio as gr
-from datetime import datetime
-from typing import List, Tuple, Generator, Set, Tuple, Dict, Any
-from .saved_chat import SavedChat
+from functools import partial
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, date, timedelta
+from typing import List, Tuple, Generator, Set, Tuple, Dict, Any, Callable, Iterator
 from .chatbot import Chatbot
+from .messages import ChatMessagePiece, Message
+from .cancellation import CancellationToken
 from .settings import Settings
 from .utils import path_to_resource
 from .framework_models import get_model_name_and_alias
+from .usage_ledger import UsageTotal
+from .profiling import EventProfiler
+from .json_schema import compile_schema
+from .queue_monitor import QueueMonitor
+from .color_logger import get_logger
 from ._types import Framework
 
 
+@dataclass(slots=True)
+class QueueConfig:
+    # Answers generated at once, shared by Submit, Regenerate and Compare
+    generation_concurrency: int
+    # Concurrency of each other event
+    bookkeeping_concurrency: int
+    max_size: int
+    max_threads: int
+    drain_timeout_seconds: float
+    report_interval_seconds: float
+
+    @classmethod
+    def from_settings(cls, **overrides: Any) -> 'QueueConfig':
+        queue_settings = Settings().queue
+        return cls(**{name: overrides[name] if overrides.get(name, None) is not None else queue_settings[name] for name in cls.__slots__})  # type: ignore
+
+
 class UI:
+    PREFERENCES_NAMESPACE = "preferences"
+    PREFERENCES_KEY = "pref.json"
     CHAT_FILE_TIME_FORMAT = "%d/%m/%Y, %H:%M:%S"
     MODEL_NAME_SEPARATOR = "\n\n🤖 "
+    MAX_COMPARED_MODELS = 4
+    BRANCH_LABEL_LENGTH = 40
+    USAGE_DAYS = 30
+    TRUNCATED_MARK = " ⏹️"
 
-    def __init__(self, chatbot: Chatbot, available_frameworks: Set[Framework], port: int) -> None:
+    GENERATION_POOL = "generation"
+
+    def __init__(self, chatbot: Chatbot, available_frameworks: Set[Framework], port: int, profiler: EventProfiler | None = None, queue_config: QueueConfig | None = None) -> None:
         self.ui: gr.Blocks | None = None
         self.chatbot = chatbot
         self.available_frameworks = available_frameworks
-        self._generate_text = True
+        self._cancellation_token = CancellationToken()
         self.preferences: Dict[str, Any] = dict()
         self.port: int = port
+        self.profiler: EventProfiler | None = profiler
+        self.queue_config: QueueConfig = queue_config or QueueConfig.from_settings()
+        self.queue_monitor: QueueMonitor | None = None
+        self._generations: int = 0
+        self._generations_done = threading.Condition()
 
     def __enter__(self) -> gr.Blocks:
+        """
+        Serves the UI until interrupted
+        """
         self.preferences = self._load_preferences_from_file()
         self.ui = self._build_ui()
-        self.ui.launch(favicon_path=path_to_resource("eevee_50.png"), inbrowser=True, show_error=True, server_port=self.port)
+        self.ui.queue(max_size=self.queue_config.max_size or None, default_concurrency_limit=self.queue_config.bookkeeping_concurrency)
+        self.ui.launch(favicon_path=path_to_resource("eevee_50.png"), inbrowser=True, show_error=True, server_port=self.port,
+                       max_threads=self.queue_config.max_threads, prevent_thread_lock=True)
+        if self.queue_config.report_interval_seconds:
+            self.queue_monitor = QueueMonitor(self.ui, self.queue_config.report_interval_seconds)
+            self.queue_monitor.start()
+        try:
+            while True:
+                time.sleep(0.1)
+        except KeyboardInterrupt:
+            pass
         return self.ui
 
     def __exit__(self, *args) -> None:
         if self.ui:
+            self._drain()
+            if self.queue_monitor is not None:
+                self.queue_monitor.stop()
             self.ui.close()
-            with open(self.preferences_file_path, 'w') as f:
-                json.dump(self.preferences, f)
+            self._save_preferences()
+        self.chatbot.close()
+
+    @contextmanager
+    def _generation(self) -> Iterator[None]:
+        with self._generations_done:
+            self._generations += 1
+        try:
+            yield
+        finally:
+            with self._generations_done:
+                self._generations -= 1
+                self._generations_done.notify_all()
 
-    @property
-    def preferences_file_path(self) -> str:
-        return path_to_resource("pref.json")
+    def _drain(self) -> None:
+        # The server keeps running meanwhile, so answers being generated are still streamed to their users
+        timeout = self.queue_config.drain_timeout_seconds
+        with self._generations_done:
+            if self._generations:
+                get_logger().info(f'Waiting up to {timeout} seconds for {self._generations} answers to finish')
+            if not self._generations_done.wait_for(lambda: self._generations == 0, timeout=timeout):
+                get_logger().warning(f'Stopping {self._generations} answers which did not finish in time')
+        self._cancellation_token.cancel()
+        with self._generations_done:
+            self._generations_done.wait_for(lambda: self._generations == 0, timeout=5)
+
+    def _save_preferences(self) -> None:
+        self.chatbot.storage.write(self.PREFERENCES_NAMESPACE, self.PREFERENCES_KEY, json.dumps(self.preferences).encode('utf-8'))
 
     def _load_preferences_from_file(self) -> Dict[str, Any]:
         try:
-            with open(self.preferences_file_path, 'r') as f:
-                return json.load(f)
+            data = self.chatbot.storage.read(self.PREFERENCES_NAMESPACE, self.PREFERENCES_KEY)
+            if data is None:
+                # Preferences used to be saved inside the installation folder
+                with open(path_to_resource(self.PREFERENCES_KEY), 'rb') as f:
+                    data = f.read()
+            return json.loads(data)
         except:
             return {}
 
+    def _generation_pool(self) -> Dict[str, Any]:
+        # All answers share one pool, apart from the other events, so a long answer never holds back saving or loading a chat
+        return {'concurrency_id': self.GENERATION_POOL, 'concurrency_limit': self.queue_config.generation_concurrency}
+
+    def _handler(self, function: Callable[..., Any], event: str) -> Callable[..., Any]:
+        return self.profiler.wrap(function, event) if self.profiler is not None else function
+
     def _get_list_of_models_and_display_names(self) -> List[Tuple[str, str]]:
         available_models: List[Tuple[str, str]] = list()
         for framework in self.available_frameworks:
@@ -56,25 +144,62 @@ class UI:
         return available_models
     
     def _stop_text_generation(self) -> None:
-        self._generate_text = False
+        self._cancellation_token.cancel()
+
+    def _new_cancellation_token(self) -> CancellationToken:
+        self._cancellation_token.cancel()
+        self._cancellation_token = CancellationToken()
+        return self._cancellation_token
 
     def _add_user_message_to_chat(self, prompt: str, history: List[List[str | None]]) -> Tuple[str, List[List[str | None]]]:
+        if self.chatbot.branches and history and history[-1][1] is None:
+            history = history[:-1]  # a compared prompt no answer was chosen for
         return '', history + [[prompt, None]]
 
-    def _add_bot_message_to_chat(self, history: List[List[str | None]], model: str, temperature: float, as_json: bool, system_prompt: str) -> Generator[List[List[str | None]], None, None]:
-        self._generate_text = True
+    @staticmethod
+    def _parse_json_schema(text: str) -> Dict[str, Any] | None:
+        if not text.strip():
+            return None
+        try:
+            schema = json.loads(text)
+            compile_schema(schema)
+            return schema
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            raise gr.Error(f'Invalid JSON Schema: {e}')
+
+    def _add_bot_message_to_chat(self, history: List[List[str | None]], model: str, temperature: float, as_json: bool, system_prompt: str, json_schema: str) -> Generator[List[List[str | None]], None, None]:
+        schema = self._parse_json_schema(json_schema) if as_json else None
+        cancellation_token = self._new_cancellation_token()
         if as_json:
-            generator = self.chatbot.get_json_response(history[-1][0] or '', system_prompt=system_prompt, model=model, temperature=temperature)
+            generator = self.chatbot.get_json_response(history[-1][0] or '', system_prompt=system_prompt, model=model, temperature=temperature, json_schema=schema, cancellation_token=cancellation_token)
         else:
-            generator = self.chatbot.get_stream_response(history[-1][0] or '', system_prompt=system_prompt, model=model, temperature=temperature)
-        
+            generator = self.chatbot.get_stream_response(history[-1][0] or '', system_prompt=system_prompt, model=model, temperature=temperature, cancellation_token=cancellation_token)
+        with self._generation():
+            yield from self._stream_to_history(history, generator)
+
+    def _regenerate(self, turn: int | None, model: str, temperature: float, as_json: bool, json_schema: str) -> Generator[List[List[str | None]], None, None]:
+        schema = self._parse_json_schema(json_schema) if as_json else None
+        cancellation_token = self._new_cancellation_token()
+        try:
+            generator = self.chatbot.regenerate(int(turn) if turn else None, model=model, temperature=temperature, as_json=as_json, json_schema=schema, cancellation_token=cancellation_token)
+        except ValueError as e:
+            gr.Warning(str(e))
+            return
+        history: List[List[str | None]] = self._history_from_chatbot()  # type: ignore
+        history[-1][1] = None
+        with self._generation():
+            yield history
+            yield from self._stream_to_history(history, generator)
+
+    def _stream_to_history(self, history: List[List[str | None]], generator: Generator[ChatMessagePiece, None, None]) -> Generator[List[List[str | None]], None, None]:
         for chat_piece in generator:
-            if not self._generate_text:
-                break
             if chat_piece.info_message:
                 gr.Info(chat_piece.info_message)
             if chat_piece.warning_message:
                 gr.Warning(chat_piece.warning_message)
+            if chat_piece.discard:
+                history[-1][1] = None
+                yield history
             if chat_piece.content:
                 current_message: str = history[-1][1] or ''
                 current_message = self.MODEL_NAME_SEPARATOR.join(current_message.split(self.MODEL_NAME_SEPARATOR)[:-1])
@@ -83,16 +208,93 @@ class UI:
                     current_message += f'{self.MODEL_NAME_SEPARATOR}_{chat_piece.model}_'
                 history[-1][1] = current_message
                 yield history 
+        last_message = self.chatbot.messages[-1] if self.chatbot.messages else None
+        if last_message is not None and last_message.truncated and last_message.role == 'assistant':
+            history[-1][1] = self._format_answer(last_message)
+            yield history
+
+    def _show_compare_columns(self, models: List[str] | None) -> List[Dict[str, Any]]:
+        models = models or []
+        display_names = dict(self._get_list_of_models_and_display_names())
+        row = [gr.update(visible=bool(models))]
+        columns = [gr.update(visible=i < len(models)) for i in range(self.MAX_COMPARED_MODELS)]
+        chats = [gr.update(value=[], label=display_names.get(models[i], models[i]) if i < len(models) else None) for i in range(self.MAX_COMPARED_MODELS)]
+        return row + columns + chats
+
+    def _add_compare_messages_to_chat(self, history: List[List[str | None]], models: List[str] | None, temperature: float, system_prompt: str) -> Generator[List[List[List[str | None]]], None, None]:
+        cancellation_token = self._new_cancellation_token()
+        models = (models or [])[:self.MAX_COMPARED_MODELS]
+        if not models:
+            gr.Warning("Select models to compare first")
+            return
+        prompt = history[-1][0] or ''
+        answers: Dict[str, str] = {model: '' for model in models}
+
+        def compare_histories() -> List[List[List[str | None]]]:
+            histories: List[List[List[str | None]]] = [[[prompt, answers[model]]] for model in models]
+            return histories + [[] for _ in range(self.MAX_COMPARED_MODELS - len(models))]
+
+        generator = self.chatbot.get_compare_stream_response(prompt, system_prompt=system_prompt, models=models, temperature=temperature, cancellation_token=cancellation_token)
+        with self._generation():
+            for model, chat_piece in generator:
+                if chat_piece.warning_message:
+                    gr.Warning(f'{model}: {chat_piece.warning_message}')
+                if chat_piece.content:
+                    answers[model] += chat_piece.content
+                    yield compare_histories()
+        
+        for model in models:
+            timing = self.chatbot.timings[model]
+            answers[model] += f'{self.MODEL_NAME_SEPARATOR}_{model}_ · ⏱ TTFT {timing.ttft or 0:.2f}s · Total {timing.total or 0:.2f}s'
+        yield compare_histories()
+
+    def _pick_compare_answer(self, index: int, history: List[List[str | None]], models: List[str] | None) -> Tuple[List[List[str | None]], Dict[str, Any]]:
+        models = models or []
+        if index >= len(models) or models[index] not in self.chatbot.branches:
+            gr.Warning("No compared answer to continue with")
+            return history, gr.update()
+        model = models[index]
+        self.chatbot.choose_compare_branch(model)
+        answer = self.chatbot.messages[-1].content or ''
+        history[-1][1] = answer + f'{self.MODEL_NAME_SEPARATOR}_{model}_'
+        return history, gr.update(visible=False)
+
+    def _branch_choices(self) -> Dict[str, Any]:
+        choices: List[Tuple[str, str]] = list()
+        for i, leaf in enumerate(self.chatbot.list_branches()):
+            messages = self.chatbot.tree.messages(leaf)
+            last_prompt = next((m.content or '' for m in reversed(messages) if m.role == 'user'), '')
+            model = next((m.model for m in reversed(messages) if m.role == 'assistant'), None)
+            label = f"{i+1}. {last_prompt[:self.BRANCH_LABEL_LENGTH]}" + (f" ({model})" if model else "")
+            choices.append((label, str(leaf)))
+        active = str(self.chatbot.tree.active_node)
+        return gr.update(choices=choices, value=active if active in [c[1] for c in choices] else None)
+
+    def _switch_branch(self, branch: str | None) -> List[List[str]]:
+        if branch:
+            self.chatbot.switch_branch(int(branch))
+            self.chatbot.save_session()
+        return self._history_from_chatbot()
+
+    def _fork(self, turn: int | None) -> List[List[str]]:
+        self._cancellation_token.cancel()
+        try:
+            self.chatbot.fork(int(turn) if turn else None)
+        except ValueError as e:
+            gr.Warning(str(e))
+        self.chatbot.save_session()
+        return self._history_from_chatbot()
 
     def _undo_last_message(self, history: List[List[str]]) -> List[List[str]]:
-        self._generate_text = False
+        self._cancellation_token.cancel()
         history.pop()
         self.chatbot.delete_last_interaction()
         return history
 
     def _start_new_chat(self) -> Tuple[str, List]:
-        self._generate_text = False
+        self._cancellation_token.cancel()
         self.chatbot.reset_chat()
+        self.chatbot.save_session()
         return '', []
 
     def _title_and_time_to_chat_display_name(self, title: str, time: datetime) -> str:
@@ -106,29 +308,62 @@ class UI:
 
     def _save_chat(self) -> None:
         self.chatbot.export_chat()
+        self.chatbot.save_session()
 
-    def _load_chat(self, display_name: str) -> Tuple[None, List[List[str]]]:
-        history: List[List[str]] = list()
+    def _restore_session(self) -> Tuple[List[List[str]], Dict[str, Any]]:
+        # Another worker may have continued the conversation, so the stored session is the one to show
+        self.chatbot.restore_session()
+        return self._history_from_chatbot(), gr.update(visible=self.chatbot.partially_loaded_chat is not None)
+
+    def _load_chat(self, display_name: str) -> Tuple[None, List[List[str]], Dict[str, Any]]:
         title, start_time = self._display_name_to_title_and_time(display_name)
-        self.chatbot.load_chat(title, start_time)
+        self.chatbot.load_chat(title, start_time, last_turns=Settings().ui.loaded_turns)
+        self.chatbot.save_session()
+        return None, self._history_from_chatbot(), gr.update(visible=self.chatbot.partially_loaded_chat is not None)
+
+    def _load_older_messages(self) -> Tuple[List[List[str]], Dict[str, Any]]:
+        self.chatbot.load_older_messages(Settings().ui.loaded_turns)
+        return self._history_from_chatbot(), gr.update(visible=self.chatbot.partially_loaded_chat is not None)
+
+    def _format_answer(self, message: Message) -> str:
+        if not message.content:
+            return ''
+        return message.content + (self.TRUNCATED_MARK if message.truncated else '') + (f'{self.MODEL_NAME_SEPARATOR}_{message.model}_' if message.model else '')
+
+    def _history_from_chatbot(self) -> List[List[str]]:
+        history: List[List[str]] = list()
         messages = self.chatbot.get_displayed_messages()
         for message in messages:
             if message.role == 'user':
                 history.append([message.content or '', ''])
             elif message.role == 'assistant':
-                if message.content:
-                    history[-1][1] = message.content + (f'{self.MODEL_NAME_SEPARATOR}_{message.model}_' if message.model else '')
-                else:
-                    history[-1][1] = ''
+                history[-1][1] = self._format_answer(message)
             else:
                 raise ValueError(f"Can't display message with role {message.role}")
-        return None, history
+        return history
     
+    def _usage_table(self, title: str, totals: Dict[str, UsageTotal]) -> str:
+        if not totals:
+            return f'**{title}**\n\nNo usage yet'
+        rows = [f'**{title}**\n', '| Model | Prompt | Cached | Completion | Cost |', '|---|---:|---:|---:|---:|']
+        for model, total in totals.items():
+            rows.append(f'| {model} | {total.usage.prompt_tokens:,} | {total.usage.cached_tokens:,} | {total.usage.completion_tokens:,} | ${total.cost:.4f} |')
+        if len(totals) > 1:
+            rows.append(f'| **Total** | | | | **${sum(t.cost for t in totals.values()):.4f}** |')
+        return '\n'.join(rows)
+
+    def _usage_summary(self) -> str:
+        ledger = self.chatbot.usage_ledger
+        chat_totals = {model: UsageTotal(usage=usage, cost=ledger.cost(model, usage)) for model, usage in self.chatbot.chat_usage().items()}
+        return '\n\n'.join([
+            self._usage_table('This chat', chat_totals),
+            self._usage_table('Today', ledger.totals('model', since=date.today())),
+            self._usage_table(f'Last {self.USAGE_DAYS} days', ledger.totals('model', since=date.today() - timedelta(days=self.USAGE_DAYS - 1)))
+        ])
+
     def _delete_chat_file(self, display_name: str) -> None:
         title, start_time = self._display_name_to_title_and_time(display_name)
-        filename = SavedChat.title_and_time_to_filename(title, start_time)
-        file_path = os.path.join(self.chatbot.saved_chats_dir, filename)
-        pathlib.Path.unlink(file_path)  # type: ignore
+        self.chatbot.delete_chat(title, start_time)
 
     def _list_saved_chats(self) -> List[str]:
         saved_chats = self.chatbot.list_saved_chats()
@@ -173,60 +408,145 @@ class UI:
                     with gr.Group():
                         model = gr.Dropdown(label="Model", interactive=True, choices=available_models, value=self.preferences['model'])  # type: ignore
                         with gr.Accordion(label="System Prompt", open=False):
-                            system_prompt = gr.TextArea(value="You are a helpful AI assistance, and your task is to assist the user with all its requests in the best possible way", container=False, interactive=True, lines=10)
+                            system_prompt = gr.TextArea(value=Chatbot.DEFAULT_SYSTEM_PROMPT, container=False, interactive=True, lines=10)
                         temperature = gr.Slider(label="Temperature", minimum=0., maximum=1., step=.01, value=self.preferences.get('temperature', 0.))
                         force_json = gr.Checkbox(label="Force JSON", value=False, interactive=True)
+                        with gr.Accordion(label="JSON Schema", open=False):
+                            json_schema = gr.TextArea(placeholder="Optional, answers are validated against it when forcing JSON", container=False, interactive=True, lines=8)
+                        compare_models = gr.Dropdown(label="Compare Models", interactive=True, multiselect=True, max_choices=self.MAX_COMPARED_MODELS, choices=available_models, value=[])  # type: ignore
                     gr.Markdown("Not all models support all options, see [documentation](https://shakedzy.xyz/eevee-chat/tools/#known-limitations) for more information")
                     gr.Markdown("\n---\n")
                     with gr.Group():
                         saved_chats = gr.Radio(label="Saved Chats", choices=self._list_saved_chats(), elem_classes="files_list", value=None)  # type: ignore
                         load_chat = gr.Button("Load")
                         delete_chat = gr.Button("Delete", variant='stop')
+                    with gr.Accordion(label="Usage", open=False):
+                        usage = gr.Markdown()
 
                 with gr.Column(scale=10):
+                    load_older = gr.Button("Load Older Messages", size='sm', visible=False)
                     chat = gr.Chatbot(show_label=False, show_copy_button=True, height='80vh')
+                    with gr.Row(visible=False) as compare_row:
+                        compare_columns: List[gr.Column] = []
+                        compare_chats: List[gr.Chatbot] = []
+                        compare_picks: List[gr.Button] = []
+                        for _ in range(self.MAX_COMPARED_MODELS):
+                            with gr.Column(visible=False) as compare_column:
+                                compare_chats.append(gr.Chatbot(show_copy_button=True, height='60vh'))
+                                compare_picks.append(gr.Button("Continue with this answer"))
+                            compare_columns.append(compare_column)
                     with gr.Row():
                         undo_last = gr.Button("Undo Last", variant='stop')
                         msg = gr.Textbox(label="Prompt (Press Enter to Send)", show_label=False, scale=9, container=False)
                         submit = gr.Button("Submit", variant='primary', scale=1)
+                        compare = gr.Button("Compare", scale=1)
                         stop = gr.Button("🟥 Stop", variant='stop', scale=1, visible=False)
+                    with gr.Row():
+                        branch = gr.Dropdown(label="Branch", choices=[], interactive=True, scale=8)
+                        turn = gr.Number(label="Turn (empty for last)", value=None, precision=0, minimum=1, scale=2)
+                        fork = gr.Button("Fork", scale=1)
+                        regenerate = gr.Button("Regenerate", scale=1)
 
+            # Named, so the chain can be driven through the API (see scripts/load_test.py)
             submit.click(
-                self._add_user_message_to_chat, [msg, chat], [msg, chat]
+                self._handler(self._add_user_message_to_chat, 'add_user_message'), [msg, chat], [msg, chat], api_name='add_user_message'
             ).then(
                 lambda: (gr.update(visible=True), gr.update(visible=False)), None, [stop, submit]
             ).then(
-                self._add_bot_message_to_chat, [chat, model, temperature, force_json, system_prompt], chat
-            ).then(
-                self._save_chat
+                self._handler(self._add_bot_message_to_chat, 'add_bot_message'), [chat, model, temperature, force_json, system_prompt, json_schema], chat, api_name='add_bot_message', **self._generation_pool()
             ).then(
                 lambda: (gr.update(visible=True), gr.update(visible=False)), None, [submit, stop]
+            ).then(
+                self._handler(self._save_chat, 'save_chat'), api_name='save_chat'
             ).then(
                 lambda: gr.update(choices=self._list_saved_chats()), None, saved_chats
+            ).then(
+                self._handler(self._branch_choices, 'branch_choices'), None, branch, api_name='branch_choices'
+            ).then(
+                self._handler(self._usage_summary, 'usage_summary'), None, usage, api_name='usage_summary'
             )
 
             msg.submit(
-                self._add_user_message_to_chat, [msg, chat], [msg, chat]
+                self._handler(self._add_user_message_to_chat, 'add_user_message'), [msg, chat], [msg, chat]
             ).then(
                 lambda: (gr.update(visible=True), gr.update(visible=False)), None, [stop, submit]
             ).then(
-                self._add_bot_message_to_chat, [chat, model, temperature, force_json, system_prompt], chat
+                self._handler(self._add_bot_message_to_chat, 'add_bot_message'), [chat, model, temperature, force_json, system_prompt, json_schema], chat, **self._generation_pool()
             ).then(
-                self._save_chat
+                lambda: (gr.update(visible=True), gr.update(visible=False)), None, [submit, stop]
+            ).then(
+                self._handler(self._save_chat, 'save_chat')
+            ).then(
+                lambda: gr.update(choices=self._list_saved_chats()), None, saved_chats
+            ).then(
+                self._handler(self._branch_choices, 'branch_choices'), None, branch
+            ).then(
+                self._handler(self._usage_summary, 'usage_summary'), None, usage
+            )
+
+            compare.click(
+                self._handler(self._add_user_message_to_chat, 'add_user_message'), [msg, chat], [msg, chat]
+            ).then(
+                self._show_compare_columns, compare_models, [compare_row, *compare_columns, *compare_chats]  # type: ignore
+            ).then(
+                lambda: (gr.update(visible=True), gr.update(visible=False)), None, [stop, submit]
+            ).then(
+                self._handler(self._add_compare_messages_to_chat, 'compare'), [chat, compare_models, temperature, system_prompt], compare_chats, **self._generation_pool()  # type: ignore
+            ).then(
+                lambda: (gr.update(visible=True), gr.update(visible=False)), None, [submit, stop]
+            ).then(
+                self._handler(self._usage_summary, 'usage_summary'), None, usage
+            )
+
+            for i, compare_pick in enumerate(compare_picks):
+                compare_pick.click(
+                    partial(self._pick_compare_answer, i), [chat, compare_models], [chat, compare_row]
+                ).then(
+                    self._handler(self._save_chat, 'save_chat')
+                ).then(
+                    lambda: gr.update(choices=self._list_saved_chats()), None, saved_chats
+                ).then(
+                    self._handler(self._branch_choices, 'branch_choices'), None, branch
+                ).then(
+                    self._handler(self._usage_summary, 'usage_summary'), None, usage
+                )
+
+            regenerate.click(
+                lambda: (gr.update(visible=True), gr.update(visible=False), gr.update(visible=False)), None, [stop, submit, compare_row]
+            ).then(
+                self._handler(self._regenerate, 'regenerate'), [turn, model, temperature, force_json, json_schema], chat, **self._generation_pool()
             ).then(
                 lambda: (gr.update(visible=True), gr.update(visible=False)), None, [submit, stop]
+            ).then(
+                self._handler(self._save_chat, 'save_chat')
             ).then(
                 lambda: gr.update(choices=self._list_saved_chats()), None, saved_chats
+            ).then(
+                self._handler(self._branch_choices, 'branch_choices'), None, branch
+            ).then(
+                self._handler(self._usage_summary, 'usage_summary'), None, usage
             )
 
-            stop.click(self._stop_text_generation)
-            undo_last.click(self._undo_last_message, chat, chat).then(self._save_chat)
-            new_chat.click(self._start_new_chat, None, [msg, chat])
-            load_chat.click(self._start_new_chat, None, [msg, chat]).then(self._load_chat, saved_chats, [saved_chats, chat])
+            fork.click(self._fork, turn, chat).then(lambda: gr.update(visible=False), None, compare_row).then(self._branch_choices, None, branch)
+            branch.input(self._switch_branch, branch, chat).then(lambda: gr.update(visible=False), None, compare_row)
+
+            # Never waits in the queue, even when it's full
+            stop.click(self._stop_text_generation, queue=False)
+            undo_last.click(self._undo_last_message, chat, chat).then(self._save_chat).then(self._branch_choices, None, branch)
+            undo_last.click(lambda: gr.update(visible=False), None, compare_row)
+            new_chat.click(self._start_new_chat, None, [msg, chat]).then(lambda: (gr.update(visible=False), gr.update(visible=False)), None, [compare_row, load_older]).then(self._branch_choices, None, branch).then(self._usage_summary, None, usage)
+            load_chat.click(self._start_new_chat, None, [msg, chat]).then(lambda: gr.update(visible=False), None, compare_row).then(self._handler(self._load_chat, 'load_chat'), saved_chats, [saved_chats, chat, load_older]).then(self._branch_choices, None, branch).then(self._usage_summary, None, usage)
+            load_older.click(self._handler(self._load_older_messages, 'load_older_messages'), None, [chat, load_older])
             delete_chat.click(self._delete_chat_file, saved_chats, None).then(lambda: gr.update(choices=self._list_saved_chats()), None, saved_chats)
 
-            def __update_pref_model(model: str) -> None: self.preferences['model'] = model
-            def __update_pref_temperature(temperature: float) -> None: self.preferences['temperature'] = temperature
+            ui.load(self._handler(self._restore_session, 'restore_session'), None, [chat, load_older]).then(self._branch_choices, None, branch).then(self._usage_summary, None, usage)
+
+            def __update_pref_model(model: str) -> None: 
+                self.preferences['model'] = model
+                self._save_preferences()
+            def __update_pref_temperature(temperature: float) -> None: 
+                self.preferences['temperature'] = temperature
+                self._save_preferences()
             model.change(__update_pref_model, model, None)
             temperature.change(__update_pref_temperature, temperature, None)
 
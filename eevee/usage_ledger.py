@@ -0,0 +1,102 @@
+import json
+import uuid
+import threading
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Dict, Literal, Tuple, Iterator
+from .messages import Usage
+from .settings import Settings
+from .storage_backends.storage_interface import StorageBackend
+
+
+@dataclass(slots=True)
+class ModelPrice:
+    # USD per million tokens
+    input: float = 0.
+    output: float = 0.
+    cached_input: float | None = None
+
+    def cost(self, usage: Usage) -> float:
+        cached_input = self.cached_input if self.cached_input is not None else self.input
+        uncached_tokens = usage.prompt_tokens - usage.cached_tokens
+        return (uncached_tokens * self.input + usage.cached_tokens * cached_input + usage.completion_tokens * self.output) / 1_000_000
+
+
+@dataclass(slots=True)
+class UsageTotal:
+    usage: Usage = field(default_factory=Usage)
+    cost: float = 0.
+
+
+class UsageLedger:
+    """
+    Totals the tokens used per day, session and model in the storage. Each ledger writes its own record per day,
+    summed with the others when queried, so processes sharing the storage never overwrite each other's totals.
+    Costs are computed when queried, from the prices in the config.
+    """
+    NAMESPACE = "usage"
+    DATE_FORMAT = "%Y-%m-%d"
+    # Between the day and the ledger's ID in the keys of the records. Older versions wrote a single record per day.
+    WRITER_SEPARATOR = "."
+
+    def __init__(self, storage: StorageBackend, session_id: str) -> None:
+        self.storage: StorageBackend = storage
+        self.session_id: str = session_id
+        self.prices: Dict[str, ModelPrice] = {
+            price.model: ModelPrice(input=price.input, output=price.output, cached_input=price.get('cached_input', None))
+            for price in Settings().prices.models
+        }
+        self.writer_id: str = uuid.uuid4().hex
+        # The records written by this ledger, by day
+        self._records: Dict[str, Dict[str, Dict[str, Dict[str, int]]]] = dict()
+        self._lock = threading.Lock()
+
+    def cost(self, model: str, usage: Usage) -> float:
+        """
+        The cost of the usage in USD, 0 for models without a configured price
+        """
+        price = self.prices.get(model, None)
+        return price.cost(usage) if price is not None else 0.
+
+    def _read_record(self, key: str) -> Dict[str, Dict[str, Dict[str, int]]]:
+        data = self.storage.read(self.NAMESPACE, key)
+        return json.loads(data) if data is not None else dict()
+
+    def record(self, model: str, usage: Usage, session_id: str | None = None) -> None:
+        day = datetime.now().strftime(self.DATE_FORMAT)
+        with self._lock:
+            # Only this ledger writes its record, so it never has to be read back
+            record = self._records.setdefault(day, dict())
+            models = record.setdefault(session_id or self.session_id, dict())
+            models[model] = (Usage.from_dict(models.get(model, {})) + usage).as_dict()
+            self.storage.write(self.NAMESPACE, day + self.WRITER_SEPARATOR + self.writer_id, json.dumps(record).encode('utf-8'))
+
+    def totals(self,
+               by: Literal['model', 'day', 'session'],
+               since: date | None = None,
+               until: date | None = None,
+               session_id: str | None = None
+               ) -> Dict[str, UsageTotal]:
+        """
+        Returns the tokens used and their cost, grouped by model, day or session, between the given days (inclusive).
+        If a session ID is provided, only the usage of that session is counted.
+        """
+        totals: Dict[str, UsageTotal] = dict()
+        for day, session, model, usage in self._entries(since, until):
+            if session_id is not None and session != session_id:
+                continue
+            key = {'model': model, 'day': day, 'session': session}[by]
+            total = totals.setdefault(key, UsageTotal())
+            total.usage += usage
+            total.cost += self.cost(model, usage)
+        return dict(sorted(totals.items()))
+
+    def _entries(self, since: date | None, until: date | None) -> Iterator[Tuple[str, str, str, Usage]]:
+        for key in sorted(self.storage.list_keys(self.NAMESPACE)):
+            day = key.split(self.WRITER_SEPARATOR, 1)[0]
+            day_date = datetime.strptime(day, self.DATE_FORMAT).date()
+            if (since is not None and day_date < since) or (until is not None and day_date > until):
+                continue
+            for session, models in self._read_record(key).items():
+                for model, usage in models.items():
+                    yield day, session, model, Usage.from_dict(usage)
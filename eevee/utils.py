@@ -1,5 +1,14 @@
+import os
 import pkg_resources
+from .settings import Settings
 
 
 def path_to_resource(filename: str) -> str:
     return pkg_resources.resource_filename('eevee', f'resources/{filename}')
+
+
+def data_directory() -> str:
+    """
+    Where chats, caches and indexes are kept: the configured storage directory, or ~/.eevee by default
+    """
+    return os.path.expanduser(Settings().storage.directory or os.path.join('~', '.eevee'))
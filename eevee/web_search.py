@@ -0,0 +1,140 @@
+import os
+import time
+import threading
+from dataclasses import dataclass
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from duckduckgo_search import DDGS
+from typing import List, Dict, Callable
+from .color_logger import get_logger
+from .settings import Settings
+from .client_registry import ClientRegistry
+
+
+@dataclass(slots=True)
+class SearchResult:
+    title: str
+    url: str
+    description: str
+
+
+SearchBackend = Callable[[str, int], List[SearchResult]]
+
+
+def duckduckgo_search(query: str, max_results: int) -> List[SearchResult]:
+    results: List[SearchResult] = list()
+    for result in DDGS().text(query, max_results=max_results) or []:
+        if result.get('href'):
+            results.append(SearchResult(title=result.get('title') or '', url=result['href'], description=result.get('body') or ''))
+    return results
+
+
+def google_search(query: str, max_results: int) -> List[SearchResult]:
+    service = ClientRegistry().discovery_service("customsearch", "v1", developer_key=os.environ['GOOGLE_SEARCH_API_KEY'])
+    response = service.cse().list(q=query, cx=os.environ['GOOGLE_SEARCH_CSE_ID'], num=max_results).execute()
+    return [SearchResult(title=item['title'], url=item['link'], description=item.get('snippet', '')) for item in response.get('items', [])]
+
+
+def _google_search_enabled() -> bool:
+    return bool(os.environ.get('GOOGLE_SEARCH_API_KEY', None) and os.environ.get('GOOGLE_SEARCH_CSE_ID', None))
+
+
+_TRACKING_PARAMS_PREFIXES = ('utm_', 'fbclid', 'gclid', 'msclkid', 'ref_src')
+
+
+def normalize_url(url: str) -> str:
+    """
+    A key identifying the page of a URL, ignoring the scheme, `www.`, default ports, fragments, tracking parameters,
+    the order of the query parameters and trailing slashes
+    """
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or '').lower().removeprefix('www.')
+    if parts.port and parts.port not in (80, 443):
+        host += f':{parts.port}'
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not k.lower().startswith(_TRACKING_PARAMS_PREFIXES))
+    return urlunsplit(('', host, parts.path.rstrip('/'), urlencode(query), ''))
+
+
+class SearchAggregator:
+    """
+    Queries several search backends concurrently, and merges their results. Each backend has a deadline, and once
+    the first one returns results, the others only get a short grace period, so a search takes about as long as the fastest
+    backend. A backend failing or finding nothing doesn't cut the others short.
+    Results are deduplicated by their normalized URL, and ranked by Reciprocal Rank Fusion over the backends.
+    """
+    RRF_K = 60
+
+    def __init__(self, backends: Dict[str, SearchBackend] | None = None) -> None:
+        search_settings = Settings().web_search
+        available: Dict[str, SearchBackend] = {'duckduckgo': duckduckgo_search}
+        if _google_search_enabled():
+            available['google'] = google_search
+        self.backends: Dict[str, SearchBackend] = backends if backends is not None else {
+            name: available[name] for name in search_settings.backends if name in available
+        }
+        if not self.backends:
+            raise ValueError('No search backend is available')
+        self.timeouts: Dict[str, float] = {name: (search_settings.get('timeouts', None) or {}).get(name, search_settings.timeout_seconds) for name in self.backends}
+        self.grace_seconds: float = search_settings.grace_seconds
+        # Backends still running past their deadline finish here in the background, and their results are dropped
+        self._executor = ThreadPoolExecutor(max_workers=4 * len(self.backends), thread_name_prefix='search')
+        self.logger = get_logger()
+
+    def search(self, query: str, max_results: int) -> List[SearchResult]:
+        start = time.perf_counter()
+        futures: Dict[Future, str] = {self._executor.submit(backend, query, max_results): name for name, backend in self.backends.items()}
+        deadlines = {name: start + timeout for name, timeout in self.timeouts.items()}
+        ranked_lists: Dict[str, List[SearchResult]] = dict()
+        pending = set(futures.keys())
+        while pending:
+            now = time.perf_counter()
+            remaining = min(deadlines[futures[f]] for f in pending) - now
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = futures[future]
+                try:
+                    ranked_lists[name] = future.result()
+                    self.logger.debug(f'{name} returned {len(ranked_lists[name])} results in {time.perf_counter() - start:.2f}s')
+                except Exception as e:
+                    self.logger.error(f'Searching with {name} failed: {e}')
+            if any(ranked_lists.values()):
+                # The other backends now only have the grace period left
+                grace_deadline = time.perf_counter() + self.grace_seconds
+                for future in pending:
+                    deadlines[futures[future]] = min(deadlines[futures[future]], grace_deadline)
+            pending = {f for f in pending if deadlines[futures[f]] > time.perf_counter()}
+        for future in futures:
+            if not future.done():
+                self.logger.debug(f'Dropped the results of {futures[future]}, which missed its deadline')
+        return self.merge(ranked_lists)[:max_results]
+
+    @classmethod
+    def merge(cls, ranked_lists: Dict[str, List[SearchResult]]) -> List[SearchResult]:
+        scores: Dict[str, float] = dict()
+        results: Dict[str, SearchResult] = dict()
+        for ranked in ranked_lists.values():
+            seen: set[str] = set()
+            for rank, result in enumerate(ranked, start=1):
+                key = normalize_url(result.url)
+                if key in seen:
+                    continue
+                seen.add(key)
+                scores[key] = scores.get(key, 0.) + 1. / (cls.RRF_K + rank)
+                # The longest description of the page is kept
+                if key not in results or len(result.description) > len(results[key].description):
+                    results[key] = result
+        return [results[key] for key in sorted(scores.keys(), key=lambda k: scores[k], reverse=True)]
+
+
+_aggregator: SearchAggregator | None = None
+_aggregator_lock = threading.Lock()
+
+
+def search_aggregator() -> SearchAggregator:
+    global _aggregator
+    with _aggregator_lock:
+        if _aggregator is None:
+            _aggregator = SearchAggregator()
+        return _aggregator
@@ -0,0 +1,85 @@
+"""
+Throughput of `eevee export` and `eevee import`: saves a synthetic corpus of chats, each with a tool output in the
+blob store, exports it from one storage backend and imports it into another, reporting chats per second of each.
+
+    python scripts/archive_benchmark.py --chats 10000
+    python scripts/archive_benchmark.py --source sqlite --target filesystem --workers 1 2 4
+"""
+import os
+import time
+import tempfile
+from datetime import datetime, timedelta
+from argparse import ArgumentParser
+
+
+SYSTEM_PROMPT = "You are a helpful assistant"
+
+
+def make_storage(backend: str, directory: str):
+    from eevee.storage_backends.filesystem_backend import FilesystemBackend
+    from eevee.storage_backends.sqlite_backend import SQLiteBackend
+    os.makedirs(directory, exist_ok=True)
+    if backend == 'sqlite':
+        return SQLiteBackend(os.path.join(directory, 'eevee.db'))
+    return FilesystemBackend(directory)
+
+
+def save_corpus(storage, chats: int, turns: int) -> None:
+    from eevee.saved_chat import SavedChat
+    from eevee.blob_store import BlobStore
+    blob_store = BlobStore(storage)
+    start = datetime(2024, 1, 1)
+    for i in range(chats):
+        messages = [{'role': 'system', 'content': SYSTEM_PROMPT}]
+        for turn in range(turns):
+            messages.append({'role': 'user', 'content': f'Question {turn} of chat {i}: ' + 'lorem ipsum ' * 20})
+            if turn == 0:
+                # Tool outputs repeat across chats, as when several chats visit the same pages
+                messages.append({'role': 'tool', 'content': None, 'content_ref': blob_store.put(f'Page {i % 100} ' + 'dolor sit amet ' * 500)})
+            messages.append({'role': 'assistant', 'content': f'Answer {turn} of chat {i}: ' + 'consectetur adipiscing ' * 40})
+        start_time = start + timedelta(seconds=i)
+        data, index = SavedChat.serialize({'start_time': start_time.strftime(SavedChat.TIME_FORMAT), 'metadata': {}, 'messages': messages})
+        key = SavedChat.title_and_time_to_filename(f'Chat {i}', start_time)
+        storage.write(SavedChat.NAMESPACE, key, data)
+        storage.write(SavedChat.INDEX_NAMESPACE, key, index)
+
+
+def main() -> None:
+    parser = ArgumentParser(description="Throughput of exporting and importing Eevee chat archives")
+    parser.add_argument('--chats', type=int, default=10000, help='Chats of the synthetic corpus')
+    parser.add_argument('--turns', type=int, default=5, help='Turns of each chat')
+    parser.add_argument('--source', choices=['filesystem', 'sqlite'], default='filesystem', help='Backend the chats are exported from')
+    parser.add_argument('--target', choices=['filesystem', 'sqlite'], default='sqlite', help='Backend the chats are imported into')
+    parser.add_argument('--workers', nargs='+', type=int, default=[0], help='Worker processes of each run, 0 uses all cores')
+    parser.add_argument('--chunk-size', dest='chunk_size', type=int, default=None, help='Chats handed to a worker at a time')
+    args = parser.parse_args()
+
+    from eevee.settings import init_settings
+    from eevee.utils import path_to_resource
+    from eevee.chat_archive import ChatArchive
+    init_settings([path_to_resource('config.toml')])
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = make_storage(args.source, os.path.join(directory, 'source'))
+        started = time.perf_counter()
+        save_corpus(source, args.chats, args.turns)
+        print(f'Saved {args.chats} chats in {time.perf_counter() - started:.1f}s')
+
+        print('Workers |   Export   |   Import   | Archive')
+        for i, workers in enumerate(args.workers):
+            path = os.path.join(directory, 'chats.jsonl.zst')
+            target = make_storage(args.target, os.path.join(directory, f'target{i}'))
+            timings = []
+            for storage, run in [(source, 'export_to'), (target, 'import_from')]:
+                archive = ChatArchive(storage)
+                archive.workers = workers or archive.workers
+                archive.chunk_size = args.chunk_size or archive.chunk_size
+                started = time.perf_counter()
+                getattr(archive, run)(path)
+                timings.append(time.perf_counter() - started)
+            size = os.path.getsize(path) / 2**20
+            print(f'{workers or os.cpu_count():>7} | {args.chats / timings[0]:>6.0f}/s | {args.chats / timings[1]:>6.0f}/s | {size:.2f} MB')
+
+
+if __name__ == '__main__':
+    main()
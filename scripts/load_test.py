@@ -0,0 +1,161 @@
+"""
+Load test of the UI: starts Eevee with a mock provider in a separate process, and drives the chain of the Submit button
+(add_user_message -> add_bot_message -> save_chat) through `gradio_client` from an increasing number of concurrent users,
+reporting the latency percentiles of each concurrency level.
+
+    python scripts/load_test.py --concurrency 1 2 4 8 16 --requests 40
+    python scripts/load_test.py --profile load.folded   # also profiles the server, see `eevee --profile`
+"""
+import os
+import sys
+import time
+import signal
+import tempfile
+import subprocess
+import numpy as np
+from argparse import ArgumentParser, SUPPRESS
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Generator
+
+
+MOCK_MODEL = "gpt-4"
+SYSTEM_PROMPT = "You are a helpful assistant"
+
+
+def serve(args) -> None:
+    from eevee.settings import init_settings
+    from eevee.utils import path_to_resource
+    from eevee.chatbot import Chatbot
+    from eevee.ui import UI
+    from eevee.messages import Messages, ChatMessagePiece, Usage
+    from eevee.cancellation import CancellationToken
+    from eevee.profiling import EventProfiler
+    from eevee.queue_monitor import QueueMonitor
+    from eevee.chat_connectors.connector_interface import Connector
+
+    class MockConnector(Connector):
+        """
+        Streams a fixed answer at a fixed pace, without calling any provider
+        """
+        def get_streaming_response(self, model: str, temperature: float, messages: Messages, tools: List[Dict[str, Any]], cancellation_token: CancellationToken | None = None) -> Generator[ChatMessagePiece, None, None]:
+            time.sleep(args.ttft)
+            for i in range(args.tokens):
+                if cancellation_token is not None and cancellation_token.cancelled:
+                    return
+                yield ChatMessagePiece(content=f'token{i} ')
+                time.sleep(args.token_interval)
+            yield ChatMessagePiece(usage=Usage(prompt_tokens=100, completion_tokens=args.tokens))
+
+        def get_json_response(self, model: str, temperature: float, messages: Messages, tools: List[Dict[str, Any]], cancellation_token: CancellationToken | None = None) -> Generator[ChatMessagePiece, None, None]:
+            yield from self.get_streaming_response(model, temperature, messages, tools, cancellation_token)
+
+    # Chats are saved to a temporary directory, and responses are never served from the caches
+    overrides_path = os.path.join(args.directory, 'load_test.toml')
+    with open(overrides_path, 'w') as f:
+        f.write(f'[queue]\ngeneration_concurrency = {args.generation_concurrency}\n[storage]\ndirectory = "{args.directory}"\n[cache]\nenabled = false\n[semantic_cache]\nenabled = false\n')
+    init_settings([path_to_resource('config.toml'), overrides_path])
+    os.environ.setdefault('OPENAI_API_KEY', 'mock')
+    chatbot = Chatbot({'openai'})
+    chatbot.clients['openai'] = MockConnector()
+    profiler = EventProfiler(args.profile) if args.profile else None
+    if profiler is not None:
+        profiler.start()
+    accept_boolean_schemas()
+    ui = UI(chatbot, {'openai'}, port=args.port, profiler=profiler)
+    ui.preferences = {'model': MOCK_MODEL}
+    ui.ui = ui._build_ui()
+    ui.ui.queue(max_size=ui.queue_config.max_size or None, default_concurrency_limit=ui.queue_config.bookkeeping_concurrency)
+    monitor = QueueMonitor(ui.ui, report_interval_seconds=float('inf'))
+    monitor.start()
+    try:
+        ui.ui.launch(server_port=args.port, prevent_thread_lock=False, quiet=True, max_threads=ui.queue_config.max_threads)
+    finally:
+        # Logs the queue's depth and waits over the whole test
+        monitor.stop()
+        if profiler is not None:
+            profiler.stop()
+        chatbot.close()
+
+
+def submit_chain(client) -> float:
+    start = time.perf_counter()
+    _, history = client.predict('How many users can you handle?', [], api_name='/add_user_message')
+    client.predict(history, MOCK_MODEL, 0., False, SYSTEM_PROMPT, '', api_name='/add_bot_message')
+    client.predict(api_name='/save_chat')
+    return time.perf_counter() - start
+
+
+def accept_boolean_schemas() -> None:
+    # The gradio_client pinned with gradio 4.23 fails on boolean JSON schemas, which pydantic 2 emits for gr.Chatbot,
+    # both in the client and in the server's API info
+    from gradio_client import utils
+    to_python_type = utils._json_schema_to_python_type
+    utils._json_schema_to_python_type = lambda schema, defs=None: 'Any' if isinstance(schema, bool) else to_python_type(schema, defs)
+
+
+def run_level(url: str, concurrency: int, requests: int) -> None:
+    from gradio_client import Client
+    clients = [Client(url, verbose=False) for _ in range(concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(submit_chain, clients[i % concurrency]) for i in range(requests)]
+        latencies = [future.result() for future in futures]
+    elapsed = time.perf_counter() - start
+    p50, p99 = np.percentile(latencies, [50, 99])
+    print(f'{concurrency:>11} | {p50:>7.2f}s | {p99:>7.2f}s | {requests / elapsed:>8.2f}/s')
+
+
+def wait_for_server(url: str, process: subprocess.Popen, timeout: float = 60) -> None:
+    import httpx
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('The server exited before starting')
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.5)
+    raise TimeoutError(f'The server did not start within {timeout} seconds')
+
+
+def main() -> None:
+    parser = ArgumentParser(description="Load test of the Eevee UI against a mock provider")
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 2, 4, 8, 16], help='Concurrent users of each level')
+    parser.add_argument('--requests', type=int, default=32, help='Prompts submitted at each level')
+    parser.add_argument('--port', type=int, default=4343)
+    parser.add_argument('--ttft', type=float, default=0.3, help='Seconds before the mock provider streams its first token')
+    parser.add_argument('--tokens', type=int, default=200, help='Tokens of each mock answer')
+    parser.add_argument('--token-interval', dest='token_interval', type=float, default=0.005, help='Seconds between mock tokens')
+    parser.add_argument('--generation-concurrency', dest='generation_concurrency', type=int, default=1, help='Answers the server generates at once')
+    parser.add_argument('--profile', type=str, default=None, help='Profile the server, writing folded stacks to this file')
+    parser.add_argument('--serve', action='store_true', help=SUPPRESS)
+    parser.add_argument('--directory', type=str, default=None, help=SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args)
+        return
+
+    accept_boolean_schemas()
+    url = f'http://127.0.0.1:{args.port}/'
+    with tempfile.TemporaryDirectory() as directory:
+        command = [sys.executable, __file__, '--serve', '--directory', directory, '--port', str(args.port), '--ttft', str(args.ttft),
+                   '--tokens', str(args.tokens), '--token-interval', str(args.token_interval),
+                   '--generation-concurrency', str(args.generation_concurrency)]
+        if args.profile:
+            command += ['--profile', os.path.abspath(args.profile)]
+        process = subprocess.Popen(command, env={**os.environ, 'GRADIO_ANALYTICS_ENABLED': 'False'})
+        try:
+            wait_for_server(url, process)
+            print('Concurrency |     p50  |     p99  | Throughput')
+            for concurrency in args.concurrency:
+                run_level(url, concurrency, max(args.requests, concurrency))
+        finally:
+            # Interrupted like a user stopping it, so the profile is written
+            process.send_signal(signal.SIGINT)
+            process.wait(timeout=30)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+import os
+import time
+import tempfile
+import threading
+import socketserver
+import pytest
+from typing import Dict, Set, List, Any, Iterator, Generator
+from eevee.settings import init_settings
+from eevee.utils import path_to_resource
+from eevee.messages import Messages, ChatMessagePiece, Usage
+from eevee.cancellation import CancellationToken, until_cancelled, closed_on_cancel
+from eevee.chat_connectors.connector_interface import Connector
+
+
+_DATA_DIRECTORY = tempfile.mkdtemp(prefix='eevee-tests-')
+_OVERRIDES_PATH = os.path.join(_DATA_DIRECTORY, 'tests.toml')
+with open(_OVERRIDES_PATH, 'w') as f:
+    # Nothing is written to the user's data directory, and answers are never served from a cache
+    f.write(f'[storage]\ndirectory = "{_DATA_DIRECTORY}"\nwrite_behind = false\n[cache]\nenabled = false\n')
+init_settings([path_to_resource('config.toml'), _OVERRIDES_PATH])
+
+
+class RespStandIn(socketserver.ThreadingTCPServer):
+    """
+    An in-process server speaking enough of the Redis protocol (RESP) for the RedisBackend
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, password: str | None = None) -> None:
+        super().__init__(('127.0.0.1', 0), _RespHandler)
+        self.password: str | None = password
+        self.values: Dict[bytes, bytes] = dict()
+        self.sets: Dict[bytes, Set[bytes]] = dict()
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        credentials = f':{self.password}@' if self.password else ''
+        return f'redis://{credentials}127.0.0.1:{self.server_address[1]}/1'
+
+    def execute(self, command: List[bytes], authenticated: bool) -> bytes:
+        name, args = command[0].upper(), command[1:]
+        if self.password and not authenticated and name != b'AUTH':
+            return b'-NOAUTH Authentication required.\r\n'
+        with self.lock:
+            match name:
+                case b'AUTH':
+                    return b'+OK\r\n' if args[0].decode() == self.password else b'-WRONGPASS invalid password\r\n'
+                case b'SELECT':
+                    return b'+OK\r\n'
+                case b'SET':
+                    self.values[args[0]] = args[1]
+                    return b'+OK\r\n'
+                case b'GET':
+                    return _bulk(self.values.get(args[0]))
+                case b'GETRANGE':
+                    value = self.values.get(args[0], b'')
+                    start, end = int(args[1]), int(args[2])
+                    return _bulk(value[start:end + 1])
+                case b'EXISTS':
+                    return b':%d\r\n' % int(args[0] in self.values)
+                case b'DEL':
+                    return b':%d\r\n' % int(self.values.pop(args[0], None) is not None)
+                case b'SADD':
+                    self.sets.setdefault(args[0], set()).update(args[1:])
+                    return b':1\r\n'
+                case b'SREM':
+                    self.sets.get(args[0], set()).difference_update(args[1:])
+                    return b':1\r\n'
+                case b'SMEMBERS':
+                    members = sorted(self.sets.get(args[0], set()))
+                    return b'*%d\r\n' % len(members) + b''.join(_bulk(m) for m in members)
+                case _:
+                    return b'-ERR unknown command\r\n'
+
+
+def _bulk(value: bytes | None) -> bytes:
+    return b'$-1\r\n' if value is None else b'$%d\r\n%s\r\n' % (len(value), value)
+
+
+class _RespHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        authenticated = False
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = [self.rfile.read(int(self.rfile.readline()[1:-2]) + 2)[:-2] for _ in range(int(line[1:-2]))]
+            if command[0].upper() == b'AUTH':
+                authenticated = command[1].decode() == self.server.password  # type: ignore
+            self.wfile.write(self.server.execute(command, authenticated))  # type: ignore
+
+
+@pytest.fixture
+def resp_server() -> Iterator[RespStandIn]:
+    server = RespStandIn(password='secret')
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+class FakeStream:
+    """
+    A provider's response stream, yielding its tokens at a fixed pace until closed
+    """
+    def __init__(self, tokens: List[str], interval: float) -> None:
+        self.tokens: List[str] = tokens
+        self.interval: float = interval
+        self.closed = threading.Event()
+        self.read: int = 0
+
+    def __iter__(self) -> Iterator[str]:
+        for token in self.tokens:
+            time.sleep(self.interval)
+            if self.closed.is_set():
+                raise ConnectionError('The stream was closed')
+            self.read += 1
+            yield token
+
+    def close(self) -> None:
+        self.closed.set()
+
+
+class FakeConnector(Connector):
+    """
+    Answers every request with the same text, a word at a time, recording the requests and their streams
+    """
+    def __init__(self, answer: str = 'Hello there', interval: float = 0.) -> None:
+        super().__init__()
+        self.answer: str = answer
+        self.interval: float = interval
+        self.requests: List[Messages] = list()
+        self.streams: List[FakeStream] = list()
+
+    def get_streaming_response(self, model: str, temperature: float, messages: Messages, tools: List[Dict[str, Any]], cancellation_token: CancellationToken | None = None) -> Generator[ChatMessagePiece, None, None]:
+        self.requests.append(Messages(messages))
+        stream = FakeStream([word + ' ' for word in self.answer.split(' ')], self.interval)
+        self.streams.append(stream)
+        with closed_on_cancel(stream, cancellation_token):
+            for token in until_cancelled(stream, cancellation_token):
+                yield ChatMessagePiece(content=token)
+        yield ChatMessagePiece(usage=Usage(prompt_tokens=10, completion_tokens=len(stream.tokens)))
+
+    def get_json_response(self, model: str, temperature: float, messages: Messages, tools: List[Dict[str, Any]], cancellation_token: CancellationToken | None = None) -> Generator[ChatMessagePiece, None, None]:
+        yield from self.get_streaming_response(model, temperature, messages, tools, cancellation_token)
+
+
+@pytest.fixture
+def chatbot(monkeypatch):
+    """
+    A Chatbot whose OpenAI and Anthropic models are answered by fake connectors, passing on every streamed piece
+    """
+    from eevee.chatbot import Chatbot
+    monkeypatch.setenv('OPENAI_API_KEY', 'fake')
+    monkeypatch.setenv('ANTHROPIC_API_KEY', 'fake')
+    chatbot = Chatbot({'openai', 'anthropic'})
+    chatbot.clients = {'openai': FakeConnector('Hello from GPT'), 'anthropic': FakeConnector('Hello from Claude')}
+    chatbot.coalesce_window_seconds = 0
+    yield chatbot
+    chatbot.close()
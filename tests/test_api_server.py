@@ -0,0 +1,23 @@
+import pytest
+from fastapi.testclient import TestClient
+from eevee.api_server import APIServer
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.delenv('EEVEE_API_KEY', raising=False)
+    server = APIServer(chatbot=None, available_frameworks={'openai'}, host='127.0.0.1', port=0)  # type: ignore
+    yield TestClient(server.app)
+    server.executor.shutdown()
+
+
+@pytest.mark.parametrize('body', [b'{"model": "gpt-4", ', b'', b'["gpt-4"]'])
+def test_malformed_bodies_are_refused(client, body):
+    response = client.post('/v1/chat/completions', content=body, headers={'content-type': 'application/json'})
+    assert response.status_code == 400
+    assert response.json()['error']['type'] == 'invalid_request_error'
+
+
+def test_unknown_models_are_not_found(client):
+    response = client.post('/v1/chat/completions', json={'model': 'unknown', 'messages': []})
+    assert response.status_code == 404
@@ -0,0 +1,53 @@
+import threading
+import pytest
+from eevee.cancellation import CancellationToken
+
+
+def _answer(chatbot, cancellation_token=None):
+    return [piece.content for piece in chatbot.get_stream_response('Hi', system_prompt='S1', model='gpt-4', temperature=0., cancellation_token=cancellation_token) if piece.content]
+
+
+def test_answer_is_complete_without_cancellation(chatbot):
+    assert ''.join(_answer(chatbot)) == 'Hello from GPT '
+    stream = chatbot.clients['openai'].streams[-1]
+    assert stream.read == len(stream.tokens)
+    assert not chatbot.messages[-1].truncated
+
+
+def test_cancelling_between_pieces_closes_the_stream(chatbot):
+    connector = chatbot.clients['openai']
+    connector.interval = 0.05
+    token = CancellationToken()
+    contents = list()
+    for piece in chatbot.get_stream_response('Hi', system_prompt='S1', model='gpt-4', temperature=0., cancellation_token=token):
+        if piece.content:
+            contents.append(piece.content)
+            token.cancel()
+    assert contents == ['Hello ']
+    # Closed before it was read to the end
+    assert connector.streams[-1].closed.is_set()
+    assert connector.streams[-1].read == 1
+    assert chatbot.messages[-1].role == 'assistant'
+    assert chatbot.messages[-1].content == 'Hello '
+    assert chatbot.messages[-1].truncated
+
+
+@pytest.mark.parametrize('coalesce_window_seconds', [0, 0.02])
+def test_cancelling_while_the_stream_is_read_closes_it(chatbot, coalesce_window_seconds):
+    connector = chatbot.clients['openai']
+    connector.answer = ' '.join(['word'] * 40)
+    connector.interval = 0.05
+    chatbot.coalesce_window_seconds = coalesce_window_seconds
+    token = CancellationToken()
+    # Cancelled from another thread, like the UI's stop button, while the provider's stream is blocked reading
+    timer = threading.Timer(0.3, token.cancel)
+    timer.start()
+    try:
+        content = ''.join(_answer(chatbot, token))
+    finally:
+        timer.cancel()
+    assert connector.streams[-1].closed.is_set()
+    assert connector.streams[-1].read < len(connector.streams[-1].tokens)
+    assert 0 < len(content) < len(connector.answer)
+    assert chatbot.messages[-1].content == content
+    assert chatbot.messages[-1].truncated
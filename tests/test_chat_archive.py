@@ -0,0 +1,70 @@
+import io
+import json
+import zstandard
+from datetime import datetime, timedelta
+from eevee.chat_archive import ChatArchive
+from eevee.saved_chat import SavedChat
+from eevee.blob_store import BlobStore
+from eevee.storage_backends.filesystem_backend import FilesystemBackend
+from eevee.storage_backends.sqlite_backend import SQLiteBackend
+
+
+def _save_chats(storage, count):
+    blob_store = BlobStore(storage)
+    start = datetime(2024, 1, 1)
+    for i in range(count):
+        chat = {
+            'start_time': (start + timedelta(minutes=i)).strftime(SavedChat.TIME_FORMAT),
+            'metadata': {},
+            'messages': [
+                {'role': 'system', 'content': 'You are a helpful assistant'},
+                {'role': 'user', 'content': f'Question {i} ünïcode'},
+                {'role': 'tool', 'content': None, 'content_ref': blob_store.put(f'Tool output {i % 3} ' * 100)},
+                {'role': 'assistant', 'content': f'Answer {i}'}
+            ]
+        }
+        key = SavedChat.title_and_time_to_filename(f'Question {i}', start + timedelta(minutes=i))
+        data, index = SavedChat.serialize(chat)
+        storage.write(SavedChat.NAMESPACE, key, data)
+        storage.write(SavedChat.INDEX_NAMESPACE, key, index)
+
+
+def _archive(storage, chunk_size=4):
+    archive = ChatArchive(storage)
+    archive.workers = 2
+    archive.chunk_size = chunk_size
+    return archive
+
+
+def test_round_trip_between_backends(tmp_path):
+    source = FilesystemBackend(str(tmp_path / 'source'))
+    _save_chats(source, 10)
+    path = str(tmp_path / 'chats.jsonl.zst')
+    assert _archive(source).export_to(path) == 10
+
+    target = SQLiteBackend(str(tmp_path / 'target.db'))
+    assert _archive(target).import_from(path) == 10
+    keys = source.list_keys(SavedChat.NAMESPACE)
+    assert sorted(target.list_keys(SavedChat.NAMESPACE)) == sorted(keys)
+    for key in keys:
+        assert target.read(SavedChat.NAMESPACE, key) == source.read(SavedChat.NAMESPACE, key)
+        assert target.read(SavedChat.INDEX_NAMESPACE, key) == source.read(SavedChat.INDEX_NAMESPACE, key)
+    assert sorted(target.list_keys(BlobStore.NAMESPACE)) == sorted(source.list_keys(BlobStore.NAMESPACE))
+    for ref in SavedChat.referenced_blobs(target.read(SavedChat.NAMESPACE, keys[0])):
+        assert BlobStore(target).get(ref) == BlobStore(source).get(ref)
+
+
+def test_blobs_precede_the_chats_referring_to_them(tmp_path):
+    source = FilesystemBackend(str(tmp_path / 'source'))
+    _save_chats(source, 10)
+    path = str(tmp_path / 'chats.jsonl.zst')
+    _archive(source, chunk_size=3).export_to(path)
+
+    with open(path, 'rb') as f:
+        lines = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(f)).readlines()  # type: ignore
+    seen = set()
+    for record in map(json.loads, lines[1:]):
+        if record['type'] == 'blob':
+            seen.add(record['ref'])
+        else:
+            assert {m['content_ref'] for m in record['chat']['messages'] if m.get('content_ref')} <= seen
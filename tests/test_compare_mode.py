@@ -0,0 +1,53 @@
+import pytest
+
+
+GPT, CLAUDE = 'gpt-4', 'claude-3-haiku-20240307'
+
+
+@pytest.fixture
+def compared(chatbot):
+    chatbot.clients['openai'].answer, chatbot.clients['openai'].interval = 'one two three four five', 0.04
+    chatbot.clients['anthropic'].answer, chatbot.clients['anthropic'].interval = 'un deux trois quatre cinq', 0.06
+    pieces = [(model, piece) for model, piece in chatbot.get_compare_stream_response('Count', system_prompt='S1', models=[GPT, CLAUDE], temperature=0.) if piece.content]
+    return chatbot, pieces
+
+
+def test_answers_are_streamed_as_they_arrive(compared):
+    chatbot, pieces = compared
+    models = [model for model, _ in pieces]
+    # Neither model waits for the other one to finish
+    assert models.index(CLAUDE) < len(models) - 1 - models[::-1].index(GPT)
+    assert all(piece.model == model for model, piece in pieces)
+    assert ''.join(piece.content for model, piece in pieces if model == GPT) == 'one two three four five '
+    assert ''.join(piece.content for model, piece in pieces if model == CLAUDE) == 'un deux trois quatre cinq '
+    assert {model: branch[-1].content for model, branch in chatbot.branches.items()} == {GPT: 'one two three four five ', CLAUDE: 'un deux trois quatre cinq '}
+
+
+def test_timings_are_recorded_per_model(compared):
+    chatbot, _ = compared
+    for model, interval in [(GPT, 0.04), (CLAUDE, 0.06)]:
+        timing = chatbot.timings[model]
+        assert interval <= timing.ttft < timing.total
+        assert timing.total >= 5 * interval
+    assert chatbot.timings[GPT].ttft < chatbot.timings[CLAUDE].ttft
+
+
+def test_choosing_an_answer_keeps_the_other_one_as_a_branch(compared):
+    chatbot, _ = compared
+    chatbot.choose_compare_branch(GPT)
+    assert chatbot.branches == {}
+    assert chatbot.messages[-1].model == GPT
+    assert [(m.role, m.content) for m in chatbot.messages] == [('system', 'S1'), ('user', 'Count'), ('assistant', 'one two three four five ')]
+    assert chatbot.tree.messages()[-1] is chatbot.messages[-1]
+    answers = sorted(chatbot.tree.messages(leaf)[-1].content for leaf in chatbot.list_branches())
+    assert answers == ['one two three four five ', 'un deux trois quatre cinq ']
+
+    # The next prompt follows the chosen answer only
+    list(chatbot.get_stream_response('Again', system_prompt='S1', model=GPT, temperature=0.))
+    assert [m.content for m in chatbot.clients['openai'].requests[-1]] == ['S1', 'Count', 'one two three four five ', 'Again']
+
+
+def test_choosing_an_unknown_model_fails(compared):
+    chatbot, _ = compared
+    with pytest.raises(ValueError):
+        chatbot.choose_compare_branch('gpt-4-turbo-preview')
@@ -0,0 +1,95 @@
+from eevee.conversation_tree import ConversationTree
+from eevee.messages import Messages, Message
+
+
+MODEL = 'gpt-4'
+
+
+def _ask(chatbot, prompt, system_prompt='S1', model=MODEL):
+    list(chatbot.get_stream_response(prompt, system_prompt=system_prompt, model=model, temperature=0.))
+
+
+def _contents(messages):
+    return [(m.role, m.content) for m in messages]
+
+
+def _branches(chatbot):
+    return sorted(_contents(chatbot.tree.messages(leaf)) for leaf in chatbot.list_branches())
+
+
+def test_round_trip_of_a_branched_tree():
+    tree = ConversationTree.from_messages(Messages([Message('system', 'S'), Message('user', 'Q1'), Message('assistant', 'A1', model='gpt-4')]))
+    first_branch = tree.messages()
+    tree.sync(Messages([*first_branch[:2], Message('assistant', 'A1 again', model='gpt-4')]))
+    tree.sync(Messages([*first_branch, Message('user', 'Q2'), Message('assistant', 'A2', model='gpt-4')]))
+    tree.sync(Messages([first_branch[0], Message('user', 'Other Q1')]))
+    tree.active_node = 5
+
+    as_dict = tree.as_dict()
+    # Only messages not following the one before them store their parent
+    assert [m.get('parent') for m in as_dict] == [None, None, None, 1, 2, None, 0]
+    loaded = ConversationTree.from_dict(as_dict, tree.active_node)
+    assert [n.parent for n in loaded.nodes] == [n.parent for n in tree.nodes]
+    assert [n.children for n in loaded.nodes] == [n.children for n in tree.nodes]
+    assert _contents(loaded.messages()) == [('system', 'S'), ('user', 'Q1'), ('assistant', 'A1'), ('user', 'Q2'), ('assistant', 'A2')]
+    assert sorted(_contents(loaded.messages(leaf)) for leaf in loaded.leaves()) == sorted(_contents(tree.messages(leaf)) for leaf in tree.leaves())
+    assert loaded.as_dict() == as_dict
+    assert not loaded.linear
+
+
+def test_a_list_of_messages_is_a_single_branch():
+    tree = ConversationTree.from_dict([{'role': 'system', 'content': 'S'}, {'role': 'user', 'content': 'Q'}])
+    assert tree.linear
+    assert tree.active_node == 1
+    assert tree.leaves() == [1]
+
+
+def test_fork_starts_a_new_branch(chatbot):
+    _ask(chatbot, 'Q1')
+    _ask(chatbot, 'Q2')
+    chatbot.fork(2)
+    _ask(chatbot, 'Other Q2')
+    assert _branches(chatbot) == [
+        [('system', 'S1'), ('user', 'Q1'), ('assistant', 'Hello from GPT '), ('user', 'Other Q2'), ('assistant', 'Hello from GPT ')],
+        [('system', 'S1'), ('user', 'Q1'), ('assistant', 'Hello from GPT '), ('user', 'Q2'), ('assistant', 'Hello from GPT ')],
+    ]
+    # The branches share the nodes of their first turn
+    assert len(chatbot.tree.nodes) == 7
+
+
+def test_switch_branch_makes_it_active(chatbot):
+    _ask(chatbot, 'Q1')
+    chatbot.fork(1)
+    _ask(chatbot, 'Other Q1')
+    other = next(leaf for leaf in chatbot.list_branches() if chatbot.tree.messages(leaf)[1].content == 'Q1')
+    chatbot.switch_branch(other)
+    assert [m.content for m in chatbot.messages if m.role == 'user'] == ['Q1']
+    _ask(chatbot, 'Q2')
+    assert chatbot.clients['openai'].requests[-1][1].content == 'Q1'
+    assert len(chatbot.list_branches()) == 2
+
+
+def test_regenerate_answers_again_on_a_new_branch(chatbot):
+    _ask(chatbot, 'Q1')
+    _ask(chatbot, 'Q2')
+    chatbot.clients['openai'].answer = 'Another answer'
+    list(chatbot.regenerate(1, model=MODEL, temperature=0.))
+    assert _contents(chatbot.messages) == [('system', 'S1'), ('user', 'Q1'), ('assistant', 'Another answer ')]
+    assert _contents(chatbot.clients['openai'].requests[-1]) == [('system', 'S1'), ('user', 'Q1')]
+    assert len(chatbot.list_branches()) == 2
+
+
+def test_a_new_system_prompt_leaves_other_branches_unchanged(chatbot):
+    _ask(chatbot, 'Q1')
+    _ask(chatbot, 'Q2')
+    chatbot.fork(2)
+    _ask(chatbot, 'Other Q2', system_prompt='S2')
+    assert _contents(chatbot.clients['openai'].requests[-1])[0] == ('system', 'S2')
+    system_prompts = sorted((chatbot.tree.messages(leaf)[0].content, chatbot.tree.messages(leaf)[3].content) for leaf in chatbot.list_branches())
+    assert system_prompts == [('S1', 'Q2'), ('S2', 'Other Q2')]
+
+    # Regenerating the older branch still uses its own system prompt
+    old = next(leaf for leaf in chatbot.list_branches() if chatbot.tree.messages(leaf)[0].content == 'S1')
+    chatbot.switch_branch(old)
+    list(chatbot.regenerate(model=MODEL, temperature=0.))
+    assert _contents(chatbot.clients['openai'].requests[-1])[0] == ('system', 'S1')
@@ -0,0 +1,68 @@
+import os
+import json
+import numpy as np
+from eevee.document_index import DocumentIndex, default_index_directory
+from eevee.utils import data_directory
+
+
+FILES = {
+    'gardening.md': 'Tomatoes need full sun and regular watering.\n\nPrune the suckers of tomato plants weekly.',
+    'cooking.txt': 'Simmer the tomato sauce for an hour.\n\nAdd basil and garlic at the end.',
+    'space.rst': 'The rocket reached orbit after a ten minute burn.',
+}
+
+
+def _write_files(root, files):
+    os.makedirs(root, exist_ok=True)
+    for name, text in files.items():
+        with open(os.path.join(root, name), 'w') as f:
+            f.write(text)
+
+
+def _build(directory, root):
+    index = DocumentIndex(str(directory))
+    index.update(str(root))
+    return DocumentIndex(str(directory))
+
+
+def test_search_ranks_the_matching_chunks_first(tmp_path):
+    _write_files(tmp_path / 'docs', FILES)
+    index = _build(tmp_path / 'index', tmp_path / 'docs')
+    results = index.search('rocket orbit', top_k=3)
+    assert [os.path.basename(chunk.path) for chunk, _ in results] == ['space.rst']
+    assert index.search('tomato', top_k=5)[0][0].path.endswith(('gardening.md', 'cooking.txt'))
+    assert index.search('nothing matches this', top_k=5) == []
+
+
+def test_updates_match_a_fresh_build(tmp_path):
+    _write_files(tmp_path / 'docs', FILES)
+    index = _build(tmp_path / 'index', tmp_path / 'docs')
+
+    os.remove(tmp_path / 'docs' / 'cooking.txt')
+    changed = {'space.rst': 'The probe landed on the moon.', 'music.md': 'Practice scales on the piano daily.'}
+    _write_files(tmp_path / 'docs', changed)
+    update = index.update(str(tmp_path / 'docs'))
+    assert (update.added, update.updated, update.removed, update.unchanged) == (1, 1, 1, 1)
+
+    updated = DocumentIndex(str(tmp_path / 'index'))
+    fresh = _build(tmp_path / 'fresh', tmp_path / 'docs')
+    for query in ['tomato suckers', 'moon probe', 'piano', 'rocket']:
+        assert [(c.path, c.text, round(s, 3)) for c, s in updated.search(query, 5)] == [(c.path, c.text, round(s, 3)) for c, s in fresh.search(query, 5)]
+    np.testing.assert_array_equal(np.diff(updated.offsets), np.diff(fresh.offsets))
+    assert not updated.search('rocket', 5)
+
+
+def test_older_indexes_are_rebuilt(tmp_path):
+    directory = tmp_path / 'index'
+    os.makedirs(directory)
+    with open(directory / DocumentIndex.MANIFEST_FILE, 'w') as f:
+        json.dump({'dimensions': 4096, 'files': {}, 'chunks': [], 'document_frequencies': [0] * 4096}, f)
+    np.save(directory / 'vectors.npy', np.zeros((0, 4096), dtype=np.float32))
+    _write_files(tmp_path / 'docs', FILES)
+    index = _build(directory, tmp_path / 'docs')
+    assert len(index.chunks) == len(FILES)
+    assert not os.path.exists(directory / 'vectors.npy')
+
+
+def test_index_is_kept_in_the_data_directory():
+    assert default_index_directory() == os.path.join(data_directory(), 'document_index')
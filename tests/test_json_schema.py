@@ -0,0 +1,81 @@
+import pytest
+from eevee.json_schema import compile_schema, SchemaValidationError
+
+
+# Schema, value, and the validated value, or the path and message of the error
+CASES = [
+    ({'type': 'string'}, 'text', 'text'),
+    ({'type': 'string'}, 1, ('$', 'expected string, got integer')),
+    ({'type': 'number'}, 1.5, 1.5),
+    ({'type': 'number'}, True, ('$', 'expected number, got boolean')),
+    ({'type': 'integer'}, 3.0, 3),
+    ({'type': 'integer'}, 3.5, ('$', 'expected integer, got number')),
+    ({'type': ['string', 'null']}, None, None),
+    ({'enum': ['a', 'b']}, 'b', 'b'),
+    ({'enum': ['a', 'b']}, 'c', ('$', "'c' is not one of ['a', 'b']")),
+    ({'const': 42}, 42, 42),
+    ({'const': 42}, 41, ('$', 'expected 42')),
+    ({'anyOf': [{'type': 'integer'}, {'type': 'string', 'maxLength': 2}]}, 'ab', 'ab'),
+    ({'anyOf': [{'type': 'integer'}, {'type': 'string', 'maxLength': 2}]}, 'abc', ('$', 'matches none of the options')),
+    ({'type': 'string', 'minLength': 2}, 'a', ('$', 'shorter than 2 characters')),
+    ({'type': 'string', 'maxLength': 2}, 'abc', ('$', 'longer than 2 characters')),
+    ({'type': 'string', 'pattern': '^[a-z]+$'}, 'ab1', ('$', 'does not match ^[a-z]+$')),
+    ({'type': 'number', 'minimum': 0, 'maximum': 10}, 10, 10),
+    ({'type': 'number', 'minimum': 0}, -1, ('$', 'less than 0')),
+    ({'type': 'number', 'maximum': 10}, 11, ('$', 'greater than 10')),
+    ({'type': 'number', 'exclusiveMinimum': 0}, 0, ('$', 'not greater than 0')),
+    ({'type': 'number', 'exclusiveMaximum': 10}, 10, ('$', 'not less than 10')),
+    ({'type': 'array', 'items': {'type': 'integer'}}, [1, 2.0], [1, 2]),
+    ({'type': 'array', 'items': {'type': 'integer'}}, [1, 'a'], ('$[]', 'expected integer, got string')),
+    ({'type': 'array', 'minItems': 1}, [], ('$', 'fewer than 1 items')),
+    ({'type': 'array', 'maxItems': 1}, [1, 2], ('$', 'more than 1 items')),
+    ({'type': 'object', 'properties': {'a': {'type': 'integer'}}, 'required': ['a']}, {'a': 1, 'b': 2}, {'a': 1, 'b': 2}),
+    ({'type': 'object', 'required': ['a', 'b']}, {'a': 1}, ('$', 'missing required b')),
+    ({'type': 'object', 'properties': {'a': {}}, 'additionalProperties': False}, {'b': 1}, ('$', 'unexpected property b')),
+    ({'type': 'object', 'additionalProperties': {'type': 'string'}}, {'b': 1}, ('$.*', 'expected string, got integer')),
+    ({'type': 'object', 'properties': {'a': {'type': 'object', 'properties': {'b': {'type': 'boolean'}}}}}, {'a': {'b': 'no'}}, ('$.a.b', 'expected boolean, got string')),
+    ({'type': 'string', 'unknownKeyword': True}, 'ignored', 'ignored'),
+]
+
+
+@pytest.mark.parametrize('schema,value,expected', CASES)
+def test_validation(schema, value, expected):
+    validate = compile_schema(schema)
+    if isinstance(expected, tuple):
+        with pytest.raises(SchemaValidationError) as error:
+            validate(value)
+        assert error.value.path == expected[0]
+        assert str(error.value).startswith(f'{expected[0]}: {expected[1]}')
+    else:
+        assert validate(value) == expected
+
+
+@pytest.mark.parametrize('schema,value,expected', [
+    ({'type': 'integer'}, '12', 12),
+    ({'type': 'number'}, '1.5', 1.5),
+    ({'type': 'number'}, '2', 2),
+    ({'type': 'boolean'}, 'True', True),
+    ({'type': 'boolean'}, 'false', False),
+    ({'type': 'object', 'properties': {'n': {'type': 'integer'}, 'tags': {'type': 'array', 'items': {'type': 'number'}}}}, {'n': '3', 'tags': ['1e3']}, {'n': 3, 'tags': [1000.0]}),
+    ({'anyOf': [{'type': 'null'}, {'type': 'integer'}]}, '7', 7),
+])
+def test_coercion(schema, value, expected):
+    assert compile_schema(schema, coerce=True)(value) == expected
+    with pytest.raises(SchemaValidationError):
+        compile_schema(schema)(value)
+
+
+@pytest.mark.parametrize('schema,value', [
+    ({'type': 'integer'}, 'twelve'),
+    ({'type': 'boolean'}, 'yes'),
+    ({'type': 'integer', 'minimum': 5}, '3'),
+])
+def test_failed_coercion(schema, value):
+    with pytest.raises(SchemaValidationError):
+        compile_schema(schema, coerce=True)(value)
+
+
+def test_errors_are_relative_to_the_path():
+    with pytest.raises(SchemaValidationError) as error:
+        compile_schema({'type': 'string'}, path='$.answer[]')(1)
+    assert error.value.path == '$.answer[]'
@@ -0,0 +1,94 @@
+import pytest
+from eevee.json_stream import JsonStreamValidator, InvalidJsonStream
+
+
+POINT = {'type': 'object', 'properties': {'x': {'type': 'integer'}, 'y': {'type': 'number'}}, 'required': ['x'], 'additionalProperties': False}
+POINTS = {'type': 'array', 'items': POINT, 'maxItems': 2}
+NESTED = {'type': 'object', 'properties': {'rows': {'type': 'array', 'items': {'type': 'array', 'items': {'type': 'string'}}}}}
+
+# Answer, schema, and the parsed answer, or None if it is invalid
+CASES = [
+    ('{"a": [1, 2.5, -3e2, true, false, null]}', None, {'a': [1, 2.5, -300.0, True, False, None]}),
+    ('"caf\\u00e9 \\ud83d\\ude00 \\"quoted\\" \\\\"', None, 'café 😀 "quoted" \\'),
+    ('12345', None, 12345),
+    ('-0.125e-3', None, -0.125e-3),
+    ('```json\n{"a": 1}\n```', None, {'a': 1}),
+    ('```\n[1]\n```\n', None, [1]),
+    ('  \n{"a": {}}  ', None, {'a': {}}),
+    ('[1, 2,]', None, None),
+    ('{"a": 1,}', None, None),
+    ('{"a" 1}', None, None),
+    ('[1 2]', None, None),
+    ('"\\u00g0"', None, None),
+    ('"\\x"', None, None),
+    ('01', None, None),
+    ('1.', None, None),
+    ('-', None, None),
+    ('tru', None, None),
+    ('{"a": 1} {"b": 2}', None, None),
+    ('Sure! {"a": 1}', None, None),
+    ('{"a": 1', None, None),
+    ('{"x": 1, "y": 2.5}', POINT, {'x': 1, 'y': 2.5}),
+    ('{"x": 1, "z": 2}', POINT, None),
+    ('{"x": "1"}', POINT, None),
+    ('{"y": 1}', POINT, None),
+    ('[{"x": 1}, {"x": 2}]', POINTS, [{'x': 1}, {'x': 2}]),
+    ('[{"x": 1}, {"x": 2}, {"x": 3}]', POINTS, None),
+    ('[{"x": 1}, {"x": 2.5}]', POINTS, None),
+    ('{"rows": [["a", "b"], []]}', NESTED, {'rows': [['a', 'b'], []]}),
+    ('{"rows": [["a", 1]]}', NESTED, None),
+    ('{"rows": ["a"]}', NESTED, None),
+]
+
+
+def _validate(chunks, schema):
+    validator = JsonStreamValidator(schema)
+    for chunk in chunks:
+        validator.feed(chunk)
+    return validator.finish()
+
+
+def _splits(text):
+    yield [text]
+    yield list(text)
+    for i in range(1, len(text)):
+        yield [text[:i], text[i:]]
+
+
+@pytest.mark.parametrize('text,schema,expected', CASES)
+def test_answers_split_at_every_point(text, schema, expected):
+    for chunks in _splits(text):
+        if expected is None:
+            with pytest.raises(InvalidJsonStream):
+                _validate(chunks, schema)
+        else:
+            assert _validate(chunks, schema) == expected, chunks
+
+
+@pytest.mark.parametrize('prefix,schema', [
+    ('{"x": 1, "z"', POINT),
+    ('{"x": "', POINT),
+    ('[{"x": 1}, {"x": 2}, {', POINTS),
+    ('{"rows": [["a", 1', NESTED),
+    ('[1, 2,]', None),
+    ('Sure', None),
+])
+def test_invalid_answers_are_noticed_before_they_end(prefix, schema):
+    validator = JsonStreamValidator(schema)
+    with pytest.raises(InvalidJsonStream):
+        validator.feed(prefix)
+
+
+def test_started_and_complete():
+    validator = JsonStreamValidator()
+    validator.feed('```json\n')
+    assert not validator.started
+    validator.feed('{"a": ')
+    assert validator.started and not validator.complete
+    validator.feed('1}\n```')
+    assert validator.complete
+
+
+def test_invalid_schema_is_refused():
+    with pytest.raises(ValueError):
+        JsonStreamValidator({'type': 'object', 'properties': {'a': {'pattern': '('}}})
@@ -0,0 +1,79 @@
+import time
+import threading
+from eevee.profiling import EventProfiler
+
+
+def _busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def _read_profile(path):
+    stacks = dict()
+    for line in path.read_text().splitlines():
+        stack, count = line.rsplit(' ', 1)
+        stacks[stack] = int(count)
+    return stacks
+
+
+def test_wrapped_calls_are_marked_with_their_event(tmp_path):
+    profiler = EventProfiler(str(tmp_path / 'profile.folded'))
+    seen = list()
+    inner = profiler.wrap(lambda: seen.append(profiler._events.get(threading.get_ident())), 'inner')
+    outer = profiler.wrap(lambda: (inner(), seen.append(profiler._events.get(threading.get_ident()))), 'outer')
+    outer()
+    # A nested event's handler is marked with its own event, then the outer one is restored
+    assert seen == ['inner', 'outer']
+    assert profiler._events == {}
+
+
+def test_generators_are_marked_on_each_step_only(tmp_path):
+    profiler = EventProfiler(str(tmp_path / 'profile.folded'))
+    closed = list()
+
+    def handler():
+        try:
+            for _ in range(3):
+                yield profiler._events.get(threading.get_ident())
+        finally:
+            closed.append(True)
+
+    steps = profiler.wrap(handler, 'submit')()
+    assert next(steps) == 'submit'
+    assert profiler._events == {}
+    # Each step may run on another thread
+    other_thread = list()
+    thread = threading.Thread(target=lambda: other_thread.append(next(steps)))
+    thread.start()
+    thread.join()
+    assert other_thread == ['submit']
+    steps.close()
+    assert closed == [True]
+    assert profiler._events == {}
+
+
+def test_samples_are_attributed_to_events_and_threads(tmp_path):
+    path = tmp_path / 'profile.folded'
+    profiler = EventProfiler(str(path), interval_seconds=0.002)
+    profiler.start()
+    worker = threading.Thread(target=_busy, args=(0.2,), name='tool-worker_3')
+    worker.start()
+    profiler.wrap(_busy, 'add_user_message')(0.2)
+    worker.join()
+    idle = threading.Event()
+    waiter = threading.Thread(target=idle.wait, name='idle')
+    waiter.start()
+    time.sleep(0.05)
+    profiler.stop()
+    idle.set()
+    waiter.join()
+
+    stacks = _read_profile(path)
+    event_stacks = [stack for stack in stacks if stack.startswith('event:add_user_message;')]
+    assert event_stacks and all(stack.endswith(f'{__name__}._busy') for stack in event_stacks)
+    # Numbered threads of the same pool share a root
+    assert any(stack.startswith('thread:tool-worker;') and stack.endswith(f'{__name__}._busy') for stack in stacks)
+    # Threads waiting for work are left out
+    assert not any(stack.startswith('thread:idle;') for stack in stacks)
+    assert profiler._event_samples['add_user_message'] == sum(stacks[stack] for stack in event_stacks)
@@ -0,0 +1,41 @@
+import os
+import time
+from eevee.response_cache import ResponseCache
+
+
+MESSAGES = [{'role': 'assistant', 'content': 'Hello'}]
+
+
+def _files(directory):
+    return sorted(f for f in os.listdir(directory))
+
+
+def test_disk_tier_survives_a_new_instance(tmp_path):
+    ResponseCache(str(tmp_path), max_entries=4).put('a', MESSAGES)
+    assert ResponseCache(str(tmp_path), max_entries=4).get('a') == MESSAGES
+    assert _files(tmp_path) == ['a.json']
+
+
+def test_disk_tier_evicts_the_oldest_entries(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_entries=3)
+    for i, key in enumerate('abcde'):
+        cache.put(key, MESSAGES)
+        os.utime(tmp_path / f'{key}.json', (i, i))
+    cache.put('f', MESSAGES)
+    assert _files(tmp_path) == ['d.json', 'e.json', 'f.json']
+
+
+def test_disk_tier_deletes_expired_entries(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_entries=10, ttl_seconds=60)
+    cache.put('old', MESSAGES)
+    os.utime(tmp_path / 'old.json', (time.time() - 120, time.time() - 120))
+    cache.put('new', MESSAGES)
+    assert _files(tmp_path) == ['new.json']
+
+
+def test_expired_entries_are_not_served(tmp_path):
+    cache = ResponseCache(str(tmp_path), max_entries=10, ttl_seconds=0.05)
+    cache.put('a', MESSAGES)
+    time.sleep(0.1)
+    assert cache.get('a') is None
+    assert _files(tmp_path) == []
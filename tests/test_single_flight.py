@@ -0,0 +1,128 @@
+import threading
+import pytest
+from concurrent.futures import ThreadPoolExecutor, CancelledError
+from eevee.single_flight import SingleFlight
+from eevee.cancellation import CancellationToken
+
+
+class Gate:
+    """
+    A function which counts its executions and blocks until released, unless cancelled
+    """
+    def __init__(self, result='result') -> None:
+        self.result = result
+        self.calls = 0
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.cancelled = threading.Event()
+        # Holds the function back from returning once cancelled
+        self.returning = threading.Event()
+        self.returning.set()
+
+    def __call__(self, token: CancellationToken):
+        self.calls += 1
+        self.started.set()
+        token.on_cancel(self.release.set)
+        self.release.wait(5)
+        if token.cancelled:
+            self.cancelled.set()
+            self.returning.wait(5)
+            raise CancelledError()
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+def _wait_for_waiters(flights, key, count):
+    for _ in range(500):
+        flight = flights._flights.get(key)
+        if flight is not None and flight.waiters >= count:
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError(f'{count} waiters never joined')
+
+
+def test_concurrent_calls_share_one_execution():
+    flights, gate = SingleFlight(), Gate()
+    with ThreadPoolExecutor(4) as executor:
+        futures = [executor.submit(flights.run, 'key', gate, 5) for _ in range(4)]
+        _wait_for_waiters(flights, 'key', 4)
+        gate.release.set()
+        assert [f.result() for f in futures] == ['result'] * 4
+    assert gate.calls == 1
+    assert flights.shared_calls == 3
+    assert not flights._flights
+
+
+def test_errors_reach_all_callers():
+    flights, gate = SingleFlight(), Gate(ValueError('failed'))
+    with ThreadPoolExecutor(2) as executor:
+        futures = [executor.submit(flights.run, 'key', gate, 5) for _ in range(2)]
+        _wait_for_waiters(flights, 'key', 2)
+        gate.release.set()
+        for future in futures:
+            with pytest.raises(ValueError):
+                future.result()
+    assert gate.calls == 1
+
+
+def test_waiters_time_out():
+    flights, gate = SingleFlight(), Gate()
+    with ThreadPoolExecutor(1) as executor:
+        leader = executor.submit(flights.run, 'key', gate, 0.2)
+        gate.started.wait(5)
+        with pytest.raises(TimeoutError):
+            flights.run('key', gate, 0.2)
+        gate.release.set()
+        leader.result()
+
+
+def test_stale_executions_are_not_joined():
+    flights, stale, fresh = SingleFlight(), Gate('stale'), Gate('fresh')
+    with ThreadPoolExecutor(1) as executor:
+        leader = executor.submit(flights.run, 'key', stale, 0.1)
+        stale.started.wait(5)
+        threading.Event().wait(0.2)
+        fresh.release.set()
+        assert flights.run('key', fresh, 0.1) == 'fresh'
+        stale.release.set()
+        assert leader.result() == 'stale'
+    assert not flights._flights
+
+
+def test_execution_continues_while_someone_waits():
+    flights, gate = SingleFlight(), Gate()
+    leader_token = CancellationToken()
+    with ThreadPoolExecutor(2) as executor:
+        leader = executor.submit(flights.run, 'key', gate, 5, leader_token)
+        gate.started.wait(5)
+        follower = executor.submit(flights.run, 'key', gate, 5)
+        _wait_for_waiters(flights, 'key', 2)
+        leader_token.cancel()
+        assert not gate.cancelled.is_set()
+        gate.release.set()
+        assert follower.result() == 'result'
+        leader.result()
+
+
+def test_execution_is_cancelled_and_forgotten_once_all_callers_cancel():
+    flights, gate, fresh = SingleFlight(), Gate(), Gate('fresh')
+    tokens = [CancellationToken(), CancellationToken()]
+    gate.returning.clear()
+    with ThreadPoolExecutor(2) as executor:
+        futures = [executor.submit(flights.run, 'key', gate, 5, token) for token in tokens]
+        _wait_for_waiters(flights, 'key', 2)
+        tokens[1].cancel()
+        with pytest.raises(CancelledError):
+            futures[1].result()
+        assert not gate.cancelled.is_set()
+        tokens[0].cancel()
+        assert gate.cancelled.wait(5)
+        # A new call doesn't join the cancelled execution, even before it has returned
+        fresh.release.set()
+        assert flights.run('key', fresh, 5) == 'fresh'
+        gate.returning.set()
+        with pytest.raises(CancelledError):
+            futures[0].result()
+    assert fresh.calls == 1
+    assert not flights._flights
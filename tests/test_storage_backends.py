@@ -0,0 +1,100 @@
+import os
+from datetime import datetime
+import pytest
+from eevee.storage_backends.storage_interface import StorageBackend
+from eevee.storage_backends.filesystem_backend import FilesystemBackend
+from eevee.storage_backends.sqlite_backend import SQLiteBackend
+from eevee.storage_backends.redis_backend import RedisBackend
+from eevee.messages import Message, Messages
+from eevee.saved_chat import SavedChat
+
+
+@pytest.fixture(params=['filesystem', 'sqlite', 'redis'])
+def backend(request, tmp_path):
+    match request.param:
+        case 'filesystem':
+            storage: StorageBackend = FilesystemBackend(str(tmp_path))
+        case 'sqlite':
+            storage = SQLiteBackend(os.path.join(tmp_path, 'eevee.db'))
+        case _:
+            storage = RedisBackend(request.getfixturevalue('resp_server').url)
+    yield storage
+    storage.close()
+
+
+def test_round_trip(backend):
+    data = bytes(range(256)) * 4 + b'\r\n$-1\r\n'
+    backend.write('saved_chats', 'chat.json', data)
+    backend.write('saved_chats/index', 'chat.json', b'{}')
+    assert backend.read('saved_chats', 'chat.json') == data
+    assert backend.read_range('saved_chats', 'chat.json', 10, 20) == data[10:20]
+    assert backend.exists('saved_chats', 'chat.json')
+    assert backend.list_keys('saved_chats') == ['chat.json']
+    assert backend.read('saved_chats', 'other.json') is None
+    assert backend.read_range('saved_chats', 'other.json', 0, 5) is None
+
+    backend.write('saved_chats', 'chat.json', b'replaced')
+    assert backend.read('saved_chats', 'chat.json') == b'replaced'
+    backend.delete('saved_chats', 'chat.json')
+    assert not backend.exists('saved_chats', 'chat.json')
+    assert backend.list_keys('saved_chats') == []
+    assert backend.list_keys('saved_chats/index') == ['chat.json']
+
+
+def test_saved_chat_lazy_load(backend):
+    messages = Messages([Message('system', 'Be brief')])
+    for turn in range(5):
+        messages.append('user', f'Question {turn}')
+        messages.append('assistant', f'Answer {turn}', model='gpt-4')
+    start_time = datetime(2024, 5, 1, 12, 30)
+    SavedChat(messages, start_time, backend, 'Five turns', mode='chat').save()
+    full = SavedChat.from_chat_title_and_time('Five turns', start_time, backend)
+
+    partial = SavedChat.from_chat_title_and_time('Five turns', start_time, backend, last_turns=2)
+    assert partial.messages.as_dict() == Messages(messages[-4:]).as_dict()
+    assert partial.first_message_index == 7
+    assert partial._metadata == full._metadata == {'mode': 'chat'}
+    loaded = partial.messages
+    older = partial.read_older_turns(1)
+    assert older.as_dict() == Messages(messages[5:7]).as_dict()
+    loaded = Messages([*older, *loaded])
+    older = partial.read_older_messages(3)
+    assert older.as_dict() == Messages(messages[2:5]).as_dict()
+    loaded = Messages([*older, *loaded])
+    loaded = Messages([*partial.read_older_turns(), *loaded])
+    assert partial.first_message_index == 0
+    assert partial.read_older_messages().empty
+    assert loaded.as_dict() == full.messages.as_dict() == messages.as_dict()
+
+
+def test_redis_reconnects(resp_server):
+    backend = RedisBackend(resp_server.url)
+    backend.write('sessions', 'default', b'first')
+    # The server dropping the connection, like a restart, is only noticed on the next command
+    backend._socket.shutdown(2)  # type: ignore
+    assert backend.read('sessions', 'default') == b'first'
+    backend.close()
+
+
+def test_redis_authentication(resp_server):
+    backend = RedisBackend(resp_server.url.replace('secret', 'wrong'))
+    with pytest.raises(RuntimeError, match='WRONGPASS'):
+        backend.read('sessions', 'default')
+    backend.close()
+
+
+def test_legacy_storage_is_copied_once(tmp_path, monkeypatch):
+    from eevee import chatbot
+    legacy, directory = tmp_path / 'package', tmp_path / 'data'
+    (legacy / 'saved_chats').mkdir(parents=True)
+    (legacy / 'saved_chats' / 'chat.json').write_bytes(b'legacy')
+    monkeypatch.setattr(chatbot, 'ROOT_DIR', legacy)
+
+    chatbot.Chatbot._migrate_legacy_storage(str(directory))
+    assert (directory / 'saved_chats' / 'chat.json').read_bytes() == b'legacy'
+    assert not (directory / 'sessions').exists()
+
+    # Chats saved since are never overwritten by the installation folder's
+    (directory / 'saved_chats' / 'chat.json').write_bytes(b'new')
+    chatbot.Chatbot._migrate_legacy_storage(str(directory))
+    assert (directory / 'saved_chats' / 'chat.json').read_bytes() == b'new'
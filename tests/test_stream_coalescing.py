@@ -0,0 +1,97 @@
+import time
+import threading
+import pytest
+from eevee.messages import ChatMessagePiece, Usage
+from eevee.stream_coalescing import coalesce_pieces
+
+
+def _tokens(count, interval=0., model='model'):
+    for i in range(count):
+        if interval:
+            time.sleep(interval)
+        yield ChatMessagePiece(content=f'{i} ', model=model)
+
+
+def _content(pieces):
+    return ''.join(p.content for p in pieces if p.content)
+
+
+def test_content_is_merged_within_the_window():
+    pieces = list(coalesce_pieces(_tokens(200), window_seconds=10, max_bytes=10**6, max_pending=256))
+    assert _content(pieces) == ''.join(f'{i} ' for i in range(200))
+    # The first piece at once, and the rest merged until the stream ended
+    assert [p.content for p in pieces] == ['0 ', ''.join(f'{i} ' for i in range(1, 200))]
+    assert pieces[1].model == 'model'
+
+
+def test_pending_content_is_passed_on_once_the_window_ends():
+    stream = coalesce_pieces(_tokens(20, interval=0.01), window_seconds=0.05, max_bytes=10**6, max_pending=256)
+    pieces = list(stream)
+    assert _content(pieces) == ''.join(f'{i} ' for i in range(20))
+    assert 2 < len(pieces) < 20
+
+
+def test_pending_content_is_passed_on_past_max_bytes():
+    pieces = list(coalesce_pieces(_tokens(101), window_seconds=10, max_bytes=20, max_pending=256))
+    assert _content(pieces) == ''.join(f'{i} ' for i in range(101))
+    assert all(len(p.content.encode('utf-8')) < 20 + 4 for p in pieces)
+    assert len(pieces) > 5
+
+
+def test_other_pieces_flush_the_content_and_keep_their_order():
+    def stream():
+        yield ChatMessagePiece(content='a')
+        yield ChatMessagePiece(content='b')
+        yield ChatMessagePiece(content='c')
+        yield ChatMessagePiece(info_message='Searching')
+        yield ChatMessagePiece(content='d')
+        yield ChatMessagePiece(usage=Usage(prompt_tokens=1, completion_tokens=4))
+
+    pieces = list(coalesce_pieces(stream(), window_seconds=10, max_bytes=10**6, max_pending=256))
+    assert [(p.content, p.info_message, p.usage is not None) for p in pieces] == [
+        ('a', None, False), ('bc', None, False), (None, 'Searching', False), ('d', None, False), (None, None, True)
+    ]
+
+
+def test_errors_follow_the_content_read_before_them():
+    def stream():
+        yield from _tokens(3)
+        raise ConnectionError('dropped')
+
+    pieces = []
+    with pytest.raises(ConnectionError):
+        for piece in coalesce_pieces(stream(), window_seconds=10, max_bytes=10**6, max_pending=256):
+            pieces.append(piece)
+    assert _content(pieces) == '0 1 2 '
+
+
+def test_a_slow_consumer_holds_back_the_stream():
+    read = 0
+
+    def stream():
+        nonlocal read
+        for piece in _tokens(1000):
+            read += 1
+            yield piece
+
+    coalesced = coalesce_pieces(stream(), window_seconds=0, max_bytes=1, max_pending=8)
+    next(coalesced)
+    time.sleep(0.3)
+    # The queue, the piece being put into it, and the one handed over
+    assert read <= 8 + 2
+    coalesced.close()
+
+
+def test_stopping_the_consumer_closes_the_stream():
+    closed = threading.Event()
+
+    def stream():
+        try:
+            yield from _tokens(10**6, interval=0.001)
+        finally:
+            closed.set()
+
+    coalesced = coalesce_pieces(stream(), window_seconds=0.05, max_bytes=10**6, max_pending=8)
+    next(coalesced)
+    coalesced.close()
+    assert closed.wait(5)
@@ -0,0 +1,46 @@
+import threading
+from eevee.tool_prefetch import ToolPrefetcher
+
+
+SEARCH_OUTPUT = 'Title: Example\nURL: https://example.com/page/\n\nTitle: Other\nURL: https://other.org/a?utm_source=search&id=1\n'
+
+
+def _prefetcher(calls):
+    def run(name, arguments):
+        calls.append(arguments['url'])
+        return f'Text of {arguments["url"]}'
+    return ToolPrefetcher(run, top_k=3, concurrency=2, max_output_bytes=1024, max_cache_bytes=4096, ttl_seconds=60)
+
+
+def test_visits_of_search_results_are_served_from_the_prefetch():
+    calls = []
+    prefetcher = _prefetcher(calls)
+    prefetcher.after_call('web_search', {'query': 'example'}, SEARCH_OUTPUT)
+    assert prefetcher.lookup('visit_website', {'url': 'https://example.com/page/'}) == 'Text of https://example.com/page/'
+    prefetcher.close()
+    assert prefetcher.stats.hits == 1
+
+
+def test_equivalent_urls_hit_the_prefetch():
+    calls = []
+    prefetcher = _prefetcher(calls)
+    prefetcher.after_call('web_search', {'query': 'example'}, SEARCH_OUTPUT)
+    assert prefetcher.lookup('visit_website', {'url': 'http://www.example.com/page'}) is not None
+    assert prefetcher.lookup('visit_website', {'url': 'https://other.org/a?id=1'}) is not None
+    assert prefetcher.lookup('visit_website', {'url': 'https://other.org/b'}) is None
+    prefetcher.close()
+    assert sorted(calls) == ['https://example.com/page/', 'https://other.org/a?utm_source=search&id=1']
+    assert (prefetcher.stats.hits, prefetcher.stats.misses) == (2, 1)
+
+
+def test_failed_prefetches_are_not_served():
+    done = threading.Event()
+
+    def run(name, arguments):
+        done.set()
+        raise ConnectionError('unreachable')
+    prefetcher = ToolPrefetcher(run, top_k=1, concurrency=1, max_output_bytes=1024, max_cache_bytes=4096, ttl_seconds=60)
+    prefetcher.after_call('web_search', {'query': 'example'}, SEARCH_OUTPUT)
+    assert done.wait(5)
+    assert prefetcher.lookup('visit_website', {'url': 'https://example.com/page/'}) is None
+    prefetcher.close()
@@ -0,0 +1,120 @@
+import asyncio
+import threading
+import pytest
+from eevee import tool_registry
+from eevee.tool_registry import ToolRegistry
+from eevee.cancellation import CancellationToken
+
+
+def add(a: int, b: int = 1) -> str:
+    """
+    Adds two numbers
+    """
+    return str(a + b)
+
+
+async def async_add(a: int, b: int = 1) -> str:
+    await asyncio.sleep(0)
+    return str(a + b)
+
+
+async def wait_forever() -> str:
+    await asyncio.sleep(30)
+    return 'done'
+
+
+def failing() -> str:
+    raise RuntimeError('service unavailable')
+
+
+def cancellable(cancellation_token: CancellationToken | None = None) -> str:
+    return 'with token' if cancellation_token is not None else 'without token'
+
+
+NUMBERS = [('a', {'type': 'integer'}, True), ('b', {'type': 'integer'}, False)]
+DEFINITIONS = {add: NUMBERS, async_add: NUMBERS, wait_forever: [], failing: [], cancellable: []}
+
+
+class FakeEntryPoint:
+    def __init__(self, name, definitions=None, error=None) -> None:
+        self.name = name
+        self._definitions = definitions
+        self._error = error
+
+    def load(self):
+        if self._error is not None:
+            raise self._error
+        return self._definitions
+
+
+@pytest.fixture
+def registry():
+    registry = ToolRegistry(DEFINITIONS, load_entry_points=False)
+    yield registry
+    registry.close()
+
+
+def test_payloads_describe_the_tools(registry):
+    payload = registry.payload('openai')
+    assert payload[0] == {'type': 'function', 'function': {
+        'name': 'add', 'description': 'Adds two numbers',
+        'parameters': {'type': 'object', 'properties': {'a': {'type': 'integer'}, 'b': {'type': 'integer'}}, 'required': ['a']}
+    }}
+    assert registry.payload('anthropic') == []
+    assert registry.digest('openai') != registry.digest('anthropic')
+
+
+def test_calls_validate_and_coerce_the_arguments(registry):
+    assert registry.call('add', {'a': 2, 'b': 3}) == '5'
+    assert registry.call('add', {'a': '2'}) == '3'
+
+
+@pytest.mark.parametrize('name,arguments,error', [
+    ('add', {}, 'ERROR: Invalid arguments for add: $: missing required a'),
+    ('add', {'a': 'two'}, 'ERROR: Invalid arguments for add: $.a: expected integer, got string'),
+    ('subtract', {'a': 1}, 'ERROR: No tool named subtract'),
+    ('failing', {}, 'ERROR: service unavailable'),
+])
+def test_errors_are_returned_to_the_model(registry, name, arguments, error):
+    assert registry.call(name, arguments) == error
+
+
+def test_async_tools(registry):
+    assert registry.call('async_add', {'a': 1, 'b': 1}) == '2'
+    # Concurrent calls share the registry's event loop
+    results = []
+    threads = [threading.Thread(target=lambda i=i: results.append(registry.call('async_add', {'a': i}))) for i in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(results, key=int) == [str(i + 1) for i in range(8)]
+
+
+def test_cancelling_stops_async_tools(registry):
+    token = CancellationToken()
+    threading.Timer(0.2, token.cancel).start()
+    assert registry.call('wait_forever', {}, token) == 'ERROR: The tool call was cancelled'
+
+
+def test_cancellable_tools_receive_the_token(registry):
+    assert registry.call('cancellable', {}, CancellationToken()) == 'with token'
+
+
+def test_entry_points_add_tools(monkeypatch):
+    def plugin_tool(text: str) -> str:
+        """
+        Echoes the text
+        """
+        return text
+    entry_points = [
+        FakeEntryPoint('plugin', {plugin_tool: [('text', {'type': 'string'}, True)], add: []}),
+        FakeEntryPoint('broken', error=ImportError('missing dependency')),
+    ]
+    monkeypatch.setattr(tool_registry, 'entry_points', lambda group: entry_points if group == ToolRegistry.ENTRY_POINTS_GROUP else [])
+    registry = ToolRegistry({add: NUMBERS})
+    assert sorted(registry.tools) == ['add', 'plugin_tool']
+    assert registry.call('plugin_tool', {'text': 'hi'}) == 'hi'
+    # A plugin can't replace a tool which is already defined
+    assert registry.tools['add'].parameters['required'] == ['a']
+    registry.close()
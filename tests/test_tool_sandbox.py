@@ -0,0 +1,69 @@
+import time
+import threading
+import pytest
+from eevee.tool_sandbox import ToolSandbox, SandboxLimits, resource
+from eevee.cancellation import CancellationToken
+
+
+def echo(text: str) -> str:
+    return text
+
+
+async def async_echo(text: str) -> str:
+    return text
+
+
+def sleep(seconds: float) -> str:
+    time.sleep(seconds)
+    return 'woke up'
+
+
+def spin() -> str:
+    while True:
+        pass
+
+
+def fail() -> str:
+    raise ValueError('bad input')
+
+
+def _sandbox(**overrides) -> ToolSandbox:
+    limits = dict(timeout_seconds=10, cpu_seconds=0, memory_mb=0, max_output_bytes=1024) | overrides
+    return ToolSandbox({'tool': SandboxLimits(**limits)}, preload=[__name__])
+
+
+def test_outputs_and_errors_are_returned():
+    sandbox = _sandbox()
+    assert sandbox.run('tool', echo, {'text': 'héllo'}) == 'héllo'
+    assert sandbox.run('tool', async_echo, {'text': 'async'}) == 'async'
+    assert sandbox.run('tool', fail, {}) == 'ERROR: ValueError: bad input'
+
+
+def test_outputs_are_capped():
+    output = _sandbox(max_output_bytes=100).run('tool', echo, {'text': 'é' * 1000})
+    assert output.endswith('[Output truncated]')
+    assert len(output.split('\n')[0].encode('utf-8')) <= 100
+
+
+def test_hung_tools_are_killed_after_the_timeout():
+    start = time.perf_counter()
+    output = _sandbox(timeout_seconds=0.5).run('tool', sleep, {'seconds': 30})
+    assert output == 'ERROR: tool did not finish within 0.5 seconds'
+    assert time.perf_counter() - start < 5
+
+
+def test_cancelled_tools_are_killed():
+    token = CancellationToken()
+    threading.Timer(0.5, token.cancel).start()
+    start = time.perf_counter()
+    output = _sandbox().run('tool', sleep, {'seconds': 30}, cancellation_token=token)
+    assert output.startswith('ERROR: tool was stopped')
+    assert time.perf_counter() - start < 5
+
+
+@pytest.mark.skipif(resource is None, reason='CPU limits are only enforced where the resource module exists')
+def test_cpu_limit_stops_busy_tools():
+    start = time.perf_counter()
+    output = _sandbox(cpu_seconds=1, timeout_seconds=30).run('tool', spin, {})
+    assert output.startswith('ERROR: tool was stopped')
+    assert time.perf_counter() - start < 10
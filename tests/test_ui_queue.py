@@ -0,0 +1,93 @@
+import time
+import threading
+from types import SimpleNamespace
+import pytest
+from eevee.queue_monitor import QueueMonitor
+from eevee.ui import UI, QueueConfig
+
+
+class FakeEventQueue:
+    def __init__(self, concurrency_limit):
+        self.queue = list()
+        self.current_concurrency = 0
+        self.concurrency_limit = concurrency_limit
+
+
+class RecordingLogger:
+    def __init__(self):
+        self.lines = list()
+
+    def info(self, message, **kwargs):
+        self.lines.append(message)
+
+
+def _blocks():
+    fns = [SimpleNamespace(name='add_bot_message', concurrency_id='generation'), SimpleNamespace(name='compare', concurrency_id='generation'),
+           SimpleNamespace(name='save_chat', concurrency_id='123'), SimpleNamespace(name='<lambda>', concurrency_id='456')]
+    queues = {'generation': FakeEventQueue(1), '123': FakeEventQueue(4)}
+    return SimpleNamespace(fns=fns, _queue=SimpleNamespace(event_queue_per_concurrency_id=queues)), queues
+
+
+def test_queue_config_overrides_the_settings():
+    assert QueueConfig.from_settings() == QueueConfig(generation_concurrency=1, bookkeeping_concurrency=4, max_size=64, max_threads=40,
+                                                      drain_timeout_seconds=30, report_interval_seconds=60)
+    config = QueueConfig.from_settings(generation_concurrency=3, max_size=0, max_threads=None)
+    assert (config.generation_concurrency, config.max_size, config.max_threads) == (3, 0, 40)
+
+
+def test_queue_monitor_reports_depth_and_waits_per_pool():
+    blocks, queues = _blocks()
+    monitor = QueueMonitor(blocks, report_interval_seconds=60)
+    monitor.logger = RecordingLogger()
+    assert monitor._pool_names == {'generation': 'add_bot_message/compare', '123': 'save_chat'}
+
+    queues['generation'].current_concurrency = 1
+    queues['generation'].queue = [SimpleNamespace(_id='a'), SimpleNamespace(_id='b')]
+    monitor._sample()
+    time.sleep(0.05)
+    queues['generation'].queue = [SimpleNamespace(_id='b')]
+    monitor._sample()
+    time.sleep(0.05)
+    queues['generation'].queue = []
+    monitor._sample()
+
+    stats = monitor._stats['generation']
+    assert (stats.max_waiting, stats.max_running, stats.limit) == (2, 1, 1)
+    assert len(stats.waits) == 2 and 0.04 <= stats.waits[0] < stats.waits[1]
+    assert monitor._waiting == {}
+    monitor.report()
+    # Idle pools are left out
+    assert len(monitor.logger.lines) == 1
+    assert 'add_bot_message/compare: up to 2 waiting and 1/1 running, 2 waited' in monitor.logger.lines[0]
+    assert 'save_chat' not in monitor.logger.lines[0]
+    # Each report counts from the previous one
+    monitor.report()
+    assert len(monitor.logger.lines) == 1
+
+
+def _generate_in_background(ui, words, interval):
+    ui.chatbot.clients['openai'].answer = ' '.join(['word'] * words)
+    ui.chatbot.clients['openai'].interval = interval
+    histories = list()
+    thread = threading.Thread(target=lambda: histories.extend(ui._add_bot_message_to_chat([['Hi', None]], 'gpt-4', 0., False, 'S1', '')))
+    thread.start()
+    while not ui._generations and thread.is_alive():
+        time.sleep(0.01)
+    return thread, histories
+
+
+@pytest.mark.parametrize('words, drain_timeout_seconds, truncated', [(5, 5., False), (200, 0.2, True)])
+def test_drain_waits_for_running_answers_then_stops_them(chatbot, words, drain_timeout_seconds, truncated):
+    config = QueueConfig(generation_concurrency=1, bookkeeping_concurrency=4, max_size=0, max_threads=40,
+                         drain_timeout_seconds=drain_timeout_seconds, report_interval_seconds=0)
+    ui = UI(chatbot, {'openai', 'anthropic'}, port=0, queue_config=config)
+    thread, histories = _generate_in_background(ui, words, interval=0.02)
+    start = time.perf_counter()
+    ui._drain()
+    assert time.perf_counter() - start < drain_timeout_seconds + 1
+    thread.join(timeout=1)
+    assert not thread.is_alive()
+    assert ui._generations == 0
+    assert chatbot.messages[-1].truncated == truncated
+    if not truncated:
+        assert histories[-1][-1][1].startswith(' '.join(['word'] * words))
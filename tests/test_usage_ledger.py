@@ -0,0 +1,60 @@
+import json
+import pytest
+from datetime import date, datetime
+from eevee.messages import Usage
+from eevee.usage_ledger import UsageLedger, ModelPrice
+from eevee.storage_backends.filesystem_backend import FilesystemBackend
+from eevee.storage_backends.sqlite_backend import SQLiteBackend
+from eevee.storage_backends.write_behind_backend import WriteBehindBackend
+
+
+TODAY = datetime.now().strftime(UsageLedger.DATE_FORMAT)
+
+
+def test_cost_of_cached_tokens():
+    usage = Usage(prompt_tokens=1_000_000, completion_tokens=500_000, cached_tokens=400_000)
+    assert ModelPrice(input=3., output=15., cached_input=0.3).cost(usage) == pytest.approx(0.6 * 3 + 0.4 * 0.3 + 0.5 * 15)
+    # Without their own price, cached tokens cost as much as other input tokens
+    assert ModelPrice(input=3., output=15.).cost(usage) == pytest.approx(3 + 0.5 * 15)
+
+
+def test_cost_uses_the_configured_prices(tmp_path):
+    ledger = UsageLedger(FilesystemBackend(str(tmp_path)), 'session')
+    usage = Usage(prompt_tokens=1000, completion_tokens=1000, cached_tokens=1000)
+    assert ledger.cost('claude-3-haiku-20240307', usage) == pytest.approx((1000 * 0.03 + 1000 * 1.25) / 1_000_000)
+    assert ledger.cost('unknown-model', usage) == 0.
+
+
+def test_totals_by_model_day_and_session(tmp_path):
+    storage = FilesystemBackend(str(tmp_path))
+    # A record of an older version, a single one for its day
+    storage.write(UsageLedger.NAMESPACE, '2024-01-01', json.dumps({'old': {'gpt-4': Usage(prompt_tokens=100).as_dict()}}).encode())
+    ledger = UsageLedger(storage, 'session')
+    ledger.record('gpt-4', Usage(prompt_tokens=1000, completion_tokens=100))
+    ledger.record('gpt-4', Usage(prompt_tokens=2000, completion_tokens=200, cached_tokens=500))
+    ledger.record('claude-3-haiku-20240307', Usage(prompt_tokens=10, completion_tokens=1), session_id='other')
+
+    by_model = ledger.totals('model')
+    assert by_model['gpt-4'].usage == Usage(prompt_tokens=3100, completion_tokens=300, cached_tokens=500)
+    assert by_model['gpt-4'].cost == pytest.approx((3100 * 30 + 300 * 60) / 1_000_000)
+    assert list(ledger.totals('day')) == ['2024-01-01', TODAY]
+    assert ledger.totals('session')['other'].usage == Usage(prompt_tokens=10, completion_tokens=1)
+    assert list(ledger.totals('model', session_id='other')) == ['claude-3-haiku-20240307']
+    assert list(ledger.totals('day', since=date(2024, 1, 2))) == [TODAY]
+    assert list(ledger.totals('day', until=date(2024, 1, 1))) == ['2024-01-01']
+
+
+def test_processes_sharing_the_storage_keep_their_totals(tmp_path):
+    # Each process has its own connection to the database, and writes in the background
+    path = str(tmp_path / 'eevee.db')
+    storages = [WriteBehindBackend(SQLiteBackend(path), flush_interval_seconds=3600, max_pending=100) for _ in range(2)]
+    ledgers = [UsageLedger(storage, 'default') for storage in storages]
+    for _ in range(3):
+        for ledger in ledgers:
+            ledger.record('gpt-4', Usage(prompt_tokens=10, completion_tokens=1))
+    for storage in storages:
+        storage.flush()
+    totals = UsageLedger(SQLiteBackend(path), 'default').totals('session')
+    assert totals['default'].usage == Usage(prompt_tokens=60, completion_tokens=6)
+    for storage in storages:
+        storage.close()
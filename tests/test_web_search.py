@@ -0,0 +1,55 @@
+import time
+from eevee.web_search import SearchAggregator, SearchResult, normalize_url
+
+
+def _backend(delay, urls, error=None):
+    def search(query, max_results):
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        return [SearchResult(title=url, url=url, description='') for url in urls]
+    return search
+
+
+def _aggregator(grace_seconds=0.05, timeout_seconds=2, **backends):
+    aggregator = SearchAggregator(backends)
+    aggregator.grace_seconds = grace_seconds
+    aggregator.timeouts = {name: timeout_seconds for name in backends}
+    return aggregator
+
+
+def _urls(results):
+    return [r.url for r in results]
+
+
+def test_slow_backends_only_get_the_grace_period():
+    aggregator = _aggregator(fast=_backend(0, ['https://a.com']), slow=_backend(1, ['https://b.com']))
+    start = time.perf_counter()
+    assert _urls(aggregator.search('query', 5)) == ['https://a.com']
+    assert time.perf_counter() - start < 0.5
+
+
+def test_empty_results_dont_start_the_grace_period():
+    aggregator = _aggregator(empty=_backend(0, []), slow=_backend(0.3, ['https://b.com']))
+    assert _urls(aggregator.search('query', 5)) == ['https://b.com']
+
+
+def test_failures_dont_start_the_grace_period():
+    aggregator = _aggregator(failing=_backend(0, [], ConnectionError('blocked')), slow=_backend(0.3, ['https://b.com']))
+    assert _urls(aggregator.search('query', 5)) == ['https://b.com']
+
+
+def test_backends_past_their_deadline_are_dropped():
+    aggregator = _aggregator(timeout_seconds=0.1, empty=_backend(0, []), slow=_backend(1, ['https://b.com']))
+    start = time.perf_counter()
+    assert aggregator.search('query', 5) == []
+    assert time.perf_counter() - start < 0.5
+
+
+def test_results_are_merged_by_normalized_url():
+    merged = SearchAggregator.merge({
+        'one': [SearchResult('A', 'https://www.a.com/page/', ''), SearchResult('B', 'https://b.com', '')],
+        'two': [SearchResult('B', 'http://b.com/?utm_source=x', 'Longer description'), SearchResult('C', 'https://c.com', '')],
+    })
+    assert [normalize_url(r.url) for r in merged] == ['//b.com', '//a.com/page', '//c.com']
+    assert merged[0].description == 'Longer description'
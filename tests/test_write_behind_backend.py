@@ -0,0 +1,117 @@
+import threading
+import pytest
+from typing import List, Tuple, Callable
+from eevee.storage_backends.filesystem_backend import FilesystemBackend
+from eevee.storage_backends.write_behind_backend import WriteBehindBackend
+
+
+class RecordingBackend(FilesystemBackend):
+    """
+    Records the writes and deletes reaching the filesystem, and can fail them or run a hook while writing
+    """
+    def __init__(self, directory: str) -> None:
+        super().__init__(directory)
+        self.operations: List[Tuple[str, str]] = list()
+        self.failing: bool = False
+        self.on_write: Callable[[], None] | None = None
+
+    def write(self, namespace: str, key: str, data: bytes) -> None:
+        if self.failing:
+            raise OSError('disk full')
+        if self.on_write is not None:
+            self.on_write()
+        self.operations.append(('write', key))
+        super().write(namespace, key, data)
+
+    def delete(self, namespace: str, key: str) -> None:
+        self.operations.append(('delete', key))
+        super().delete(namespace, key)
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return RecordingBackend(str(tmp_path))
+
+
+@pytest.fixture
+def storage(backend):
+    # Flushed only when the tests do it
+    storage = WriteBehindBackend(backend, flush_interval_seconds=3600, max_pending=100)
+    yield storage
+    storage.close()
+
+
+def test_pending_writes_are_read_back(storage, backend):
+    storage.write('chats', 'a', b'0123456789')
+    assert backend.operations == []
+    assert storage.read('chats', 'a') == b'0123456789'
+    assert storage.read_range('chats', 'a', 2, 5) == b'234'
+    assert storage.exists('chats', 'a')
+    assert storage.list_keys('chats') == ['a']
+    storage.flush()
+    assert backend.read('chats', 'a') == b'0123456789'
+
+
+def test_writes_of_the_same_key_are_coalesced(storage, backend):
+    for i in range(50):
+        storage.write('chats', 'a', str(i).encode())
+    storage.flush()
+    assert backend.operations == [('write', 'a')]
+    assert backend.read('chats', 'a') == b'49'
+
+
+def test_pending_deletes_hide_the_key(storage, backend):
+    backend.write('chats', 'a', b'saved')
+    storage.delete('chats', 'a')
+    assert storage.read('chats', 'a') is None
+    assert storage.read_range('chats', 'a', 0, 2) is None
+    assert not storage.exists('chats', 'a')
+    assert storage.list_keys('chats') == []
+    storage.flush()
+    assert not backend.exists('chats', 'a')
+
+
+def test_writes_flush_once_too_many_are_pending(backend):
+    storage = WriteBehindBackend(backend, flush_interval_seconds=3600, max_pending=3)
+    for key in 'abc':
+        storage.write('chats', key, b'data')
+    assert backend.operations == []
+    storage.write('chats', 'd', b'data')
+    assert sorted(backend.operations) == [('write', key) for key in 'abcd']
+    storage.close()
+
+
+def test_failed_writes_are_retried(storage, backend):
+    backend.failing = True
+    storage.write('chats', 'a', b'data')
+    storage.flush()
+    assert storage.read('chats', 'a') == b'data'
+    backend.failing = False
+    storage.flush()
+    assert backend.read('chats', 'a') == b'data'
+
+
+def test_writes_made_during_a_flush_are_kept(storage, backend):
+    storage.write('chats', 'a', b'old')
+
+    def write_again() -> None:
+        backend.on_write = None
+        storage.write('chats', 'a', b'new')
+    backend.on_write = write_again
+    storage.flush()
+    assert backend.read('chats', 'a') == b'old'
+    assert storage.read('chats', 'a') == b'new'
+    storage.flush()
+    assert backend.read('chats', 'a') == b'new'
+
+
+def test_background_thread_and_close_flush(backend):
+    storage = WriteBehindBackend(backend, flush_interval_seconds=0.05, max_pending=100)
+    flushed = threading.Event()
+    backend.on_write = flushed.set
+    storage.write('chats', 'a', b'data')
+    assert flushed.wait(5)
+    backend.on_write = None
+    storage.write('chats', 'b', b'data')
+    storage.close()
+    assert backend.read('chats', 'b') == b'data'